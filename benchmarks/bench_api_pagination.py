@@ -0,0 +1,111 @@
+"""
+Benchmark: page latency of /telegram_messages at increasing depth.
+
+Seeds a SQLite database with synthetic messages, then compares OFFSET paging
+(the previous implementation) with the keyset cursor used by the API. Keyset
+pages should cost about the same at any depth; OFFSET pages grow linearly.
+
+Usage:
+    python benchmarks/bench_api_pagination.py --rows 1000000 --limit 100
+"""
+import argparse
+import os
+import sys
+import tempfile
+import time
+from datetime import datetime, timedelta
+
+DB_FILE = os.path.join(tempfile.gettempdir(), "bench_api_pagination.sqlite")
+os.environ["DATABASE_URL"] = f"sqlite:///{DB_FILE}"
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), "..", "my_project")))
+
+from fastapi.testclient import TestClient
+from sqlalchemy import create_engine, func
+from sqlalchemy.orm import sessionmaker
+
+from database import Base
+from models import TelegramMessage
+from main import app
+
+# The API runs on the async engine; seeding and the OFFSET baseline use a sync one
+engine = create_engine(os.environ["DATABASE_URL"])
+SessionLocal = sessionmaker(bind=engine)
+
+CHANNELS = ["@CheMed123", "@lobelia4cosmetics", "@tikvahpharma", "@DoctorsET", "@EAHCI"]
+
+
+def seed(rows, batch_size=50000):
+    """ Fill telegram_messages with `rows` synthetic messages unless it already holds them. """
+    Base.metadata.create_all(bind=engine)
+    with SessionLocal() as db:
+        if db.query(func.count(TelegramMessage.id)).scalar() == rows:
+            return
+        db.query(TelegramMessage).delete()
+        db.commit()
+    start_date = datetime(2023, 1, 1)
+    with engine.begin() as connection:
+        for start in range(0, rows, batch_size):
+            connection.execute(TelegramMessage.__table__.insert(), [
+                {
+                    "channel_title": f"{CHANNELS[i % len(CHANNELS)].lstrip('@')} channel",
+                    "channel_username": CHANNELS[i % len(CHANNELS)],
+                    "message_id": i,
+                    "message": f"Message {i}",
+                    "message_date": start_date + timedelta(minutes=i),
+                    "media_path": None,
+                    "emoji_used": "No emoji",
+                    "youtube_links": None,
+                }
+                for i in range(start, min(start + batch_size, rows))
+            ])
+
+
+def offset_page(skip, limit, channel_username=None):
+    with SessionLocal() as db:
+        query = db.query(TelegramMessage)
+        if channel_username:
+            query = query.filter(TelegramMessage.channel_username == channel_username)
+        return query.order_by(TelegramMessage.id).offset(skip).limit(limit).all()
+
+
+def timed(func, *args, repeat=5):
+    best = float("inf")
+    for _ in range(repeat):
+        start = time.perf_counter()
+        func(*args)
+        best = min(best, time.perf_counter() - start)
+    return best
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--rows", type=int, default=1000000)
+    parser.add_argument("--limit", type=int, default=100)
+    parser.add_argument("--channel", default=None, help="Also filter pages by this channel_username.")
+    args = parser.parse_args()
+
+    seed(args.rows)
+    client = TestClient(app)
+
+    params = {"limit": args.limit}
+    if args.channel:
+        params["channel_username"] = args.channel
+
+    depths = [d for d in (0, 1000, 10000, 100000, 500000, args.rows - args.limit) if 0 <= d < args.rows]
+    print(f"rows: {args.rows}  limit: {args.limit}  channel: {args.channel or '-'}")
+    print(f"{'depth':>10} {'offset ms':>10} {'keyset ms':>10}")
+    for depth in depths:
+        # The cursor for a page is the id of the last row before it
+        cursor_params = dict(params, cursor=depth) if depth else params
+
+        def keyset_page():
+            response = client.get("/telegram_messages", params=cursor_params)
+            response.raise_for_status()
+
+        offset_seconds = timed(offset_page, depth, args.limit, args.channel)
+        keyset_seconds = timed(keyset_page)
+        print(f"{depth:>10} {offset_seconds * 1000:>10.2f} {keyset_seconds * 1000:>10.2f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,120 @@
+"""
+Benchmark: near-duplicate tagging with NearDuplicateIndex.
+
+Builds a deterministic corpus of adverts where a share of the rows are
+reposts of earlier adverts with small edits (price, a dropped or added word,
+punctuation, Amharic homophone spellings), then measures:
+  - a full run over every row,
+  - an incremental run that reloads the saved index and tags 10% new rows,
+  - how many reposts landed in their original's cluster and how many
+    distinct originals were merged together.
+
+Usage:
+    python benchmarks/bench_near_duplicates.py --rows 1000000
+"""
+import argparse
+import os
+import random
+import sys
+import tempfile
+import time
+
+import numpy as np
+import pandas as pd
+
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), "..")))
+
+from scripts.near_duplicates import NearDuplicateIndex
+
+PRODUCTS = [
+    "Paracetamol", "Amoxicillin", "Ibuprofen", "Vitamin C", "Omeprazole", "Metformin", "Cetirizine",
+    "Azithromycin", "Zinc", "ORS", "Salbutamol", "Diclofenac", "Folic acid", "Ciprofloxacin",
+    "ፓራሲታሞል", "ቫይታሚን", "ክሬም", "ሳሙና", "ሽሮፕ",
+]
+WORDS = [
+    "tablets", "capsules", "syrup", "available", "price", "call", "delivery", "Addis", "Ababa", "stock",
+    "original", "imported", "discount", "pharmacy", "new", "pack", "bottle", "order", "today", "free",
+    "መድሃኒት", "ዋጋ", "ይደውሉ", "አዲስ", "አበባ", "ቅናሽ", "ፋርማሲ", "ጸሀይ", "ሀኪም", "ሰላም",
+]
+EDITS = [
+    lambda text, rng: text.replace(text.split()[-1], str(rng.randint(10, 999))),
+    lambda text, rng: " ".join(word for i, word in enumerate(text.split()) if i != rng.randrange(len(text.split()))),
+    lambda text, rng: text + " " + rng.choice(WORDS),
+    lambda text, rng: text + "።",
+    lambda text, rng: text.replace("ጸ", "ፀ").replace("ሀ", "ሐ"),
+    lambda text, rng: text.upper(),
+]
+
+
+def make_messages(rows, repost_share=0.4, seed=42):
+    """ Build (message_ids, messages, original_ids): original_ids[i] is the advert row i was reposted from. """
+    rng = random.Random(seed)
+    messages, originals = [], []
+    for row in range(rows):
+        if originals and rng.random() < repost_share:
+            source = originals[rng.randrange(len(originals))]
+            text = messages[source]
+            for edit in rng.sample(EDITS, rng.randint(1, 2)):
+                text = edit(text, rng)
+            messages.append(text)
+            originals.append(originals[source])
+        else:
+            words = [rng.choice(PRODUCTS), f"{rng.choice([100, 250, 500])}mg"]
+            words += [rng.choice(WORDS) for _ in range(rng.randint(8, 30))]
+            words.append(str(rng.randint(10, 999)))
+            messages.append(" ".join(words))
+            originals.append(row)
+    message_ids = np.arange(1, rows + 1) * 7
+    return message_ids, messages, np.asarray(originals) * 7 + 7
+
+
+def quality(original_ids, canonical_ids):
+    """ Share of reposts whose canonical is their original, and originals wrongly merged with another. """
+    canonical_ids = np.asarray(canonical_ids, dtype=np.int64)
+    reposts = original_ids != np.arange(1, len(original_ids) + 1) * 7
+    found = (canonical_ids[reposts] == original_ids[reposts]).mean() if reposts.any() else 1.0
+    originals_per_cluster = pd.Series(original_ids).groupby(canonical_ids).nunique()
+    merged = int((originals_per_cluster - 1).sum())
+    return found, merged
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--rows", type=int, default=1000000)
+    parser.add_argument("--batch-size", type=int, default=100000)
+    args = parser.parse_args()
+
+    message_ids, messages, original_ids = make_messages(args.rows)
+    split = int(args.rows * 0.9)
+
+    index = NearDuplicateIndex()
+    start = time.perf_counter()
+    _, canonical_ids = index.assign(message_ids[:split], messages[:split], batch_size=args.batch_size)
+    full_seconds = time.perf_counter() - start
+
+    with tempfile.TemporaryDirectory() as directory:
+        path = os.path.join(directory, "near_duplicates.npz")
+        start = time.perf_counter()
+        index.save(path)
+        index = NearDuplicateIndex.load(path)
+        reload_seconds = time.perf_counter() - start
+        size = os.path.getsize(path)
+
+    # The incremental run gets every row again; only the new 10% are hashed
+    start = time.perf_counter()
+    _, canonical_ids = index.assign(message_ids, messages, batch_size=args.batch_size)
+    incremental_seconds = time.perf_counter() - start
+
+    found, merged = quality(original_ids, canonical_ids)
+    clusters = len(np.unique(np.asarray(canonical_ids, dtype=np.int64)))
+    print(f"rows:                 {args.rows}")
+    print(f"full run ({split} rows): {full_seconds:.2f}s ({split / full_seconds:,.0f} rows/s)")
+    print(f"save + load index:    {reload_seconds:.2f}s ({size / 2 ** 20:.1f} MiB)")
+    print(f"incremental run:      {incremental_seconds:.2f}s ({args.rows - split} new of {args.rows} rows)")
+    print(f"clusters:             {clusters}")
+    print(f"reposts found:        {found:.2%}")
+    print(f"originals merged:     {merged}")
+
+
+if __name__ == "__main__":
+    main()
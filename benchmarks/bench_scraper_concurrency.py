@@ -0,0 +1,73 @@
+"""
+Throughput of TelegramScraper.run against the in-process FakeTelegramClient.
+
+Runs the same synthetic channels at several concurrency limits and reports
+wall time and messages/second. No network access or credentials are needed.
+
+Usage:
+    python benchmarks/bench_scraper_concurrency.py --channels 5 --messages 100 --latency 0.05
+"""
+import argparse
+import asyncio
+import csv
+import json
+import os
+import sys
+import tempfile
+import time
+
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), "..")))
+
+from scripts.fake_telegram_client import FakeTelegramClient
+from scripts.telegram_scraper import TelegramScraper
+
+
+def run_once(channels, messages, latency, concurrency, media_workers=4, media_size=50_000):
+    """ Scrape fresh synthetic channels once; return (seconds, rows written, requests). """
+    with tempfile.TemporaryDirectory() as workdir:
+        usernames = [f"@channel{i}" for i in range(channels)]
+        channels_file = os.path.join(workdir, "channels.json")
+        with open(channels_file, "w") as f:
+            json.dump({"channels": usernames}, f)
+
+        client = FakeTelegramClient(
+            {name: messages for name in usernames}, latency=latency, media_size=media_size
+        )
+        scraper = TelegramScraper(
+            raw_data_dir=os.path.join(workdir, "raw"),
+            log_dir=os.path.join(workdir, "logs"),
+            channels_file=channels_file,
+            concurrency=concurrency,
+            client=client,
+            media_workers=media_workers,
+        )
+
+        start = time.perf_counter()
+        asyncio.run(scraper.run())
+        elapsed = time.perf_counter() - start
+
+        with open(os.path.join(workdir, "raw", "scraped_data.csv"), newline="", encoding="utf-8") as f:
+            rows = sum(1 for _ in csv.reader(f)) - 1
+        return elapsed, rows, client.requests
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--channels", type=int, default=5)
+    parser.add_argument("--messages", type=int, default=100, help="Messages per channel.")
+    parser.add_argument("--latency", type=float, default=0.05, help="Simulated seconds per round trip.")
+    parser.add_argument("--concurrency", type=int, nargs="+", default=[1, 2, 5])
+    parser.add_argument("--media-workers", type=int, default=4)
+    parser.add_argument("--media-size", type=int, default=50_000, help="Bytes per synthetic photo.")
+    args = parser.parse_args()
+
+    print(f"{'concurrency':>11} {'seconds':>8} {'rows':>6} {'requests':>8} {'msgs/s':>8}")
+    for concurrency in args.concurrency:
+        elapsed, rows, requests = run_once(
+            args.channels, args.messages, args.latency, concurrency, args.media_workers, args.media_size
+        )
+        print(f"{concurrency:>11} {elapsed:>8.2f} {rows:>6} {requests:>8} {rows / elapsed:>8.0f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,86 @@
+"""
+Micro-benchmark: legacy per-character emoji handling vs. TextNormalizer.
+
+Usage:
+    python benchmarks/bench_text_normalization.py --rows 100000
+"""
+import argparse
+import os
+import random
+import re
+import sys
+import time
+
+import emoji
+import pandas as pd
+
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), "..")))
+
+from scripts.text_normalizer import TextNormalizer
+
+WORDS = [
+    "Paracetamol", "500mg", "tablets", "available", "price", "call", "delivery", "Addis", "Ababa",
+    "መድሃኒት", "ዋጋ", "ይደውሉ", "አዲስ", "አበባ", "ቫይታሚን", "ክሬም",
+]
+EMOJIS = ["💊", "✅", "📞", "🔥", "❤️", "👍🏽", "🇪🇹", "👩‍⚕️"]
+
+
+def make_messages(rows, seed=42):
+    """ Build a deterministic Series of mixed Amharic/English/emoji messages. """
+    rng = random.Random(seed)
+    messages = []
+    for _ in range(rows):
+        tokens = [rng.choice(WORDS) for _ in range(rng.randint(5, 40))]
+        for _ in range(rng.randint(0, 4)):
+            tokens.insert(rng.randrange(len(tokens) + 1), rng.choice(EMOJIS))
+        text = " ".join(tokens)
+        if rng.random() < 0.3:
+            text = text.replace(" ", "\n", 2)
+        messages.append(None if rng.random() < 0.05 else text)
+    return pd.Series(messages, dtype=object)
+
+
+def legacy_normalize(messages):
+    """ The three-pass, per-character implementation previously used by DataCleaner. """
+    def clean_text(text):
+        return re.sub(r'\n+', ' ', text).strip()
+
+    def extract_emojis(text):
+        emojis = ''.join(c for c in text if c in emoji.EMOJI_DATA)
+        return emojis if emojis else "No emoji"
+
+    def remove_emojis(text):
+        return ''.join(c for c in text if c not in emoji.EMOJI_DATA)
+
+    messages = messages.fillna("No Message").apply(clean_text)
+    emojis = messages.apply(extract_emojis)
+    return messages.apply(remove_emojis), emojis
+
+
+def timed(func, *args):
+    start = time.perf_counter()
+    result = func(*args)
+    return result, time.perf_counter() - start
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--rows", type=int, default=100000)
+    args = parser.parse_args()
+
+    messages = make_messages(args.rows)
+    normalizer = TextNormalizer()
+
+    (legacy_text, _), legacy_seconds = timed(legacy_normalize, messages)
+    (new_text, _), new_seconds = timed(normalizer.normalize, messages)
+
+    print(f"rows:              {args.rows}")
+    print(f"legacy (3 passes): {legacy_seconds:.3f}s ({args.rows / legacy_seconds:,.0f} rows/s)")
+    print(f"TextNormalizer:    {new_seconds:.3f}s ({args.rows / new_seconds:,.0f} rows/s)")
+    print(f"speedup:           {legacy_seconds / new_seconds:.1f}x")
+    # Rows differ only where the legacy per-character check split multi-codepoint emojis
+    print(f"rows that differ:  {(legacy_text != new_text).sum()}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,246 @@
+"""
+Compare the object detection engines of scripts/model_manager.py: eager
+PyTorch, TorchScript, ONNX Runtime, and ONNX Runtime with dynamic int8
+quantization.
+
+Exports are made first (export_seconds). Each engine then runs in a fresh
+process, which reports:
+  startup_seconds      importing torch and loading the engine, as a worker does
+  first_batch_seconds  the first batch, including lazy initialisation
+  images_per_second    batched throughput after that
+Detections of every engine are matched against the eager ones (same class,
+IoU >= --match-iou). match_rate is 2 * matched / (eager boxes + engine boxes),
+so missing and extra boxes both count. An engine below --min-match fails the
+check, and the exit status is 1. When eager finds no boxes at all there is
+nothing to compare, so match_rate is left undefined (null) and the run fails
+too: pass --image-dir with images the model detects objects in.
+
+The model comes from the local cache, so nothing is downloaded. Results are
+written as JSON; compare two runs with benchmarks/compare_results.py.
+
+Usage:
+    python benchmarks/compare_engines.py --model yolov5s --images 64 --threads 4
+    python benchmarks/compare_engines.py --model path/to/best.pt --image-dir data/raw/photos
+"""
+import argparse
+import json
+import multiprocessing
+import os
+import sys
+import tempfile
+import time
+from concurrent.futures import ProcessPoolExecutor
+from datetime import datetime, timezone
+
+import numpy as np
+
+ROOT = os.path.abspath(os.path.join(os.path.dirname(__file__), ".."))
+sys.path.append(ROOT)
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+
+from run_suite import git_state, machine_info
+from synthetic import generate_images
+
+ENGINES = ["eager", "torchscript", "onnx", "onnx-int8"]
+
+
+def run_engine(engine, options):
+    """ Child process entry point: load one engine, time it and return its detections per image. """
+    start = time.perf_counter()
+    from scripts.model_manager import ModelManager
+
+    model = ModelManager(options["cache_dir"]).load(
+        options["model"], options["version"], engine, options["threads"], options["inter_op_threads"]
+    )
+    startup = time.perf_counter() - start
+
+    from scripts.object_detection import YOLOObjectDetection
+
+    images = [YOLOObjectDetection.load_image(path, options["img_size"]) for path in options["images"]]
+    batches = [images[i:i + options["batch_size"]] for i in range(0, len(images), options["batch_size"])]
+
+    start = time.perf_counter()
+    model([array for array, _ in batches[0]], size=options["img_size"])
+    first_batch = time.perf_counter() - start
+
+    detections = []
+    start = time.perf_counter()
+    for repeat in range(options["repeats"]):
+        for batch in batches:
+            found = model([array for array, _ in batch], size=options["img_size"])
+            if repeat == 0:
+                for (_, scale), boxes in zip(batch, found.xyxy):
+                    boxes = boxes.cpu().numpy().astype(np.float64)
+                    boxes[:, :4] /= scale
+                    detections.append(boxes.tolist())
+    seconds = time.perf_counter() - start
+    return {
+        "status": "ok",
+        "images": len(images),
+        "startup_seconds": round(startup, 3),
+        "first_batch_seconds": round(first_batch, 3),
+        "images_per_second": round(len(images) * options["repeats"] / seconds, 2),
+        "detections": detections,
+    }
+
+
+def box_iou(a, b):
+    """ IoU of every box in a (n, 4) against every box in b (m, 4), xyxy. """
+    top_left = np.maximum(a[:, None, :2], b[None, :, :2])
+    bottom_right = np.minimum(a[:, None, 2:4], b[None, :, 2:4])
+    intersection = np.prod(np.clip(bottom_right - top_left, 0, None), axis=2)
+    area_a = np.prod(a[:, 2:4] - a[:, :2], axis=1)
+    area_b = np.prod(b[:, 2:4] - b[:, :2], axis=1)
+    return intersection / (area_a[:, None] + area_b[None, :] - intersection + 1e-9)
+
+
+def match_detections(reference, candidate, iou_threshold):
+    """
+    Greedily match boxes of the same class, most confident first. Returns
+    (matched, reference boxes, candidate boxes, largest confidence difference).
+    """
+    matched = total_reference = total_candidate = 0
+    confidence_delta = 0.0
+    for expected, found in zip(reference, candidate):
+        expected, found = np.asarray(expected).reshape(-1, 6), np.asarray(found).reshape(-1, 6)
+        total_reference += len(expected)
+        total_candidate += len(found)
+        if not len(expected) or not len(found):
+            continue
+        iou = box_iou(expected, found)
+        iou[expected[:, None, 5] != found[None, :, 5]] = 0.0
+        used = set()
+        for i in np.argsort(-expected[:, 4]):
+            for j in np.argsort(-iou[i]):
+                if iou[i, j] < iou_threshold:
+                    break
+                if j not in used:
+                    used.add(j)
+                    matched += 1
+                    confidence_delta = max(confidence_delta, abs(expected[i, 4] - found[j, 4]))
+                    break
+    return matched, total_reference, total_candidate, confidence_delta
+
+
+def print_results(results):
+    print(f"{'engine':<11} {'status':<10} {'export s':>9} {'startup s':>10} {'1st batch s':>12} "
+          f"{'images/s':>9} {'speedup':>8} {'match':>7}  notes")
+    eager = results.get("eager", {}).get("images_per_second")
+    for engine, result in results.items():
+        if "startup_seconds" not in result:
+            print(f"{engine:<11} {result['status']:<10} {result.get('error')}")
+            continue
+        speedup = f"{result['images_per_second'] / eager:.2f}x" if eager else ""
+        match = "" if "match_rate" not in result else "n/a" if result["match_rate"] is None else f"{result['match_rate']:.3f}"
+        notes = result["reason"] if result["status"] == "unverified" else ("" if "match_rate" not in result else (
+            f"{result['matched']}/{result['eager_boxes']} eager boxes matched, {result['boxes']} found, "
+            f"max confidence delta {result['max_confidence_delta']}"
+        ))
+        print(f"{engine:<11} {result['status']:<10} {result.get('export_seconds', ''):>9} {result['startup_seconds']:>10} "
+              f"{result['first_batch_seconds']:>12} {result['images_per_second']:>9} {speedup:>8} {match:>7}  {notes}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--engines", nargs="+", choices=ENGINES, default=ENGINES)
+    parser.add_argument("--model", default="yolov5s", help="Cached model name or a weights file.")
+    parser.add_argument("--version", default=None, help="Cached version (default: the current one).")
+    parser.add_argument("--cache-dir", default=os.getenv("MODEL_CACHE", os.path.join(ROOT, "data", "models")))
+    parser.add_argument("--image-dir", help="Images to detect on (default: synthetic images).")
+    parser.add_argument("--images", type=int, default=64, help="Number of images.")
+    parser.add_argument("--seed", type=int, default=42)
+    parser.add_argument("--batch-size", type=int, default=16)
+    parser.add_argument("--img-size", type=int, default=640)
+    parser.add_argument("--repeats", type=int, default=3, help="Timed passes over the images.")
+    parser.add_argument("--threads", type=int, default=None, help="Intra-op threads (default: one per core).")
+    parser.add_argument("--inter-op-threads", type=int, default=None)
+    parser.add_argument("--match-iou", type=float, default=0.5)
+    parser.add_argument("--min-match", type=float, default=0.95, help="Required match rate against eager.")
+    parser.add_argument("--output", help="JSON results file (default: benchmarks/results/engines-<commit>.json).")
+    args = parser.parse_args()
+
+    if args.image_dir:
+        names = sorted(name for name in os.listdir(args.image_dir) if name.lower().endswith((".jpg", ".jpeg")))
+        images = [os.path.abspath(os.path.join(args.image_dir, name)) for name in names[:args.images]]
+    else:
+        image_dir = os.path.join(tempfile.gettempdir(), "ethio_bench_engines")
+        names = [f"image_{index}.jpg" for index in range(args.images)]
+        generate_images(image_dir, names, seed=args.seed)
+        images = [os.path.join(image_dir, name) for name in names]
+    if os.path.isfile(args.model):
+        args.model = os.path.abspath(args.model)
+
+    options = {key: value for key, value in vars(args).items() if key not in ("engines", "output", "image_dir")}
+    options["images"] = images
+
+    from scripts.model_manager import ModelManager
+
+    manager = ModelManager(args.cache_dir)
+    options["model"], options["version"] = manager.resolve(args.model, args.version)
+    engines = ["eager"] + [engine for engine in args.engines if engine != "eager"]
+    export_seconds = {}
+    for engine in engines[1:]:
+        start = time.perf_counter()
+        manager.export(options["model"], options["version"], engine, args.img_size)
+        export_seconds[engine] = round(time.perf_counter() - start, 3)
+
+    results = {}
+    for engine in engines:
+        print(f"running {engine}...", flush=True)
+        # A fresh process per engine, so startup includes imports and nothing is shared
+        with ProcessPoolExecutor(max_workers=1, mp_context=multiprocessing.get_context("spawn")) as pool:
+            try:
+                results[engine] = pool.submit(run_engine, engine, options).result()
+            except Exception as e:
+                results[engine] = {"status": "failed", "error": repr(e)}
+        if engine in export_seconds:
+            results[engine]["export_seconds"] = export_seconds[engine]
+
+    reference = results["eager"].get("detections")
+    for engine, result in results.items():
+        if result["status"] != "ok" or reference is None:
+            continue
+        matched, total_reference, total_candidate, delta = match_detections(
+            reference, result["detections"], args.match_iou
+        )
+        result.update({
+            "matched": matched,
+            "eager_boxes": total_reference,
+            "boxes": total_candidate,
+            "match_rate": round(2 * matched / (total_reference + total_candidate), 4) if total_reference else None,
+            "max_confidence_delta": round(float(delta), 4),
+        })
+        if result["match_rate"] is None:
+            # Any engine would match an empty reference perfectly, a broken export included
+            result["status"] = "unverified"
+            result["reason"] = "eager found no boxes to compare against; use --image-dir with images that have detections"
+        elif result["match_rate"] < args.min_match:
+            result["status"] = "mismatch"
+            result["reason"] = f"match rate {result['match_rate']} below {args.min_match}"
+    for result in results.values():
+        result.pop("detections", None)
+
+    commit, dirty = git_state()
+    report = {
+        "suite": "engines",
+        "created_at": datetime.now(timezone.utc).isoformat(timespec="seconds"),
+        "commit": commit,
+        "dirty": dirty,
+        "machine": machine_info(),
+        "settings": {key: value for key, value in options.items() if key != "images"} | {"images": len(images)},
+        "stages": results,
+    }
+    output = args.output or os.path.join(
+        ROOT, "benchmarks", "results", f"engines-{(commit or 'unknown')[:12]}{'-dirty' if dirty else ''}.json"
+    )
+    os.makedirs(os.path.dirname(os.path.abspath(output)), exist_ok=True)
+    with open(output, "w") as f:
+        json.dump(report, f, indent=2)
+
+    print_results(results)
+    print(f"results written to {output}")
+    sys.exit(0 if all(result["status"] == "ok" for result in results.values()) else 1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,93 @@
+"""
+Compare two benchmark result files from benchmarks/run_suite.py.
+
+Metrics ending in _per_second are better when higher; seconds, *_ms and
+*_mb are better when lower; anything else is shown without a verdict.
+A change worse than --tolerance is a regression and makes the exit status 1,
+so the script can gate a CI job.
+
+Usage:
+    python benchmarks/compare_results.py BASE.json HEAD.json [--tolerance 0.10]
+"""
+import argparse
+import json
+import sys
+
+SETTINGS_THAT_MATTER = ["rows", "seed", "duplicate_rate", "repost_rate", "media_rate", "images", "chunksize",
+                        "scrape_rows", "scrape_latency", "insert_rows", "api_rows", "api_requests",
+                        "api_concurrency", "api_cache", "detect_engine"]
+
+
+def direction(metric):
+    """ +1 when higher is better, -1 when lower is better, 0 when there is no verdict. """
+    if metric.endswith("_per_second"):
+        return 1
+    if metric.endswith(("_ms", "_mb", "seconds")):
+        return -1
+    return 0
+
+
+def compare(base, head, tolerance):
+    """ Returns a list of (stage, metric, base, head, change, verdict) rows. """
+    rows = []
+    for stage, head_result in head["stages"].items():
+        base_result = base["stages"].get(stage)
+        if not base_result or base_result.get("status") != "ok" or head_result.get("status") != "ok":
+            status = f"{(base_result or {}).get('status', 'missing')} -> {head_result.get('status')}"
+            rows.append((stage, "status", None, None, None, status))
+            continue
+        for metric, head_value in head_result.items():
+            base_value = base_result.get(metric)
+            if not isinstance(head_value, (int, float)) or not isinstance(base_value, (int, float)):
+                continue
+            better = direction(metric)
+            change = (head_value - base_value) / base_value if base_value else 0.0
+            if not better:
+                verdict = ""
+            elif change * better < -tolerance:
+                verdict = "REGRESSION"
+            elif change * better > tolerance:
+                verdict = "improved"
+            else:
+                verdict = "ok"
+            rows.append((stage, metric, base_value, head_value, change, verdict))
+    return rows
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("base")
+    parser.add_argument("head")
+    parser.add_argument("--tolerance", type=float, default=0.10, help="Allowed relative change (0.10 = 10%%).")
+    args = parser.parse_args()
+
+    with open(args.base) as f:
+        base = json.load(f)
+    with open(args.head) as f:
+        head = json.load(f)
+
+    print(f"base {base.get('commit')}{' (dirty)' if base.get('dirty') else ''}  "
+          f"head {head.get('commit')}{' (dirty)' if head.get('dirty') else ''}")
+    for key in SETTINGS_THAT_MATTER:
+        if base["settings"].get(key) != head["settings"].get(key):
+            print(f"⚠️ settings differ: {key} {base['settings'].get(key)} -> {head['settings'].get(key)}")
+    if base.get("machine") != head.get("machine"):
+        print("⚠️ results come from different machines; timings are not comparable")
+
+    rows = compare(base, head, args.tolerance)
+    print(f"{'stage':<10} {'metric':<40} {'base':>12} {'head':>12} {'change':>8}  verdict")
+    for stage, metric, base_value, head_value, change, verdict in rows:
+        if change is None:
+            print(f"{stage:<10} {metric:<40} {'':>12} {'':>12} {'':>8}  {verdict}")
+        else:
+            print(f"{stage:<10} {metric:<40} {base_value:>12,} {head_value:>12,} {change:>+8.1%}  {verdict}")
+
+    regressions = [row for row in rows if row[5] == "REGRESSION"]
+    if regressions:
+        print(f"❌ {len(regressions)} regression(s) beyond {args.tolerance:.0%}")
+        sys.exit(1)
+    print(f"✅ no regressions beyond {args.tolerance:.0%}")
+
+
+if __name__ == "__main__":
+    main()
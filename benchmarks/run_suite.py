@@ -0,0 +1,454 @@
+"""
+Benchmark suite: every pipeline stage on deterministic synthetic data.
+
+Stages, each run in a fresh process so the peak RSS reported is its own:
+  generate  synthetic scraped_data.csv and images (benchmarks/synthetic.py)
+  scrape    TelegramScraper against FakeTelegramClient, no network
+  clean     DataCleaner, streaming, over the synthetic CSV
+  load      DatabaseManager.bulk_insert_data of the cleaned rows
+  insert    DatabaseManager.insert_data, row by row, on a sample
+  detect    YOLOObjectDetection.run_detection and run_batched_detection
+  api       p50/p99 latency of my_project endpoints against a SQLite stand-in
+
+load and insert need a scratch PostgreSQL database (--scratch-database-url or
+BENCH_DATABASE_URL); its public schema is DROPPED before each of them. They
+are skipped without one, and detect is skipped when the YOLOv5 weights are not
+in the local model cache (scripts/model_manager.py).
+
+Generated data is kept in --data-dir and reused while the generator settings
+match. Results are printed and written as JSON with the commit, machine and
+settings; compare two runs with benchmarks/compare_results.py.
+
+Usage:
+    python benchmarks/run_suite.py --rows 1000000
+    python benchmarks/run_suite.py --rows 20000000 --stages clean load --scratch-database-url postgresql://...
+    python benchmarks/compare_results.py benchmarks/results/<base>.json benchmarks/results/<head>.json
+"""
+import argparse
+import asyncio
+import json
+import multiprocessing
+import os
+import platform
+import random
+import resource
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+from concurrent.futures import ProcessPoolExecutor
+from datetime import datetime, timezone
+
+import numpy as np
+import pandas as pd
+
+ROOT = os.path.abspath(os.path.join(os.path.dirname(__file__), ".."))
+sys.path.append(ROOT)
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+
+from synthetic import CHANNELS, ENGLISH_WORDS, AMHARIC_WORDS, generate_images, generate_scraped_csv, media_names
+
+STAGES = ["generate", "scrape", "clean", "load", "insert", "detect", "api"]
+# Stages that read the generated or the cleaned CSV
+NEEDS_RAW = {"clean", "detect"}
+NEEDS_CLEANED = {"load", "insert", "api"}
+# Generator settings; the data in --data-dir is reused while they match
+DATA_SETTINGS = ["rows", "seed", "duplicate_rate", "repost_rate", "media_rate", "images"]
+
+
+def peak_rss_mb():
+    """ Peak resident set size of this process (ru_maxrss is KiB on Linux, bytes on macOS). """
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return round(peak / 2 ** 20 if sys.platform == "darwin" else peak / 2 ** 10, 1)
+
+
+def throughput(rows, seconds, **extra):
+    return {"rows": rows, "seconds": round(seconds, 3), "rows_per_second": round(rows / seconds, 1), **extra}
+
+
+def skipped(reason):
+    return {"status": "skipped", "reason": reason}
+
+
+def count_rows(path):
+    return sum(len(chunk) for chunk in pd.read_csv(path, usecols=[0], chunksize=1000000))
+
+
+def reset_database(url):
+    """ Empty the scratch database and bring it to the current schema; returns a DatabaseManager. """
+    from sqlalchemy import create_engine, text
+    from scripts.database_setup import DatabaseManager
+
+    engine = create_engine(url)
+    with engine.begin() as connection:
+        connection.execute(text("DROP SCHEMA public CASCADE; CREATE SCHEMA public;"))
+    db_manager = DatabaseManager(log_dir="logs")
+    db_manager.engine = engine
+    db_manager.migrate()
+    return db_manager
+
+
+def stage_generate(options):
+    start = time.perf_counter()
+    counts = generate_scraped_csv(
+        options["raw_csv"], options["rows"], seed=options["seed"], duplicate_rate=options["duplicate_rate"],
+        repost_rate=options["repost_rate"], media_rate=options["media_rate"],
+    )
+    seconds = time.perf_counter() - start
+    names = media_names(options["raw_csv"], options["images"])
+    generate_images(options["image_dir"], names, seed=options["seed"])
+    return throughput(
+        counts["rows"], seconds, csv_mb=round(counts["bytes"] / 2 ** 20, 1),
+        unique_ids=counts["unique_ids"], images=len(names),
+    )
+
+
+def stage_scrape(options):
+    from scripts.fake_telegram_client import FakeTelegramClient
+    from scripts.telegram_scraper import TelegramScraper
+
+    workdir = os.path.join(options["data_dir"], "scrape")
+    shutil.rmtree(workdir, ignore_errors=True)
+    os.makedirs(workdir)
+    per_channel = max(1, options["scrape_rows"] // len(CHANNELS))
+    channels = {username: per_channel for username, _ in CHANNELS}
+    channels_file = os.path.join(workdir, "channels.json")
+    with open(channels_file, "w") as f:
+        json.dump({"channels": list(channels)}, f)
+
+    client = FakeTelegramClient(channels, latency=options["scrape_latency"], media_size=1024)
+    scraper = TelegramScraper(
+        raw_data_dir=workdir, log_dir=os.path.join(workdir, "logs"), channels_file=channels_file,
+        client=client, concurrency=len(channels), messages_per_run=per_channel,
+    )
+    start = time.perf_counter()
+    asyncio.run(scraper.run())
+    seconds = time.perf_counter() - start
+    return throughput(count_rows(scraper.csv_file), seconds, requests=client.requests)
+
+
+def stage_clean(options):
+    from scripts.data_cleaning import DataCleaner
+
+    cleaner = DataCleaner(input_path=options["raw_csv"], output_path=options["cleaned_csv"])
+    start = time.perf_counter()
+    cleaner.run(chunksize=options["chunksize"])
+    seconds = time.perf_counter() - start
+    return throughput(count_rows(options["raw_csv"]), seconds, rows_out=count_rows(options["cleaned_csv"]))
+
+
+def stage_load(options):
+    if not options["database_url"]:
+        return skipped("no scratch PostgreSQL database (--scratch-database-url)")
+    db_manager = reset_database(options["database_url"])
+    rows = inserted = 0
+    start = time.perf_counter()
+    for chunk in pd.read_csv(options["cleaned_csv"], chunksize=options["chunksize"]):
+        inserted += db_manager.bulk_insert_data(chunk)["inserted"]
+        rows += len(chunk)
+    seconds = time.perf_counter() - start
+    return throughput(rows, seconds, inserted=inserted)
+
+
+def stage_insert(options):
+    if not options["database_url"]:
+        return skipped("no scratch PostgreSQL database (--scratch-database-url)")
+    db_manager = reset_database(options["database_url"])
+    df = pd.read_csv(options["cleaned_csv"], nrows=options["insert_rows"])
+    # insert_data expects the column even though the cleaner does not produce it
+    df["youtube_links"] = None
+    start = time.perf_counter()
+    db_manager.insert_data(df)
+    return throughput(len(df), time.perf_counter() - start)
+
+
+def stage_detect(options):
+    images = sorted(os.listdir(options["image_dir"])) if os.path.isdir(options["image_dir"]) else []
+    if not images:
+        return skipped("no synthetic images (--images 0)")
+    try:
+        from scripts.object_detection import YOLOObjectDetection
+
+        detector = YOLOObjectDetection(
+            image_dir=options["image_dir"], output_dir=os.path.join(options["data_dir"], "detections"),
+            model_name=options["yolo_weights"], cache_path=None, engine=options["detect_engine"],
+            model_cache=os.getenv("MODEL_CACHE", os.path.join(ROOT, "data", "models")),
+        )
+    except Exception as e:
+        return skipped(f"YOLOv5 model could not be loaded: {e}")
+
+    start = time.perf_counter()
+    detector.run_detection(save_annotated=False)
+    per_image_seconds = time.perf_counter() - start
+    start = time.perf_counter()
+    detector.run_batched_detection()
+    seconds = time.perf_counter() - start
+    return throughput(
+        len(images), seconds, run_detection_seconds=round(per_image_seconds, 3),
+        run_detection_rows_per_second=round(len(images) / per_image_seconds, 1),
+    )
+
+
+def seed_api_database(options, url):
+    """ Copy the first api_rows cleaned rows, and boxes for their images, into the SQLite stand-in. """
+    from sqlalchemy import create_engine
+    from database import Base
+    from models import DetectedObject, TelegramMessage
+
+    engine = create_engine(url)
+    Base.metadata.create_all(engine)
+    df = pd.read_csv(options["cleaned_csv"], nrows=options["api_rows"])
+    df["message_date"] = pd.to_datetime(df["message_date"], utc=True, errors="coerce").dt.tz_localize(None)
+    df["youtube_links"] = None
+    columns = [column.name for column in TelegramMessage.__table__.columns if column.name != "id"]
+    df = df.reindex(columns=columns).astype(object)
+    df = df.where(df.notna(), None)
+
+    rng = np.random.default_rng(options["seed"])
+    media = df["media_path"].dropna()
+    images = [os.path.basename(path) for path in media[media != "No Media"]]
+    boxes = pd.DataFrame({
+        "image_name": np.repeat(images, 3),
+        "class_id": rng.integers(0, 80, len(images) * 3),
+        "x_center": rng.uniform(0, 640, len(images) * 3),
+        "y_center": rng.uniform(0, 480, len(images) * 3),
+        "width": rng.uniform(10, 300, len(images) * 3),
+        "height": rng.uniform(10, 300, len(images) * 3),
+        "confidence": rng.uniform(0.25, 1, len(images) * 3),
+    })
+    with engine.begin() as connection:
+        for start in range(0, len(df), 50000):
+            connection.execute(TelegramMessage.__table__.insert(), df.iloc[start:start + 50000].to_dict("records"))
+        if len(boxes):
+            connection.execute(DetectedObject.__table__.insert(), boxes.to_dict("records"))
+    engine.dispose()
+    return len(df), len(boxes)
+
+
+def api_requests(rows, detections, seed):
+    """ Request builders per endpoint, each taking the request number. """
+    rng = random.Random(seed)
+    words = ENGLISH_WORDS[:20] + AMHARIC_WORDS[:12]
+    start = pd.Timestamp("2023-01-01")
+    span_days = max(1, rows * 45 // 86400)
+
+    def filtered(i):
+        date_from = start + pd.Timedelta(days=rng.randrange(span_days))
+        return "/telegram_messages", {
+            "limit": 50, "channel_username": CHANNELS[i % len(CHANNELS)][0],
+            "date_from": date_from.isoformat(), "date_to": (date_from + pd.Timedelta(days=7)).isoformat(),
+        }
+
+    return {
+        "messages_page": lambda i: ("/telegram_messages", {"limit": 50, "cursor": rng.randrange(rows)}),
+        "messages_filtered": filtered,
+        "search": lambda i: ("/search", {"q": " ".join(rng.sample(words, 1 + i % 2)), "limit": 20}),
+        "detected_objects": lambda i: ("/detected_objects", {"limit": 50, "cursor": rng.randrange(max(1, detections))}),
+    }
+
+
+async def measure_endpoints(requests, count, concurrency):
+    import httpx
+    from database import engine
+    from main import app
+
+    metrics = {}
+    transport = httpx.ASGITransport(app=app)
+    async with httpx.AsyncClient(transport=transport, base_url="http://bench") as client:
+        for name, build in requests.items():
+            # One untimed request warms up connections and the search fallback index
+            path, params = build(0)
+            (await client.get(path, params=params)).raise_for_status()
+
+            semaphore = asyncio.Semaphore(concurrency)
+            latencies = []
+
+            async def one(i):
+                path, params = build(i)
+                async with semaphore:
+                    started = time.perf_counter()
+                    response = await client.get(path, params=params)
+                    response.raise_for_status()
+                    latencies.append(time.perf_counter() - started)
+
+            start = time.perf_counter()
+            await asyncio.gather(*(one(i) for i in range(count)))
+            seconds = time.perf_counter() - start
+            latencies = np.array(latencies) * 1000
+            metrics[f"{name}_p50_ms"] = round(float(np.percentile(latencies, 50)), 3)
+            metrics[f"{name}_p99_ms"] = round(float(np.percentile(latencies, 99)), 3)
+            metrics[f"{name}_requests_per_second"] = round(count / seconds, 1)
+    await engine.dispose()
+    return metrics
+
+
+def stage_api(options):
+    database_file = os.path.join(options["data_dir"], "api.sqlite")
+    if os.path.exists(database_file):
+        os.remove(database_file)
+    url = f"sqlite:///{database_file}"
+    # Read by my_project when its modules are imported
+    os.environ["DATABASE_URL"] = url
+    os.environ["CACHE_BACKEND"] = options["api_cache"]
+    sys.path.append(os.path.join(ROOT, "my_project"))
+
+    rows, detections = seed_api_database(options, url)
+    requests = api_requests(rows, detections, options["seed"])
+    metrics = asyncio.run(measure_endpoints(requests, options["api_requests"], options["api_concurrency"]))
+    return {"rows": rows, "detections": detections, **metrics}
+
+
+STAGE_FUNCTIONS = {
+    "generate": stage_generate, "scrape": stage_scrape, "clean": stage_clean, "load": stage_load,
+    "insert": stage_insert, "detect": stage_detect, "api": stage_api,
+}
+
+
+def run_stage(name, options):
+    """ Child process entry point: run one stage and add its peak RSS. """
+    # Stage classes log to relative paths; keep them out of the working tree
+    os.chdir(options["data_dir"])
+    result = STAGE_FUNCTIONS[name](options)
+    result.setdefault("status", "ok")
+    if result["status"] == "ok":
+        result["peak_rss_mb"] = peak_rss_mb()
+    return result
+
+
+def git_state():
+    try:
+        commit = subprocess.run(
+            ["git", "rev-parse", "HEAD"], cwd=ROOT, capture_output=True, text=True, check=True
+        ).stdout.strip()
+        dirty = bool(subprocess.run(
+            ["git", "status", "--porcelain", "--untracked-files=no"], cwd=ROOT, capture_output=True, text=True
+        ).stdout.strip())
+        return commit, dirty
+    except (OSError, subprocess.CalledProcessError):
+        return None, None
+
+
+def machine_info():
+    return {
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "processor": platform.processor() or platform.machine(),
+        "cpu_count": os.cpu_count(),
+    }
+
+
+def data_is_current(options):
+    """ True when --data-dir holds data generated with the same settings. """
+    try:
+        with open(options["settings_file"]) as f:
+            return json.load(f) == {key: options[key] for key in DATA_SETTINGS}
+    except FileNotFoundError:
+        return False
+
+
+def plan_stages(selected, options):
+    """ Add the stages whose output the selected ones read, unless it is already on disk. """
+    stages = set(selected)
+    fresh_data = not data_is_current(options)
+    if stages & (NEEDS_RAW | NEEDS_CLEANED) and fresh_data:
+        stages.add("generate")
+    if stages & NEEDS_CLEANED and (fresh_data or not os.path.exists(options["cleaned_csv"])):
+        stages.add("clean")
+    return [stage for stage in STAGES if stage in stages]
+
+
+def print_results(stages):
+    print(f"{'stage':<10} {'status':<8} {'rows':>11} {'rows/s':>11} {'peak RSS MB':>12}  notes")
+    for name, result in stages.items():
+        if result["status"] != "ok":
+            print(f"{name:<10} {result['status']:<8} {'':>11} {'':>11} {'':>12}  {result.get('reason') or result.get('error')}")
+            continue
+        notes = ", ".join(
+            f"{key}={value}" for key, value in result.items()
+            if key.endswith(("_ms", "_requests_per_second", "rows_out", "inserted", "images"))
+        )
+        rate = f"{result['rows_per_second']:,.0f}" if "rows_per_second" in result else ""
+        print(f"{name:<10} {'ok':<8} {result['rows']:>11,} {rate:>11} {result['peak_rss_mb']:>12}  {notes}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--stages", nargs="+", choices=STAGES, default=STAGES)
+    parser.add_argument("--rows", type=int, default=1000000, help="Rows in the synthetic scraped_data.csv.")
+    parser.add_argument("--seed", type=int, default=42)
+    parser.add_argument("--duplicate-rate", type=float, default=0.05)
+    parser.add_argument("--repost-rate", type=float, default=0.25)
+    parser.add_argument("--media-rate", type=float, default=0.3)
+    parser.add_argument("--images", type=int, default=200, help="Synthetic images for the detect stage.")
+    parser.add_argument("--chunksize", type=int, default=100000, help="Rows per chunk when cleaning and loading.")
+    parser.add_argument("--scrape-rows", type=int, default=50000)
+    parser.add_argument("--scrape-latency", type=float, default=0.0, help="Simulated seconds per Telegram request.")
+    parser.add_argument("--insert-rows", type=int, default=20000, help="Sample size for the row-by-row insert.")
+    parser.add_argument("--yolo-weights", default="yolov5s", help="Cached model name or weights file.")
+    parser.add_argument("--detect-engine", choices=["eager", "torchscript", "onnx", "onnx-int8"], default="eager",
+                        help="Engine of the detect stage; benchmarks/compare_engines.py compares them all.")
+    parser.add_argument("--api-rows", type=int, default=200000, help="Cleaned rows copied into the API database.")
+    parser.add_argument("--api-requests", type=int, default=1000, help="Requests per endpoint.")
+    parser.add_argument("--api-concurrency", type=int, default=10)
+    parser.add_argument("--api-cache", choices=["off", "lru", "local"], default="off",
+                        help="API response cache during the run; off measures the database path.")
+    parser.add_argument("--scratch-database-url", default=os.getenv("BENCH_DATABASE_URL"),
+                        help="PostgreSQL database for load and insert. Its public schema is dropped.")
+    parser.add_argument("--data-dir", default=os.path.join(tempfile.gettempdir(), "ethio_bench"))
+    parser.add_argument("--output", help="JSON results file (default: benchmarks/results/<commit>.json).")
+    args = parser.parse_args()
+
+    options = {key: value for key, value in vars(args).items() if key not in ("stages", "output")}
+    options["database_url"] = options.pop("scratch_database_url")
+    options["data_dir"] = os.path.abspath(args.data_dir)
+    if os.path.isfile(args.yolo_weights):
+        options["yolo_weights"] = os.path.abspath(args.yolo_weights)
+    options["raw_csv"] = os.path.join(options["data_dir"], "scraped_data.csv")
+    options["cleaned_csv"] = os.path.join(options["data_dir"], "cleaned_data.csv")
+    options["image_dir"] = os.path.join(options["data_dir"], "photos")
+    options["settings_file"] = os.path.join(options["data_dir"], "synthetic.json")
+    os.makedirs(options["data_dir"], exist_ok=True)
+
+    stages = plan_stages(args.stages, options)
+    results = {}
+    for name in stages:
+        if name == "generate":
+            shutil.rmtree(options["image_dir"], ignore_errors=True)
+            if os.path.exists(options["settings_file"]):
+                os.remove(options["settings_file"])
+        print(f"running {name}...", flush=True)
+        # A fresh process per stage, so peak RSS and imports do not carry over
+        with ProcessPoolExecutor(max_workers=1, mp_context=multiprocessing.get_context("spawn")) as pool:
+            try:
+                results[name] = pool.submit(run_stage, name, options).result()
+            except Exception as e:
+                results[name] = {"status": "failed", "error": repr(e)}
+        if name == "generate" and results[name]["status"] == "ok":
+            with open(options["settings_file"], "w") as f:
+                json.dump({key: options[key] for key in DATA_SETTINGS}, f)
+
+    commit, dirty = git_state()
+    report = {
+        "suite": "pipeline",
+        "created_at": datetime.now(timezone.utc).isoformat(timespec="seconds"),
+        "commit": commit,
+        "dirty": dirty,
+        "machine": machine_info(),
+        "settings": {key: value for key, value in options.items() if key != "database_url"},
+        "stages": results,
+    }
+    output = args.output or os.path.join(
+        ROOT, "benchmarks", "results", f"{(commit or 'unknown')[:12]}{'-dirty' if dirty else ''}.json"
+    )
+    os.makedirs(os.path.dirname(os.path.abspath(output)), exist_ok=True)
+    with open(output, "w") as f:
+        json.dump(report, f, indent=2)
+
+    print_results(results)
+    print(f"results written to {output}")
+    sys.exit(1 if any(result["status"] == "failed" for result in results.values()) else 0)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,282 @@
+"""
+Deterministic synthetic data shaped like the scraper's output.
+
+generate_scraped_csv() writes a raw CSV with the scraped_data.csv columns
+chunk by chunk, so tens of millions of rows take no more memory than one
+chunk. The rows contain:
+  - adverts mixing English and Amharic words (with homophone spellings),
+    prices, phone numbers, emoji (ZWJ sequences, skin tones, flags) and
+    stray newlines, plus a share of empty messages,
+  - reposts: earlier adverts posted again with a new price, an emoji or a
+    phone number (near-duplicates for the cleaning stage),
+  - duplicate rows: a message ID scraped twice,
+  - media paths for a share of the rows.
+generate_images() draws JPEGs for media paths.
+
+The same arguments always produce the same bytes.
+
+Usage:
+    python benchmarks/synthetic.py --rows 10000000 --output /tmp/scraped_data.csv --images 500
+"""
+import argparse
+import os
+import sys
+import time
+
+import numpy as np
+import pandas as pd
+
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), "..")))
+
+from scripts.telegram_scraper import CSV_HEADER
+
+CHANNELS = [
+    ("@CheMed123", "CheMed Telegram Channel"),
+    ("@lobelia4cosmetics", "Lobelia pharmacy and cosmetics"),
+    ("@tikvahpharma", "Tikvah | Pharma"),
+    ("@DoctorsET", "Doctors Ethiopia"),
+    ("@EAHCI", "EAHCI"),
+    ("@yetenaweg", "የጤና ወግ"),
+]
+# Busy channels post more
+CHANNEL_WEIGHTS = np.array([0.3, 0.25, 0.2, 0.1, 0.1, 0.05])
+
+ENGLISH_WORDS = [
+    "Paracetamol", "Amoxicillin", "Ibuprofen", "Vitamin", "Omeprazole", "Metformin", "Cetirizine",
+    "Azithromycin", "Zinc", "ORS", "Salbutamol", "Diclofenac", "Folic", "acid", "Ciprofloxacin",
+    "500mg", "250mg", "tablets", "capsules", "syrup", "cream", "available", "price", "call", "delivery",
+    "Addis", "Ababa", "stock", "original", "imported", "discount", "pharmacy", "new", "pack", "bottle",
+    "order", "today", "free", "Bole", "Piassa", "inbox", "@pharma_order", "https://t.me/CheMed123",
+]
+# Homophone spellings (ሀ/ሐ/ኀ, ሰ/ሠ, አ/ዐ, ጸ/ፀ) appear side by side, as in real posts
+AMHARIC_WORDS = [
+    "መድሃኒት", "መድኀኒት", "ዋጋ", "ይደውሉ", "አዲስ", "አበባ", "ቅናሽ", "ፋርማሲ", "ጸሀይ", "ፀሐይ", "ሀኪም", "ሐኪም",
+    "ሰላም", "ሠላም", "ክሬም", "ሳሙና", "ሽሮፕ", "ቫይታሚን", "ፓራሲታሞል", "ለልጆች", "ለአዋቂዎች", "ብር", "አለን", "ዐይን",
+]
+EMOJIS = ["💊", "✅", "📞", "🔥", "❤️", "👍🏽", "🇪🇹", "👩‍⚕️", "🏥", "💉", "🩺", "⭐", "🚚", "📍", "👨‍👩‍👧"]
+
+# Distinct phrases (2-4 words) that adverts are assembled from
+PHRASE_COUNT = 4096
+# Phrases per advert, at most
+MAX_PHRASES = 6
+# Reposts and duplicates copy one of the last HISTORY original adverts
+HISTORY = 65536
+# Average seconds between messages
+MESSAGE_GAP = 45
+START = np.datetime64("2023-01-01T00:00:00")
+
+
+def make_phrases(rng):
+    words = np.array(ENGLISH_WORDS + AMHARIC_WORDS, dtype=object)
+    phrases = []
+    for _ in range(PHRASE_COUNT):
+        # Half of the phrases are English, half Amharic, with loanwords mixed in
+        pool = ENGLISH_WORDS if rng.random() < 0.5 else AMHARIC_WORDS
+        chosen = [pool[i] for i in rng.integers(0, len(pool), rng.integers(2, 5))]
+        if rng.random() < 0.2:
+            chosen.insert(rng.integers(0, len(chosen) + 1), words[rng.integers(0, len(words))])
+        phrases.append(" ".join(chosen))
+    return np.array(phrases, dtype=object)
+
+
+class ScrapedDataGenerator:
+    """ Streams chunks of synthetic scraped rows; see the module docstring for their content. """
+
+    def __init__(self, seed=42, duplicate_rate=0.05, repost_rate=0.25, media_rate=0.3,
+                 empty_rate=0.02, emoji_rate=0.6, newline_rate=0.3):
+        self.rng = np.random.default_rng(seed)
+        self.duplicate_rate = duplicate_rate
+        self.repost_rate = repost_rate
+        self.media_rate = media_rate
+        self.empty_rate = empty_rate
+        self.emoji_rate = emoji_rate
+        self.newline_rate = newline_rate
+        self.phrases = make_phrases(self.rng)
+        self.emojis = np.array(EMOJIS, dtype=object)
+        self.rows = 0
+        self.duplicates = 0
+        # Original adverts that later rows may repost or duplicate
+        self.history = None
+
+    def _adverts(self, n):
+        """ Message text of n original adverts. """
+        rng = self.rng
+        phrases = self.phrases[rng.integers(0, PHRASE_COUNT, (n, MAX_PHRASES))].tolist()
+        lengths = rng.integers(2, MAX_PHRASES + 1, n).tolist()
+        separators = np.where(rng.random(n) < self.newline_rate, "\n", " ").tolist()
+        prices = (rng.integers(2, 400, n) * 25).tolist()
+        phones = [
+            f"\n📞 09{number}" if with_phone else ""
+            for number, with_phone in zip(rng.integers(10 ** 7, 10 ** 8, n).tolist(), (rng.random(n) < 0.4).tolist())
+        ]
+
+        emoji = self.emojis[rng.integers(0, len(self.emojis), n)] + np.where(
+            rng.random(n) < 0.3, self.emojis[rng.integers(0, len(self.emojis), n)], ""
+        ).astype(object)
+        with_emoji = rng.random(n) < self.emoji_rate
+        emoji_first = rng.random(n) < 0.5
+        leads = np.where(with_emoji & emoji_first, emoji + " ", "").tolist()
+        tails = np.where(with_emoji & ~emoji_first, " " + emoji, "").tolist()
+        empty = (rng.random(n) < self.empty_rate).tolist()
+
+        # A Python join per row is several times faster than object-array concatenation
+        return np.array([
+            "" if blank else f"{lead}{row[0]}{separator}{' '.join(row[1:length])} ዋጋ {price} ብር{phone}{tail}"
+            for row, length, separator, price, phone, lead, tail, blank
+            in zip(phrases, lengths, separators, prices, phones, leads, tails, empty)
+        ], dtype=object)
+
+    def _repost_edits(self, messages):
+        """ Small edits of reposted adverts: a new price, an emoji, a phone number or a full stop. """
+        rng = self.rng
+        n = len(messages)
+        edits = rng.integers(0, 4, n).tolist()
+        prices = (rng.integers(2, 400, n) * 25).tolist()
+        emojis = self.emojis[rng.integers(0, len(self.emojis), n)].tolist()
+        phones = rng.integers(10 ** 7, 10 ** 8, n).tolist()
+        return np.array([
+            f"{message} ዋጋ {price} ብር" if edit == 0
+            else f"{emoji} {message}" if edit == 1
+            else f"{message}\n📞 09{phone}" if edit == 2
+            else f"{message}።"
+            for message, edit, price, emoji, phone in zip(messages.tolist(), edits, prices, emojis, phones)
+        ], dtype=object)
+
+    def chunk(self, n):
+        """ Next n rows as a DataFrame with the raw CSV columns. """
+        rng = self.rng
+        start = self.rows
+        kind = rng.random(n)
+        duplicate = kind < self.duplicate_rate
+        repost = ~duplicate & (kind < self.duplicate_rate + self.repost_rate)
+        if self.history is None:
+            # The very first row has nothing to copy
+            duplicate[0] = repost[0] = False
+        original = ~duplicate & ~repost
+
+        ids = np.arange(start + 1, start + n + 1, dtype=np.int64)
+        seconds = (np.arange(start, start + n) * MESSAGE_GAP + rng.integers(0, MESSAGE_GAP, n)).astype("timedelta64[s]")
+        channels = rng.choice(len(CHANNELS), n, p=CHANNEL_WEIGHTS)
+        messages = np.empty(n, dtype=object)
+        messages[original] = self._adverts(int(original.sum()))
+        media = np.where(rng.random(n) < self.media_rate, "media", "").astype(object)
+
+        # Originals of earlier chunks followed by those of this chunk, ranked in row order
+        fresh = {
+            "message": messages[original], "id": ids[original], "seconds": seconds[original],
+            "channel": channels[original], "media": media[original],
+        }
+        if self.history is not None:
+            fresh = {key: np.concatenate([self.history[key], values]) for key, values in fresh.items()}
+        kept = len(fresh["id"]) - int(original.sum())
+        copies = ~original
+        # Number of originals before each copied row; its source is one of the last HISTORY of them
+        before = kept + np.cumsum(original)[copies]
+        source = before - rng.integers(1, np.minimum(before, HISTORY) + 1)
+
+        messages[repost] = self._repost_edits(fresh["message"][source[repost[copies]]])
+        channels[repost] = fresh["channel"][source[repost[copies]]]
+        duplicate_source = source[duplicate[copies]]
+        messages[duplicate] = fresh["message"][duplicate_source]
+        ids[duplicate] = fresh["id"][duplicate_source]
+        seconds[duplicate] = fresh["seconds"][duplicate_source]
+        channels[duplicate] = fresh["channel"][duplicate_source]
+        media[duplicate] = fresh["media"][duplicate_source]
+
+        self.history = {key: values[-HISTORY:] for key, values in fresh.items()}
+        self.rows += n
+        self.duplicates += int(duplicate.sum())
+
+        usernames = np.array([username for username, _ in CHANNELS], dtype=object)[channels]
+        titles = np.array([title for _, title in CHANNELS], dtype=object)[channels]
+        dates = np.char.add(np.char.replace(np.datetime_as_string(START + seconds, unit="s"), "T", " "), "+00:00")
+        media_paths = np.full(n, "", dtype=object)
+        has_media = media == "media"
+        media_paths[has_media] = [
+            f"data/raw/photos/{username}_{message_id}.jpg"
+            for username, message_id in zip(usernames[has_media], ids[has_media].tolist())
+        ]
+        return pd.DataFrame(dict(zip(CSV_HEADER, [titles, usernames, ids, messages, dates, media_paths])))
+
+
+def generate_scraped_csv(path, rows, chunk_rows=200000, seed=42, **rates):
+    """
+    Write `rows` synthetic rows to a raw CSV at path; returns counts of what was written.
+
+    rates are the ScrapedDataGenerator shares (duplicate_rate, repost_rate, ...).
+    """
+    generator = ScrapedDataGenerator(seed=seed, **rates)
+    os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+    counts = {"rows": 0, "unique_ids": 0, "empty_messages": 0, "media": 0}
+    with open(path, "w", newline="", encoding="utf-8") as f:
+        for start in range(0, rows, chunk_rows):
+            chunk = generator.chunk(min(chunk_rows, rows - start))
+            chunk.to_csv(f, header=start == 0, index=False)
+            counts["rows"] += len(chunk)
+            counts["empty_messages"] += int((chunk["Message"] == "").sum())
+            counts["media"] += int((chunk["Media Path"] != "").sum())
+    counts["unique_ids"] = generator.rows - generator.duplicates
+    counts["bytes"] = os.path.getsize(path)
+    return counts
+
+
+def generate_images(directory, names, size=(640, 480), seed=42):
+    """ Draw a deterministic JPEG per file name: pill- and box-like shapes on a noisy background. """
+    from PIL import Image, ImageDraw
+
+    os.makedirs(directory, exist_ok=True)
+    width, height = size
+    for index, name in enumerate(names):
+        rng = np.random.default_rng([seed, index])
+        pixels = rng.integers(150, 256, 3) + rng.normal(0, 12, (height, width, 3))
+        image = Image.fromarray(np.clip(pixels, 0, 255).astype(np.uint8))
+        draw = ImageDraw.Draw(image)
+        for _ in range(rng.integers(1, 6)):
+            x, y = rng.integers(0, width - 60), rng.integers(0, height - 60)
+            w, h = rng.integers(40, width // 2), rng.integers(20, height // 2)
+            color = tuple(int(c) for c in rng.integers(0, 256, 3))
+            if rng.random() < 0.5:
+                draw.ellipse((x, y, x + w, y + h), fill=color, outline=(0, 0, 0))
+            else:
+                draw.rectangle((x, y, x + w, y + h), fill=color, outline=(0, 0, 0))
+        image.save(os.path.join(directory, name), quality=85)
+
+
+def media_names(path, limit):
+    """ File names of the first `limit` distinct media paths in a raw CSV. """
+    names = []
+    for chunk in pd.read_csv(path, usecols=["Media Path"], dtype=str, chunksize=500000):
+        names.extend(os.path.basename(p) for p in chunk["Media Path"].dropna().unique())
+        names = list(dict.fromkeys(names))
+        if len(names) >= limit:
+            break
+    return names[:limit]
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--rows", type=int, default=1000000)
+    parser.add_argument("--output", default="data/raw/synthetic_scraped_data.csv")
+    parser.add_argument("--seed", type=int, default=42)
+    parser.add_argument("--duplicate-rate", type=float, default=0.05)
+    parser.add_argument("--repost-rate", type=float, default=0.25)
+    parser.add_argument("--media-rate", type=float, default=0.3)
+    parser.add_argument("--images", type=int, default=0, help="Also draw JPEGs for this many media paths.")
+    parser.add_argument("--image-dir", default="data/raw/synthetic_photos")
+    args = parser.parse_args()
+
+    start = time.perf_counter()
+    counts = generate_scraped_csv(
+        args.output, args.rows, seed=args.seed, duplicate_rate=args.duplicate_rate,
+        repost_rate=args.repost_rate, media_rate=args.media_rate
+    )
+    seconds = time.perf_counter() - start
+    print(f"wrote {counts['rows']} rows ({counts['bytes'] / 2 ** 20:.1f} MiB) to {args.output} "
+          f"in {seconds:.1f}s ({counts['rows'] / seconds:,.0f} rows/s)")
+    if args.images:
+        generate_images(args.image_dir, media_names(args.output, args.images), seed=args.seed)
+        print(f"drew {args.images} images in {args.image_dir}")
+
+
+if __name__ == "__main__":
+    main()
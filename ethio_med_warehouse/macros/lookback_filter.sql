@@ -0,0 +1,7 @@
+{% macro lookback_filter(source_column, target_column) %}
+    {#- Rows of the lookback window: from lookback_days before the latest date already in this model -#}
+    {{ source_column }} >= (
+        SELECT COALESCE(MAX({{ target_column }}), DATE '1900-01-01')
+        FROM {{ this }}
+    ) - INTERVAL '{{ var("lookback_days") }} days'
+{% endmacro %}
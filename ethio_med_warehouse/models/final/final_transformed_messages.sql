@@ -1,9 +1,16 @@
 -- models/final/final_transformed_messages.sql
+{{ config(
+    unique_key=['channel_title', 'message_day'],
+    indexes=[{'columns': ['channel_title', 'message_day'], 'unique': True}]
+) }}
+
 SELECT
     channel_title,
-    message_date::DATE AS message_day,
-    SUM(total_messages) AS total_messages,
-    SUM(total_media) AS total_media
+    message_day,
+    total_messages,
+    unique_messages,
+    total_media
 FROM {{ ref('messages_summary') }}
-GROUP BY channel_title, message_day
-ORDER BY channel_title, message_day
+{% if is_incremental() %}
+WHERE {{ lookback_filter('message_day', 'message_day') }}
+{% endif %}
@@ -1,8 +1,19 @@
 -- models/intermediate/messages_summary.sql
+{{ config(
+    unique_key=['channel_title', 'message_day'],
+    indexes=[{'columns': ['channel_title', 'message_day'], 'unique': True}]
+) }}
+
 SELECT
     channel_title,
-    message_date,
+    message_date::DATE AS message_day,
     COUNT(message_id) AS total_messages,
+    -- Reposts of the same advert count once
+    COUNT(DISTINCT COALESCE(canonical_message_id, message_id)) AS unique_messages,
     COUNT(media_path) AS total_media,
     COUNT(DISTINCT channel_username) AS unique_channels
-FROM {{ ref('stg_telegram_messages') }} GROUP BY channel_title, message_date
+FROM {{ ref('stg_telegram_messages') }}
+{% if is_incremental() %}
+WHERE {{ lookback_filter('message_date', 'message_day') }}
+{% endif %}
+GROUP BY channel_title, message_day
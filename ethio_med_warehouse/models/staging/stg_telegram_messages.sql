@@ -1,4 +1,12 @@
 -- models/staging/stg_telegram_messages.sql
+{{ config(
+    unique_key='message_id',
+    indexes=[
+      {'columns': ['message_id'], 'unique': True},
+      {'columns': ['message_date']},
+    ]
+) }}
+
 SELECT
     message_id,
     channel_title,
@@ -7,5 +15,10 @@ SELECT
     message_date,
     media_path,
     emoji_used,
-    youtube_links
+    youtube_links,
+    cluster_id,
+    canonical_message_id
 FROM {{ source('telegram_data', 'telegram_messages') }} WHERE message_date IS NOT NULL
+{% if is_incremental() %}
+    AND {{ lookback_filter('message_date', 'message_date') }}
+{% endif %}
@@ -0,0 +1,217 @@
+import hashlib
+import json
+import os
+import time
+from collections import OrderedDict, namedtuple
+from urllib.parse import urlencode
+from fastapi import Request, Response
+
+# A cached HTTP response body with its ETag and extra headers
+CachedResponse = namedtuple("CachedResponse", ["body", "etag", "headers"])
+
+# Shared-backend key holding a table's generation; DatabaseManager.invalidate_api_cache
+# in scripts/database_setup.py increments the same key after bulk loads
+GENERATION_KEY = "api-cache:generation:{table}"
+ENTRY_KEY = "api-cache:entry:{key}"
+
+
+class LRUBackend:
+    """
+    In-process LRU cache with a TTL.
+
+    Entries are tagged with their table's generation; bumping the generation
+    makes every older entry of that table a miss.
+    """
+
+    def __init__(self, max_entries=1024, ttl=30.0):
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self.entries = OrderedDict()
+        self.generations = {}
+        self.evictions = 0
+
+    async def lookup(self, table, key):
+        """Return (current generation, entry or None)."""
+        generation = self.generations.get(table, 0)
+        item = self.entries.get(key)
+        if item is None:
+            return generation, None
+        expires_at, entry_generation, entry = item
+        if expires_at < time.monotonic() or entry_generation != generation:
+            del self.entries[key]
+            return generation, None
+        self.entries.move_to_end(key)
+        return generation, entry
+
+    async def store(self, table, key, generation, entry):
+        self.entries[key] = (time.monotonic() + self.ttl, generation, entry)
+        self.entries.move_to_end(key)
+        while len(self.entries) > self.max_entries:
+            self.entries.popitem(last=False)
+            self.evictions += 1
+
+    async def bump(self, table):
+        self.generations[table] = self.generations.get(table, 0) + 1
+
+    def stats(self):
+        return {"backend": "lru", "entries": len(self.entries), "evictions": self.evictions}
+
+
+class SharedBackend:
+    """
+    Cache stored in a Redis-compatible server shared by every API worker.
+
+    `client` needs async get/set(ex=)/mget/incr, e.g. redis.asyncio.Redis or
+    InMemoryRedis. Generations live in the same server, so writers in other
+    processes (such as the bulk loaders) can invalidate entries. A lookup is
+    one MGET of the generation and the entry.
+    """
+
+    def __init__(self, client, ttl=30.0):
+        self.client = client
+        self.ttl = ttl
+
+    async def lookup(self, table, key):
+        generation, raw = await self.client.mget(GENERATION_KEY.format(table=table), ENTRY_KEY.format(key=key))
+        generation = int(generation or 0)
+        if raw is None:
+            return generation, None
+        meta, body = raw.split(b"\n", 1)
+        meta = json.loads(meta)
+        if meta["generation"] != generation:
+            return generation, None
+        return generation, CachedResponse(body, meta["etag"], meta["headers"])
+
+    async def store(self, table, key, generation, entry):
+        meta = json.dumps({"generation": generation, "etag": entry.etag, "headers": entry.headers})
+        await self.client.set(ENTRY_KEY.format(key=key), meta.encode() + b"\n" + entry.body, ex=max(1, int(self.ttl)))
+
+    async def bump(self, table):
+        await self.client.incr(GENERATION_KEY.format(table=table))
+
+    def stats(self):
+        # Evictions happen inside the server and are reported there
+        return {"backend": "shared"}
+
+
+class InMemoryRedis:
+    """Local stand-in for redis.asyncio.Redis implementing the calls SharedBackend uses."""
+
+    def __init__(self):
+        self.values = {}
+
+    def _get(self, name):
+        value, expires_at = self.values.get(name, (None, None))
+        if expires_at is not None and expires_at < time.monotonic():
+            del self.values[name]
+            return None
+        return value
+
+    async def get(self, name):
+        return self._get(name)
+
+    async def mget(self, *names):
+        return [self._get(name) for name in names]
+
+    async def set(self, name, value, ex=None):
+        self.values[name] = (value if isinstance(value, bytes) else str(value).encode(),
+                             time.monotonic() + ex if ex else None)
+
+    async def incr(self, name):
+        value = int(self._get(name) or 0) + 1
+        self.values[name] = (str(value).encode(), None)
+        return value
+
+
+class ResponseCache:
+    """
+    Read-through cache for GET responses, keyed on the route and its normalized parameters.
+
+    serve() answers from the backend when it can, otherwise runs the loader and
+    stores its result. Responses carry an ETag, and a matching If-None-Match
+    gets a 304 without a body.
+    """
+
+    def __init__(self, backend=None):
+        self.backend = backend
+        self.hits = 0
+        self.misses = 0
+        self.not_modified = 0
+
+    @staticmethod
+    def make_key(path, params):
+        """Stable key from the path and non-empty parameters in sorted order."""
+        normalized = sorted(
+            (name, value.isoformat() if hasattr(value, "isoformat") else str(value))
+            for name, value in params.items() if value is not None
+        )
+        return f"{path}?{urlencode(normalized)}"
+
+    @staticmethod
+    def make_etag(body):
+        return '"' + hashlib.sha1(body).hexdigest() + '"'
+
+    def _respond(self, request, entry, status):
+        headers = dict(entry.headers, ETag=entry.etag, **{"Cache-Control": "no-cache", "X-Cache": status})
+        if request.headers.get("if-none-match") == entry.etag:
+            self.not_modified += 1
+            return Response(status_code=304, headers=headers)
+        return Response(content=entry.body, media_type="application/json", headers=headers)
+
+    async def serve(self, request: Request, table, params, load):
+        """
+        Return a cached response for `table`, or build one with `load`.
+
+        `load` is an async callable returning (JSON-serializable content, extra headers).
+        """
+        if self.backend is None:
+            content, headers = await load()
+            body = json.dumps(content).encode()
+            return self._respond(request, CachedResponse(body, self.make_etag(body), headers), "BYPASS")
+
+        key = self.make_key(request.url.path, params)
+        generation, entry = await self.backend.lookup(table, key)
+        if entry is not None:
+            self.hits += 1
+            return self._respond(request, entry, "HIT")
+
+        self.misses += 1
+        content, headers = await load()
+        body = json.dumps(content).encode()
+        entry = CachedResponse(body, self.make_etag(body), headers)
+        await self.backend.store(table, key, generation, entry)
+        return self._respond(request, entry, "MISS")
+
+    async def invalidate(self, table):
+        """Drop every cached response for a table after it was written to."""
+        if self.backend is not None:
+            await self.backend.bump(table)
+
+    def stats(self):
+        stats = {"hits": self.hits, "misses": self.misses, "not_modified": self.not_modified}
+        if self.backend is not None:
+            stats.update(self.backend.stats())
+        return stats
+
+
+def cache_from_env():
+    """
+    Build the response cache from CACHE_BACKEND (lru, redis, local or off),
+    CACHE_TTL, CACHE_MAX_ENTRIES and REDIS_URL.
+
+    Caching defaults to redis when REDIS_URL is set and off otherwise: only
+    the shared backend sees the generations bumped by other API workers and
+    by the bulk loaders. The lru and local backends are per process, so
+    writes made elsewhere show up only once CACHE_TTL has expired.
+    """
+    backend = os.getenv("CACHE_BACKEND", "redis" if os.getenv("REDIS_URL") else "off").lower()
+    ttl = float(os.getenv("CACHE_TTL", "30"))
+    if backend == "off":
+        return ResponseCache(None)
+    if backend == "redis":
+        import redis.asyncio
+
+        return ResponseCache(SharedBackend(redis.asyncio.from_url(os.getenv("REDIS_URL", "redis://localhost:6379/0")), ttl))
+    if backend == "local":
+        return ResponseCache(SharedBackend(InMemoryRedis(), ttl))
+    return ResponseCache(LRUBackend(int(os.getenv("CACHE_MAX_ENTRIES", "1024")), ttl))
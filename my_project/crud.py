@@ -1,25 +1,313 @@
-from sqlalchemy.orm import Session
-from models import TelegramMessage, DetectedObject
+import threading
+from datetime import date, datetime
+from typing import Optional
+from sqlalchemy import func, insert, literal_column, select, text
+from sqlalchemy.dialects import postgresql, sqlite
+from sqlalchemy.ext.asyncio import AsyncSession
+from database import ensure_message_partitions
+from models import TelegramMessage, DetectedObject, ChannelDailyRollup, ChannelDailyClassRollup
 from schemas import TelegramMessageCreate, DetectedObjectCreate
+from search import InvertedIndex
+from scripts import rollups
+
+# Dialect-specific INSERT constructs that support ON CONFLICT DO NOTHING
+UPSERT_INSERTS = {"postgresql": postgresql.insert, "sqlite": sqlite.insert}
 
 # CRUD for TelegramMessage
-def get_telegram_messages(db: Session, skip: int = 0, limit: int = 10):
-    return db.query(TelegramMessage).offset(skip).limit(limit).all()
+def telegram_message_filters(channel_username=None, date_from=None, date_to=None):
+    """WHERE conditions shared by the message list and export queries."""
+    conditions = []
+    if channel_username is not None:
+        conditions.append(TelegramMessage.channel_username == channel_username)
+    if date_from is not None:
+        conditions.append(TelegramMessage.message_date >= date_from)
+    if date_to is not None:
+        conditions.append(TelegramMessage.message_date < date_to)
+    return conditions
+
+async def get_telegram_messages(
+    db: AsyncSession,
+    limit: int = 10,
+    cursor: Optional[int] = None,
+    channel_username: Optional[str] = None,
+    date_from: Optional[datetime] = None,
+    date_to: Optional[datetime] = None,
+):
+    """Keyset page of messages ordered by id; `cursor` is the last id of the previous page."""
+    query = select(TelegramMessage).where(*telegram_message_filters(channel_username, date_from, date_to))
+    if cursor is not None:
+        query = query.where(TelegramMessage.id > cursor)
+    result = await db.execute(query.order_by(TelegramMessage.id).limit(limit))
+    return result.scalars().all()
+
+def export_telegram_messages_query(
+    channel_username: Optional[str] = None,
+    date_from: Optional[datetime] = None,
+    date_to: Optional[datetime] = None,
+):
+    """Core select of message columns (no ORM objects) for streaming exports."""
+    table = TelegramMessage.__table__
+    return (
+        select(*table.columns)
+        .where(*telegram_message_filters(channel_username, date_from, date_to))
+        .order_by(table.c.id)
+    )
 
-def create_telegram_message(db: Session, message: TelegramMessageCreate):
+async def create_telegram_message(db: AsyncSession, message: TelegramMessageCreate):
+    if message.message_date:
+        await ensure_message_partitions(db, [message.message_date])
     db_message = TelegramMessage(**message.dict())
     db.add(db_message)
-    db.commit()
-    db.refresh(db_message)
+    await db.flush()
+    await refresh_message_rollups(db, {message_rollup_key(message)} - {None})
+    await db.commit()
+    await db.refresh(db_message)
     return db_message
 
+async def insert_telegram_messages(db: AsyncSession, messages: list[TelegramMessageCreate]):
+    """
+    Multi-row insert that skips message_ids already stored, like the bulk loader.
+
+    Returns the number of rows inserted. The caller commits.
+    """
+    if not messages:
+        return 0
+    dialect = db.bind.dialect.name
+    if dialect not in UPSERT_INSERTS:
+        raise ValueError(f"Batch message insert is not supported on {dialect}")
+    # A Core executemany with RETURNING is sent as batched multi-row VALUES from one
+    # cached statement; only rows that were actually inserted come back. ON CONFLICT has
+    # no target: on the partitioned PostgreSQL table duplicates are dropped by the
+    # message_id registry trigger, elsewhere by the unique index
+    await ensure_message_partitions(db, {message.message_date for message in messages if message.message_date})
+    table = TelegramMessage.__table__
+    statement = (
+        UPSERT_INSERTS[dialect](table)
+        .on_conflict_do_nothing()
+        .returning(table.c.id)
+    )
+    result = await db.execute(statement, [message.dict() for message in messages])
+    return len(result.all())
+
+# Full-text search. PostgreSQL uses the search_vector column added by the migrations
+# in scripts/migrations.py; other databases use an in-process inverted index
+SEARCH_VECTOR = literal_column("telegram_messages.search_vector")
+fallback_index = InvertedIndex()
+# A thread lock, not an asyncio.Lock: an asyncio lock is bound to the event loop that first
+# waits on it, while the index is shared by every loop of the process. It is only held
+# around the synchronous index updates and lookups, never across an await
+fallback_index_lock = threading.Lock()
+
+def search_query(q: str):
+    """tsquery matching stemmed English words or exact words, from web-style syntax ("phrase", or, -word)."""
+    folded = func.telegram_search_text(q)
+    return func.websearch_to_tsquery(literal_column("'english'::regconfig"), folded).op("||")(
+        func.websearch_to_tsquery(literal_column("'simple'::regconfig"), folded)
+    )
+
+async def refresh_fallback_index(db: AsyncSession):
+    """Add messages stored since the fallback index was last read; rebuild it if the table shrank."""
+    last_id = fallback_index.last_id
+    max_id = (await db.execute(select(func.max(TelegramMessage.id)))).scalar() or 0
+    if max_id < last_id:
+        last_id = 0
+    table = TelegramMessage.__table__
+    result = await db.execute(
+        select(table.c.id, table.c.message, table.c.channel_username, table.c.message_date)
+        .where(table.c.id > last_id)
+        .order_by(table.c.id)
+    )
+    rows = result.all()
+    with fallback_index_lock:
+        if max_id < fallback_index.last_id:
+            fallback_index.clear()
+        # Another request may have added some of the rows meanwhile
+        for row in rows:
+            if row.id > fallback_index.last_id:
+                fallback_index.add(*row)
+
+async def search_telegram_messages(
+    db: AsyncSession,
+    q: str,
+    limit: int = 10,
+    offset: int = 0,
+    channel_username: Optional[str] = None,
+    date_from: Optional[datetime] = None,
+    date_to: Optional[datetime] = None,
+):
+    """Page of (message, rank) pairs matching q, best rank first."""
+    if db.bind.dialect.name == "postgresql":
+        query = search_query(q)
+        rank = func.ts_rank_cd(SEARCH_VECTOR, query).label("rank")
+        result = await db.execute(
+            select(TelegramMessage, rank)
+            .where(SEARCH_VECTOR.op("@@")(query), *telegram_message_filters(channel_username, date_from, date_to))
+            .order_by(rank.desc(), TelegramMessage.id)
+            .limit(limit)
+            .offset(offset)
+        )
+        return result.all()
+
+    await refresh_fallback_index(db)
+    with fallback_index_lock:
+        ranked = fallback_index.search(q, limit, offset, channel_username, date_from, date_to)
+    if not ranked:
+        return []
+    result = await db.execute(select(TelegramMessage).where(TelegramMessage.id.in_([id for id, _ in ranked])))
+    messages = {message.id: message for message in result.scalars()}
+    return [(messages[id], rank) for id, rank in ranked if id in messages]
+
 # CRUD for DetectedObject
-def get_detected_objects(db: Session, skip: int = 0, limit: int = 10):
-    return db.query(DetectedObject).offset(skip).limit(limit).all()
+def detected_object_filters(class_id=None, min_confidence=None):
+    """WHERE conditions shared by the detection list and export queries."""
+    conditions = []
+    if class_id is not None:
+        conditions.append(DetectedObject.class_id == class_id)
+    if min_confidence is not None:
+        conditions.append(DetectedObject.confidence >= min_confidence)
+    return conditions
+
+async def get_detected_objects(
+    db: AsyncSession,
+    limit: int = 10,
+    cursor: Optional[int] = None,
+    class_id: Optional[int] = None,
+    min_confidence: Optional[float] = None,
+):
+    """Keyset page of detections ordered by id; `cursor` is the last id of the previous page."""
+    query = select(DetectedObject).where(*detected_object_filters(class_id, min_confidence))
+    if cursor is not None:
+        query = query.where(DetectedObject.id > cursor)
+    result = await db.execute(query.order_by(DetectedObject.id).limit(limit))
+    return result.scalars().all()
 
-def create_detected_object(db: Session, detected_object: DetectedObjectCreate):
+def export_detected_objects_query(class_id: Optional[int] = None, min_confidence: Optional[float] = None):
+    """Core select of detection columns (no ORM objects) for streaming exports."""
+    table = DetectedObject.__table__
+    return select(*table.columns).where(*detected_object_filters(class_id, min_confidence)).order_by(table.c.id)
+
+async def create_detected_object(db: AsyncSession, detected_object: DetectedObjectCreate):
     db_object = DetectedObject(**detected_object.dict())
     db.add(db_object)
-    db.commit()
-    db.refresh(db_object)
+    await db.flush()
+    await refresh_detection_rollups(db, {detected_object.image_name})
+    await db.commit()
+    await db.refresh(db_object)
     return db_object
+
+async def insert_detected_objects(db: AsyncSession, detected_objects: list[DetectedObjectCreate]):
+    """Multi-row insert of detections; returns the number of rows inserted. The caller commits."""
+    if not detected_objects:
+        return 0
+    await db.execute(insert(DetectedObject.__table__), [obj.dict() for obj in detected_objects])
+    return len(detected_objects)
+
+# Rollups of rows written through the API, refreshed with the loaders' statements
+# (scripts/rollups.py) in the writing transaction. Only PostgreSQL maintains them
+ROLLUP_KEYS = (
+    "WITH rollup_keys AS (SELECT * FROM unnest(CAST(:channels AS TEXT[]), CAST(:days AS DATE[])) "
+    "AS k (channel_username, message_day)) "
+)
+
+def message_rollup_key(message: TelegramMessageCreate):
+    """The (channel_username, day) rollup row a message counts in, or None without a date."""
+    return (message.channel_username, message.message_date.date()) if message.message_date else None
+
+async def refresh_message_rollups(db: AsyncSession, message_keys: set):
+    """Recompute the rollup rows of (channel_username, day) pairs. The caller commits."""
+    if not message_keys or db.bind.dialect.name != "postgresql":
+        return
+    channels, days = zip(*sorted(message_keys))
+    await db.execute(text("SELECT pg_advisory_xact_lock(:key)"), {"key": rollups.ROLLUP_LOCK_KEY})
+    for statement in rollups.DELETE_STATEMENTS + rollups.INSERT_STATEMENTS:
+        await db.execute(text(ROLLUP_KEYS + statement), {"channels": list(channels), "days": list(days)})
+
+async def refresh_detection_rollups(db: AsyncSession, image_names: set):
+    """Recompute the rollup rows of the days of the messages those images belong to. The caller commits."""
+    if not image_names or db.bind.dialect.name != "postgresql":
+        return
+    images = "unnest(CAST(:image_names AS TEXT[])) AS i (image_name)"
+    result = await db.execute(text(rollups.image_keys_query(images)), {"image_names": sorted(image_names)})
+    await refresh_message_rollups(db, {tuple(row) for row in result})
+
+# Analytics, answered from the rollup tables
+def rollup_filters(model, channel_username=None, date_from=None, date_to=None):
+    conditions = []
+    if channel_username is not None:
+        conditions.append(model.channel_username == channel_username)
+    if date_from is not None:
+        conditions.append(model.message_day >= date_from)
+    if date_to is not None:
+        conditions.append(model.message_day < date_to)
+    return conditions
+
+def media_share(total_media, total_messages):
+    return round(total_media / total_messages, 4) if total_messages else 0.0
+
+async def get_channel_daily(
+    db: AsyncSession,
+    channel_username: Optional[str] = None,
+    date_from: Optional[date] = None,
+    date_to: Optional[date] = None,
+):
+    """Messages and media per channel per day."""
+    query = (
+        select(ChannelDailyRollup)
+        .where(*rollup_filters(ChannelDailyRollup, channel_username, date_from, date_to))
+        .order_by(ChannelDailyRollup.channel_username, ChannelDailyRollup.message_day)
+    )
+    result = await db.execute(query)
+    return [
+        {
+            "channel_username": row.channel_username,
+            "message_day": row.message_day,
+            "total_messages": row.total_messages,
+            "total_media": row.total_media,
+            "media_share": media_share(row.total_media, row.total_messages),
+        }
+        for row in result.scalars()
+    ]
+
+async def get_channel_summary(db: AsyncSession, date_from: Optional[date] = None, date_to: Optional[date] = None):
+    """Per-channel totals and media share over a date range."""
+    query = (
+        select(
+            ChannelDailyRollup.channel_username,
+            func.max(ChannelDailyRollup.channel_title).label("channel_title"),
+            func.count().label("days"),
+            func.sum(ChannelDailyRollup.total_messages).label("total_messages"),
+            func.sum(ChannelDailyRollup.total_media).label("total_media"),
+        )
+        .where(*rollup_filters(ChannelDailyRollup, None, date_from, date_to))
+        .group_by(ChannelDailyRollup.channel_username)
+        .order_by(func.sum(ChannelDailyRollup.total_messages).desc())
+    )
+    result = await db.execute(query)
+    return [
+        dict(row._mapping, media_share=media_share(row.total_media, row.total_messages))
+        for row in result
+    ]
+
+async def get_top_classes(
+    db: AsyncSession,
+    channel_username: Optional[str] = None,
+    date_from: Optional[date] = None,
+    date_to: Optional[date] = None,
+    limit: int = 10,
+):
+    """Most detected classes, optionally for one channel and date range."""
+    detections = func.sum(ChannelDailyClassRollup.detections)
+    query = (
+        select(
+            ChannelDailyClassRollup.class_id,
+            detections.label("detections"),
+            func.sum(ChannelDailyClassRollup.images).label("images"),
+            (func.sum(ChannelDailyClassRollup.confidence_sum) / detections).label("avg_confidence"),
+        )
+        .where(*rollup_filters(ChannelDailyClassRollup, channel_username, date_from, date_to))
+        .group_by(ChannelDailyClassRollup.class_id)
+        .order_by(detections.desc(), ChannelDailyClassRollup.class_id)
+        .limit(limit)
+    )
+    result = await db.execute(query)
+    return [dict(row._mapping) for row in result]
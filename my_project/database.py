@@ -1,8 +1,17 @@
-from sqlalchemy import create_engine
+from contextlib import asynccontextmanager
+from sqlalchemy.engine import make_url
+from sqlalchemy.ext.asyncio import AsyncSession, async_sessionmaker, create_async_engine
 from sqlalchemy.ext.declarative import as_declarative
-from sqlalchemy.orm import sessionmaker
 from dotenv import load_dotenv
 import os
+import sys
+import time
+
+# The metrics registry lives in scripts/ and is shared with the batch scripts
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), "..")))
+
+from scripts import migrations
+from scripts.metrics import REGISTRY
 
 # Load environment variables
 load_dotenv()
@@ -13,21 +22,144 @@ DB_USER = os.getenv("DB_USER")
 DB_PASSWORD = os.getenv("DB_PASSWORD")
 DB_PORT = os.getenv("DB_PORT")
 
-DATABASE_URL = f"postgresql://{DB_USER}:{DB_PASSWORD}@{DB_HOST}:{DB_PORT}/{DB_NAME}"
+# DATABASE_URL overrides the DB_* settings (e.g. a local SQLite stand-in for benchmarks)
+DATABASE_URL = os.getenv("DATABASE_URL") or f"postgresql://{DB_USER}:{DB_PASSWORD}@{DB_HOST}:{DB_PORT}/{DB_NAME}"
+
+# Connection pool settings
+DB_POOL_SIZE = int(os.getenv("DB_POOL_SIZE", "10"))
+DB_MAX_OVERFLOW = int(os.getenv("DB_MAX_OVERFLOW", "20"))
+DB_POOL_TIMEOUT = float(os.getenv("DB_POOL_TIMEOUT", "30"))
+DB_POOL_RECYCLE = int(os.getenv("DB_POOL_RECYCLE", "1800"))
+DB_POOL_PRE_PING = os.getenv("DB_POOL_PRE_PING", "true").lower() in ("1", "true", "yes")
+
+# Async drivers for the plain URL schemes
+ASYNC_DRIVERS = {"postgresql": "postgresql+asyncpg", "sqlite": "sqlite+aiosqlite"}
+
+def async_url(url):
+    """Switch a database URL to its async driver, e.g. postgresql:// -> postgresql+asyncpg://."""
+    url = make_url(url)
+    if url.drivername in ASYNC_DRIVERS:
+        url = url.set(drivername=ASYNC_DRIVERS[url.drivername])
+    elif url.drivername.startswith("postgresql+"):
+        url = url.set(drivername="postgresql+asyncpg")
+    return url
 
-# Set up SQLAlchemy engine and session
-engine = create_engine(DATABASE_URL)
-SessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
+# Set up SQLAlchemy async engine and session
+engine = create_async_engine(
+    async_url(DATABASE_URL),
+    pool_size=DB_POOL_SIZE,
+    max_overflow=DB_MAX_OVERFLOW,
+    pool_timeout=DB_POOL_TIMEOUT,
+    pool_recycle=DB_POOL_RECYCLE,
+    pool_pre_ping=DB_POOL_PRE_PING,
+)
+SessionLocal = async_sessionmaker(engine, class_=AsyncSession, autoflush=False, expire_on_commit=False)
 
 # Base class for models
 @as_declarative()
 class Base:
     pass
 
+class PoolStats:
+    """Running totals of how long requests waited to check out a pooled connection."""
+
+    def __init__(self):
+        self.reset()
+
+    def reset(self):
+        self.checkouts = 0
+        self.total_wait = 0.0
+        self.max_wait = 0.0
+
+    def record(self, seconds):
+        self.checkouts += 1
+        self.total_wait += seconds
+        self.max_wait = max(self.max_wait, seconds)
+
+    def snapshot(self):
+        pool = engine.pool
+        return {
+            "checkouts": self.checkouts,
+            "avg_wait_ms": round(self.total_wait / self.checkouts * 1000, 3) if self.checkouts else 0.0,
+            "max_wait_ms": round(self.max_wait * 1000, 3),
+            "pool_size": DB_POOL_SIZE,
+            "max_overflow": DB_MAX_OVERFLOW,
+            "checked_out": pool.checkedout() if hasattr(pool, "checkedout") else None,
+            "overflow": pool.overflow() if hasattr(pool, "overflow") else None,
+        }
+
+pool_stats = PoolStats()
+
+POOL_WAIT_SECONDS = REGISTRY.histogram("db_pool_wait_seconds", "Time a request waited to check out a pooled connection.")
+
+@asynccontextmanager
+async def session_scope():
+    """Open a session with its connection already checked out."""
+    async with SessionLocal() as db:
+        # Check the connection out up front so the pool wait is measured on its own
+        start = time.perf_counter()
+        await db.connection()
+        waited = time.perf_counter() - start
+        pool_stats.record(waited)
+        POOL_WAIT_SECONDS.observe(waited)
+        yield db
+
+# Months whose telegram_messages partition is known to exist, so writes skip the catalog check
+known_partition_months = set()
+
+def create_message_partitions(connection, months):
+    """
+    Sync part of ensure_message_partitions: create the missing monthly partitions
+    and return the months whose partitions already existed.
+    """
+    if not migrations.is_partitioned(connection):
+        return set()
+    existing = set(migrations.list_month_partitions(connection))
+    migrations.ensure_month_partitions(connection, months)
+    return existing & months
+
+async def ensure_message_partitions(connection, months):
+    """
+    Create the monthly telegram_messages partitions of the given months (PostgreSQL only),
+    so new rows land in them rather than in the DEFAULT partition.
+
+    The DDL runs on `connection`, an AsyncConnection or AsyncSession, inside its
+    transaction: ATTACH PARTITION locks the DEFAULT partition, which a separate
+    connection could not get while that transaction has written to the table.
+    """
+    months = {migrations.month_start(month) for month in months} - known_partition_months
+    session = isinstance(connection, AsyncSession)
+    dialect = connection.get_bind().dialect if session else connection.dialect
+    if not months or dialect.name != "postgresql":
+        return
+    if session:
+        existing = await connection.run_sync(lambda sync_session: create_message_partitions(sync_session.connection(), months))
+    else:
+        existing = await connection.run_sync(create_message_partitions, months)
+    # Partitions created just now only count once they are seen committed
+    known_partition_months.update(existing)
+
+async def prepare_schema(bind=None):
+    """
+    Bring the schema up to date on startup.
+
+    PostgreSQL gets the migrations in scripts/migrations.py (the partitioned
+    telegram_messages table needs PostgreSQL 13+) and the partitions of the
+    coming months; create_all would create a plain table that the partitioning
+    migration then has to rebuild. Other databases (SQLite stand-ins for tests
+    and benchmarks) get the models' tables.
+    """
+    bind = bind or engine
+    if bind.dialect.name == "postgresql":
+        async with bind.connect() as connection:
+            await connection.run_sync(lambda sync_connection: migrations.migrate(sync_connection.engine))
+        async with bind.begin() as connection:
+            await ensure_message_partitions(connection, migrations.upcoming_months())
+    else:
+        async with bind.begin() as connection:
+            await connection.run_sync(Base.metadata.create_all)
+
 # Dependency to get DB session
-def get_db():
-    db = SessionLocal()
-    try:
+async def get_db():
+    async with session_scope() as db:
         yield db
-    finally:
-        db.close()
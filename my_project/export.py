@@ -0,0 +1,133 @@
+import csv
+import io
+import json
+from datetime import date, datetime
+from fastapi.responses import StreamingResponse
+from sqlalchemy import Float, Integer, TIMESTAMP
+
+# Rows fetched from the server-side cursor and serialized per chunk
+EXPORT_BATCH_SIZE = 5000
+
+
+def _json_default(value):
+    if isinstance(value, (datetime, date)):
+        return value.isoformat()
+    raise TypeError(f"{type(value).__name__} is not JSON serializable")
+
+
+class NDJSONEncoder:
+    media_type = "application/x-ndjson"
+    extension = "ndjson"
+
+    def __init__(self, query):
+        self.columns = [column.name for column in query.selected_columns]
+
+    def start(self):
+        return b""
+
+    def encode(self, rows):
+        return "".join(
+            json.dumps(dict(zip(self.columns, row)), default=_json_default, ensure_ascii=False) + "\n"
+            for row in rows
+        ).encode()
+
+    def finish(self):
+        return b""
+
+
+class CSVEncoder:
+    media_type = "text/csv"
+    extension = "csv"
+
+    def __init__(self, query):
+        self.columns = [column.name for column in query.selected_columns]
+        self.buffer = io.StringIO()
+        self.writer = csv.writer(self.buffer)
+
+    def _drain(self):
+        data = self.buffer.getvalue().encode()
+        self.buffer.seek(0)
+        self.buffer.truncate()
+        return data
+
+    def start(self):
+        self.writer.writerow(self.columns)
+        return self._drain()
+
+    def encode(self, rows):
+        self.writer.writerows(rows)
+        return self._drain()
+
+    def finish(self):
+        return b""
+
+
+class ArrowEncoder:
+    """Arrow IPC stream: the schema, one record batch per chunk of rows, then the end-of-stream marker."""
+
+    media_type = "application/vnd.apache.arrow.stream"
+    extension = "arrows"
+
+    def __init__(self, query):
+        import pyarrow as pa
+
+        self.pa = pa
+        self.schema = pa.schema([(column.name, self.arrow_type(column.type)) for column in query.selected_columns])
+        self.sink = io.BytesIO()
+        self.writer = None
+
+    def arrow_type(self, sql_type):
+        if isinstance(sql_type, Integer):
+            return self.pa.int64()
+        if isinstance(sql_type, Float):
+            return self.pa.float64()
+        if isinstance(sql_type, TIMESTAMP):
+            return self.pa.timestamp("us")
+        return self.pa.string()
+
+    def _drain(self):
+        data = self.sink.getvalue()
+        self.sink.seek(0)
+        self.sink.truncate()
+        return data
+
+    def start(self):
+        self.writer = self.pa.ipc.new_stream(self.sink, self.schema)
+        return self._drain()
+
+    def encode(self, rows):
+        columns = list(zip(*rows))
+        arrays = [self.pa.array(values, type=field.type) for values, field in zip(columns, self.schema)]
+        self.writer.write_batch(self.pa.record_batch(arrays, schema=self.schema))
+        return self._drain()
+
+    def finish(self):
+        self.writer.close()
+        return self._drain()
+
+
+ENCODERS = {"ndjson": NDJSONEncoder, "csv": CSVEncoder, "arrow": ArrowEncoder}
+
+
+def stream_export(engine, query, format, name):
+    """
+    Stream the rows of a Core select as NDJSON, CSV or Arrow IPC.
+
+    Rows are read through a server-side cursor EXPORT_BATCH_SIZE at a time and
+    serialized as plain tuples, so memory does not grow with the export size.
+    """
+    encoder = ENCODERS[format](query)
+
+    async def body():
+        yield encoder.start()
+        async with engine.connect() as connection:
+            result = await connection.stream(query.execution_options(yield_per=EXPORT_BATCH_SIZE))
+            async for rows in result.partitions():
+                yield encoder.encode(rows)
+        yield encoder.finish()
+
+    return StreamingResponse(
+        body(),
+        media_type=encoder.media_type,
+        headers={"Content-Disposition": f'attachment; filename="{name}.{encoder.extension}"'},
+    )
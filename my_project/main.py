@@ -1,27 +1,279 @@
-from fastapi import FastAPI, Depends, HTTPException
-from sqlalchemy.orm import Session
-from database import engine, Base, get_db
-from schemas import TelegramMessageOut, TelegramMessageCreate, DetectedObjectOut, DetectedObjectCreate
+import json
+import time
+from contextlib import asynccontextmanager
+from operator import attrgetter
+from datetime import date, datetime
+from typing import Literal, Optional
+from fastapi import FastAPI, Depends, HTTPException, Query, Request
+from fastapi.encoders import jsonable_encoder
+from fastapi.responses import PlainTextResponse
+from pydantic import ValidationError
+from sqlalchemy.ext.asyncio import AsyncSession
+from cache import cache_from_env
+from database import engine, get_db, pool_stats, prepare_schema, session_scope
+from export import stream_export
+from scripts.metrics import REGISTRY
+from schemas import TelegramMessageOut, TelegramMessageCreate, DetectedObjectOut, DetectedObjectCreate, BulkInsertSummary
+from schemas import ChannelDailyOut, ChannelSummaryOut, ClassCountOut, SearchResultOut
 import crud
 
-# Initialize the app and create database tables
-app = FastAPI(title="EthioMed Data Warehouse API")
-Base.metadata.create_all(bind=engine)
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    # Migrate the schema on startup and release pooled connections on shutdown
+    await prepare_schema()
+    yield
+    await engine.dispose()
+
+# Initialize the app
+app = FastAPI(title="EthioMed Data Warehouse API", lifespan=lifespan)
+
+# Read-through cache for the GET endpoints, invalidated by the POST endpoints
+response_cache = cache_from_env()
+
+REQUEST_SECONDS = REGISTRY.histogram(
+    "api_request_seconds", "Handler latency until the response starts, by route.", ["method", "route", "status"]
+)
+
+@app.middleware("http")
+async def record_request_latency(request: Request, call_next):
+    start = time.perf_counter()
+    response = await call_next(request)
+    # The route template keeps one series per endpoint rather than per URL
+    route = request.scope.get("route")
+    REQUEST_SECONDS.observe(
+        time.perf_counter() - start,
+        method=request.method, route=route.path if route else "unmatched", status=response.status_code,
+    )
+    return response
+
+# Header carrying the cursor for the next page; absent on the last page
+NEXT_CURSOR_HEADER = "X-Next-Cursor"
+
+def page_content(rows: list, schema, limit: int):
+    """Serialize a page of rows and build its next-cursor header."""
+    headers = {NEXT_CURSOR_HEADER: str(rows[-1].id)} if len(rows) == limit else {}
+    return jsonable_encoder([schema.from_orm(row) for row in rows]), headers
+
+# Batch bodies are a JSON array, or one JSON object per line with an NDJSON content type
+NDJSON_MEDIA_TYPES = ("application/x-ndjson", "application/ndjson", "application/jsonl")
+BULK_INSERT_BATCH_SIZE = 1000
+
+async def iter_body_items(request: Request):
+    """Yield the objects of a batch body; NDJSON is parsed as it streams in."""
+    if request.headers.get("content-type", "").split(";")[0].strip() in NDJSON_MEDIA_TYPES:
+        buffer = b""
+        async for chunk in request.stream():
+            buffer += chunk
+            *lines, buffer = buffer.split(b"\n")
+            for line in lines:
+                if line.strip():
+                    yield json.loads(line)
+        if buffer.strip():
+            yield json.loads(buffer)
+    else:
+        items = await request.json()
+        if not isinstance(items, list):
+            raise HTTPException(status_code=422, detail="Expected a JSON array")
+        for item in items:
+            yield item
+
+async def bulk_create(request: Request, db: AsyncSession, schema, insert_rows, rollup_key, refresh_rollups):
+    """
+    Validate a batch body and insert it in one transaction, BULK_INSERT_BATCH_SIZE rows per statement.
+
+    rollup_key maps each item to what refresh_rollups takes to recompute the rollup
+    rows it counts in; they are refreshed once, just before the commit.
+    """
+    received = inserted = 0
+    batch = []
+    touched = set()
+    try:
+        async for item in iter_body_items(request):
+            try:
+                batch.append(schema(**item))
+            except (ValidationError, TypeError) as e:
+                raise HTTPException(status_code=422, detail=f"Item {received}: {e}")
+            touched.add(rollup_key(batch[-1]))
+            received += 1
+            if len(batch) == BULK_INSERT_BATCH_SIZE:
+                inserted += await insert_rows(db, batch)
+                batch = []
+    except json.JSONDecodeError as e:
+        raise HTTPException(status_code=400, detail=f"Invalid JSON after item {received}: {e}")
+    inserted += await insert_rows(db, batch)
+    if inserted:
+        await refresh_rollups(db, touched - {None})
+    await db.commit()
+    return BulkInsertSummary(received=received, inserted=inserted, skipped=received - inserted)
 
 # TelegramMessage Endpoints
 @app.get("/telegram_messages", response_model=list[TelegramMessageOut])
-def read_telegram_messages(skip: int = 0, limit: int = 10, db: Session = Depends(get_db)):
-    return crud.get_telegram_messages(db, skip=skip, limit=limit)
+async def read_telegram_messages(
+    request: Request,
+    limit: int = Query(10, ge=1, le=1000),
+    cursor: Optional[int] = None,
+    channel_username: Optional[str] = None,
+    date_from: Optional[datetime] = None,
+    date_to: Optional[datetime] = None,
+):
+    params = dict(limit=limit, cursor=cursor, channel_username=channel_username, date_from=date_from, date_to=date_to)
+
+    async def load():
+        async with session_scope() as db:
+            messages = await crud.get_telegram_messages(db, **params)
+        return page_content(messages, TelegramMessageOut, limit)
+
+    return await response_cache.serve(request, "telegram_messages", params, load)
 
 @app.post("/telegram_messages", response_model=TelegramMessageOut)
-def create_telegram_message(message: TelegramMessageCreate, db: Session = Depends(get_db)):
-    return crud.create_telegram_message(db, message)
+async def create_telegram_message(message: TelegramMessageCreate, db: AsyncSession = Depends(get_db)):
+    db_message = await crud.create_telegram_message(db, message)
+    await response_cache.invalidate("telegram_messages")
+    await response_cache.invalidate("analytics")
+    return db_message
+
+@app.post("/telegram_messages/batch", response_model=BulkInsertSummary)
+async def create_telegram_messages(request: Request, db: AsyncSession = Depends(get_db)):
+    summary = await bulk_create(
+        request, db, TelegramMessageCreate, crud.insert_telegram_messages,
+        crud.message_rollup_key, crud.refresh_message_rollups,
+    )
+    if summary.inserted:
+        await response_cache.invalidate("telegram_messages")
+        await response_cache.invalidate("analytics")
+    return summary
+
+# Full-text search over message text; the next page's offset comes in X-Next-Offset
+NEXT_OFFSET_HEADER = "X-Next-Offset"
+
+@app.get("/search", response_model=list[SearchResultOut])
+async def search_telegram_messages(
+    request: Request,
+    q: str = Query(..., min_length=1, max_length=200),
+    limit: int = Query(10, ge=1, le=100),
+    offset: int = Query(0, ge=0, le=10000),
+    channel_username: Optional[str] = None,
+    date_from: Optional[datetime] = None,
+    date_to: Optional[datetime] = None,
+):
+    params = dict(q=q, limit=limit, offset=offset, channel_username=channel_username, date_from=date_from, date_to=date_to)
+
+    async def load():
+        async with session_scope() as db:
+            hits = await crud.search_telegram_messages(db, **params)
+        content = [
+            dict(jsonable_encoder(TelegramMessageOut.from_orm(message)), rank=rank)
+            for message, rank in hits
+        ]
+        headers = {NEXT_OFFSET_HEADER: str(offset + limit)} if len(hits) == limit else {}
+        return content, headers
+
+    # Cached with the message list, so new messages invalidate search results too
+    return await response_cache.serve(request, "telegram_messages", params, load)
 
 # DetectedObject Endpoints
 @app.get("/detected_objects", response_model=list[DetectedObjectOut])
-def read_detected_objects(skip: int = 0, limit: int = 10, db: Session = Depends(get_db)):
-    return crud.get_detected_objects(db, skip=skip, limit=limit)
+async def read_detected_objects(
+    request: Request,
+    limit: int = Query(10, ge=1, le=1000),
+    cursor: Optional[int] = None,
+    class_id: Optional[int] = None,
+    min_confidence: Optional[float] = None,
+):
+    params = dict(limit=limit, cursor=cursor, class_id=class_id, min_confidence=min_confidence)
+
+    async def load():
+        async with session_scope() as db:
+            detected_objects = await crud.get_detected_objects(db, **params)
+        return page_content(detected_objects, DetectedObjectOut, limit)
+
+    return await response_cache.serve(request, "detected_objects", params, load)
 
 @app.post("/detected_objects", response_model=DetectedObjectOut)
-def create_detected_object(detected_object: DetectedObjectCreate, db: Session = Depends(get_db)):
-    return crud.create_detected_object(db, detected_object)
+async def create_detected_object(detected_object: DetectedObjectCreate, db: AsyncSession = Depends(get_db)):
+    db_object = await crud.create_detected_object(db, detected_object)
+    await response_cache.invalidate("detected_objects")
+    await response_cache.invalidate("analytics")
+    return db_object
+
+@app.post("/detected_objects/batch", response_model=BulkInsertSummary)
+async def create_detected_objects(request: Request, db: AsyncSession = Depends(get_db)):
+    summary = await bulk_create(
+        request, db, DetectedObjectCreate, crud.insert_detected_objects,
+        attrgetter("image_name"), crud.refresh_detection_rollups,
+    )
+    if summary.inserted:
+        await response_cache.invalidate("detected_objects")
+        await response_cache.invalidate("analytics")
+    return summary
+
+# Analytics Endpoints, answered from the rollup tables (cached under "analytics")
+async def serve_analytics(request: Request, params: dict, query):
+    async def load():
+        async with session_scope() as db:
+            rows = await query(db, **params)
+        return jsonable_encoder(rows), {}
+
+    return await response_cache.serve(request, "analytics", params, load)
+
+@app.get("/analytics/channels", response_model=list[ChannelSummaryOut])
+async def read_channel_summary(request: Request, date_from: Optional[date] = None, date_to: Optional[date] = None):
+    return await serve_analytics(request, dict(date_from=date_from, date_to=date_to), crud.get_channel_summary)
+
+@app.get("/analytics/channels/daily", response_model=list[ChannelDailyOut])
+async def read_channel_daily(
+    request: Request,
+    channel_username: Optional[str] = None,
+    date_from: Optional[date] = None,
+    date_to: Optional[date] = None,
+):
+    params = dict(channel_username=channel_username, date_from=date_from, date_to=date_to)
+    return await serve_analytics(request, params, crud.get_channel_daily)
+
+@app.get("/analytics/classes/top", response_model=list[ClassCountOut])
+async def read_top_classes(
+    request: Request,
+    channel_username: Optional[str] = None,
+    date_from: Optional[date] = None,
+    date_to: Optional[date] = None,
+    limit: int = Query(10, ge=1, le=100),
+):
+    params = dict(channel_username=channel_username, date_from=date_from, date_to=date_to, limit=limit)
+    return await serve_analytics(request, params, crud.get_top_classes)
+
+# Streaming exports
+ExportFormat = Literal["ndjson", "csv", "arrow"]
+
+@app.get("/export/telegram_messages")
+async def export_telegram_messages(
+    format: ExportFormat = "ndjson",
+    channel_username: Optional[str] = None,
+    date_from: Optional[datetime] = None,
+    date_to: Optional[datetime] = None,
+):
+    query = crud.export_telegram_messages_query(channel_username, date_from, date_to)
+    return stream_export(engine, query, format, "telegram_messages")
+
+@app.get("/export/detected_objects")
+async def export_detected_objects(
+    format: ExportFormat = "ndjson",
+    class_id: Optional[int] = None,
+    min_confidence: Optional[float] = None,
+):
+    query = crud.export_detected_objects_query(class_id, min_confidence)
+    return stream_export(engine, query, format, "detected_objects")
+
+# Connection pool monitoring
+@app.get("/pool_stats")
+async def read_pool_stats():
+    return pool_stats.snapshot()
+
+# Response cache monitoring
+@app.get("/cache_stats")
+async def read_cache_stats():
+    return response_cache.stats()
+
+# Prometheus scrape target (per worker process)
+@app.get("/metrics", response_class=PlainTextResponse)
+async def read_metrics():
+    return PlainTextResponse(REGISTRY.render(), media_type="text/plain; version=0.0.4; charset=utf-8")
@@ -1,8 +1,13 @@
-from sqlalchemy import Column, Integer, String, Float, Text, TIMESTAMP
+from sqlalchemy import BigInteger, Column, Integer, String, Float, Text, TIMESTAMP, Date, Index
 from database import Base
 
 class TelegramMessage(Base):
     __tablename__ = "telegram_messages"
+    # Support keyset pagination (ORDER BY id) under the channel and date filters
+    __table_args__ = (
+        Index("ix_telegram_messages_channel_username_id", "channel_username", "id"),
+        Index("ix_telegram_messages_message_date_id", "message_date", "id"),
+    )
 
     id = Column(Integer, primary_key=True, index=True)
     channel_title = Column(Text, nullable=False)
@@ -13,9 +18,17 @@ class TelegramMessage(Base):
     media_path = Column(Text, nullable=True)
     emoji_used = Column(Text, nullable=True)
     youtube_links = Column(Text, nullable=True)
+    # Near-duplicate cluster and its first message, tagged by the cleaning stage
+    cluster_id = Column(BigInteger, nullable=True)
+    canonical_message_id = Column(BigInteger, nullable=True)
 
 class DetectedObject(Base):
     __tablename__ = "detected_objects"
+    # Support keyset pagination (ORDER BY id) under the class and confidence filters
+    __table_args__ = (
+        Index("ix_detected_objects_class_id_id", "class_id", "id"),
+        Index("ix_detected_objects_confidence_id", "confidence", "id"),
+    )
 
     id = Column(Integer, primary_key=True, index=True)
     image_name = Column(String, nullable=False)
@@ -26,3 +39,23 @@ class DetectedObject(Base):
     height = Column(Float, nullable=False)
     confidence = Column(Float, nullable=False)
     detection_timestamp = Column(TIMESTAMP, default=None)
+
+# Rollups maintained by DatabaseManager.refresh_rollups after each load and by the API write endpoints
+class ChannelDailyRollup(Base):
+    __tablename__ = "channel_daily_rollup"
+
+    channel_username = Column(Text, primary_key=True)
+    message_day = Column(Date, primary_key=True)
+    channel_title = Column(Text, nullable=True)
+    total_messages = Column(Integer, nullable=False)
+    total_media = Column(Integer, nullable=False)
+
+class ChannelDailyClassRollup(Base):
+    __tablename__ = "channel_daily_class_rollup"
+
+    channel_username = Column(Text, primary_key=True)
+    message_day = Column(Date, primary_key=True)
+    class_id = Column(Integer, primary_key=True)
+    detections = Column(Integer, nullable=False)
+    images = Column(Integer, nullable=False)
+    confidence_sum = Column(Float, nullable=False)
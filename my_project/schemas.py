@@ -1,6 +1,6 @@
 from pydantic import BaseModel
 from typing import Optional
-from datetime import datetime
+from datetime import date, datetime
 
 # Schema for TelegramMessage
 class TelegramMessageBase(BaseModel):
@@ -12,6 +12,8 @@ class TelegramMessageBase(BaseModel):
     media_path: Optional[str]
     emoji_used: Optional[str]
     youtube_links: Optional[str]
+    cluster_id: Optional[int] = None
+    canonical_message_id: Optional[int] = None
 
 class TelegramMessageCreate(TelegramMessageBase):
     pass
@@ -21,6 +23,13 @@ class TelegramMessageOut(TelegramMessageBase):
 
     class Config:
         orm_mode = True
+        # Pydantic v2 name of orm_mode, needed by from_orm there
+        from_attributes = True
+
+
+# Search hit: a message and its relevance rank
+class SearchResultOut(TelegramMessageOut):
+    rank: float
 
 
 # Schema for DetectedObject
@@ -42,3 +51,35 @@ class DetectedObjectOut(DetectedObjectBase):
 
     class Config:
         orm_mode = True
+        # Pydantic v2 name of orm_mode, needed by from_orm there
+        from_attributes = True
+
+
+# Summary returned by the batch create endpoints
+class BulkInsertSummary(BaseModel):
+    received: int
+    inserted: int
+    skipped: int
+
+
+# Schemas for the analytics endpoints
+class ChannelDailyOut(BaseModel):
+    channel_username: str
+    message_day: date
+    total_messages: int
+    total_media: int
+    media_share: float
+
+class ChannelSummaryOut(BaseModel):
+    channel_username: str
+    channel_title: Optional[str]
+    days: int
+    total_messages: int
+    total_media: int
+    media_share: float
+
+class ClassCountOut(BaseModel):
+    class_id: int
+    detections: int
+    images: int
+    avg_confidence: float
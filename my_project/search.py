@@ -0,0 +1,93 @@
+import math
+import re
+from collections import defaultdict
+
+# Amharic writes the same sound with several letter families (ሀ/ሐ/ኀ, ሰ/ሠ, አ/ዐ, ጸ/ፀ) and
+# spellings vary between posts, so each family is folded onto one. A family is seven
+# consecutive code points, one per vowel order
+HOMOPHONE_FAMILIES = {"ሐ": "ሀ", "ኀ": "ሀ", "ሠ": "ሰ", "ዐ": "አ", "ፀ": "ጸ"}
+# Ethiopic word space, full stop, comma, colons, question mark and paragraph separator
+ETHIOPIC_PUNCTUATION = "፠፡።፣፤፥፦፧፨"
+
+FOLD_FROM = "".join(chr(ord(family) + order) for family in HOMOPHONE_FAMILIES for order in range(7))
+FOLD_FROM += ETHIOPIC_PUNCTUATION
+FOLD_TO = "".join(chr(ord(base) + order) for base in HOMOPHONE_FAMILIES.values() for order in range(7))
+FOLD_TO += " " * len(ETHIOPIC_PUNCTUATION)
+FOLD_TABLE = str.maketrans(FOLD_FROM, FOLD_TO)
+
+# Letters and digits of any script; Ethiopic punctuation is not \w
+TOKEN_PATTERN = re.compile(r"\w+")
+
+
+def fold(text):
+    """Lowercase, fold Amharic homophone letters and turn Ethiopic punctuation into spaces."""
+    return (text or "").lower().translate(FOLD_TABLE)
+
+
+def tokenize(text):
+    return TOKEN_PATTERN.findall(fold(text))
+
+
+class InvertedIndex:
+    """
+    In-process inverted index over message text, the search fallback where the
+    database has no full-text search (SQLite test databases).
+
+    Tokens are folded like the PostgreSQL search_vector column but not stemmed,
+    so only exact words match. Every query term must match; documents are
+    ranked by TF-IDF. Rows are added in id order and `last_id` tracks how far
+    the index has read, so it can be topped up with newer rows only.
+    """
+
+    def __init__(self):
+        self.postings = defaultdict(dict)
+        self.documents = {}
+        self.last_id = 0
+
+    def add(self, id, text, channel_username=None, message_date=None):
+        counts = defaultdict(int)
+        for token in tokenize(text):
+            counts[token] += 1
+        for token, count in counts.items():
+            self.postings[token][id] = count
+        self.documents[id] = (channel_username, message_date, sum(counts.values()))
+        self.last_id = max(self.last_id, id)
+
+    def clear(self):
+        self.postings.clear()
+        self.documents.clear()
+        self.last_id = 0
+
+    def _matches(self, id, channel_username, date_from, date_to):
+        channel, message_date, _ = self.documents[id]
+        if channel_username is not None and channel != channel_username:
+            return False
+        if date_from is not None and (message_date is None or message_date < date_from):
+            return False
+        if date_to is not None and (message_date is None or message_date >= date_to):
+            return False
+        return True
+
+    def search(self, query, limit=10, offset=0, channel_username=None, date_from=None, date_to=None):
+        """Return [(id, rank)] for one page, best rank first and ties by id."""
+        terms = set(tokenize(query))
+        if not terms or any(term not in self.postings for term in terms):
+            return []
+
+        # Intersect starting from the rarest term
+        postings = sorted((self.postings[term] for term in terms), key=len)
+        candidates = set(postings[0])
+        for posting in postings[1:]:
+            candidates &= posting.keys()
+
+        total = len(self.documents)
+        idf = [math.log(1 + total / len(posting)) for posting in postings]
+        ranked = []
+        for id in candidates:
+            if not self._matches(id, channel_username, date_from, date_to):
+                continue
+            length = self.documents[id][2]
+            rank = sum(posting[id] * weight for posting, weight in zip(postings, idf)) / (1 + math.log(length))
+            ranked.append((id, round(rank, 6)))
+        ranked.sort(key=lambda item: (-item[1], item[0]))
+        return ranked[offset:offset + limit]
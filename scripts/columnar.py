@@ -0,0 +1,302 @@
+import argparse
+import logging
+import os
+import sys
+import uuid
+from datetime import datetime
+
+import numpy as np
+import pandas as pd
+import pyarrow as pa
+import pyarrow.compute as pc
+import pyarrow.dataset as ds
+import pyarrow.parquet as pq
+
+# Allow running as `python scripts/columnar.py` as well as importing from the project root
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), "..")))
+
+# Channel names repeat on every row, so they are dictionary-encoded
+CHANNEL = pa.dictionary(pa.int32(), pa.string())
+TIMESTAMP = pa.timestamp("us", tz="UTC")
+
+# Rows written by TelegramScraper (the CSV_HEADER columns, typed)
+RAW_SCHEMA = pa.schema([
+    ("channel_title", CHANNEL),
+    ("channel_username", CHANNEL),
+    ("message_id", pa.int64()),
+    ("message", pa.string()),
+    ("message_date", TIMESTAMP),
+    ("media_path", pa.string()),
+])
+
+# Rows written by DataCleaner and loaded by DatabaseManager
+CLEANED_SCHEMA = pa.schema([
+    ("channel_title", CHANNEL),
+    ("channel_username", CHANNEL),
+    ("message_id", pa.int64()),
+    ("message", pa.string()),
+    ("message_date", TIMESTAMP),
+    ("media_path", pa.string()),
+    ("emoji_used", pa.string()),
+    ("cluster_id", pa.int64()),
+    ("canonical_message_id", pa.int64()),
+])
+
+# media_path of cleaned rows whose message has no media
+NO_MEDIA = "No Media"
+
+# Raw CSV header names of the raw schema's columns, as DataCleaner expects them
+RAW_CSV_COLUMNS = {
+    "channel_title": "Channel Title",
+    "channel_username": "Channel Username",
+    "message_id": "ID",
+    "message": "Message",
+    "message_date": "Date",
+    "media_path": "Media Path",
+}
+
+# Files are partitioned by month in hive-style directories (message_month=2024-01), like the
+# monthly partitions of telegram_messages; rows without a date go to the default partition
+PARTITION_FIELD = "message_month"
+PARTITIONING = ds.partitioning(pa.schema([(PARTITION_FIELD, pa.string())]), flavor="hive")
+NULL_PARTITION = "__HIVE_DEFAULT_PARTITION__"
+
+
+def is_dataset_path(path):
+    """ True for paths of the columnar format (a .parquet dataset directory). """
+    return str(path).rstrip("/").endswith(".parquet")
+
+
+def to_table(df, schema):
+    """ Convert a DataFrame to an Arrow table of the schema; missing columns become nulls. """
+    df = df.reindex(columns=schema.names)
+    for field in schema:
+        if pa.types.is_timestamp(field.type):
+            df[field.name] = pd.to_datetime(df[field.name], errors="coerce", utc=True)
+        elif pa.types.is_integer(field.type):
+            df[field.name] = pd.to_numeric(df[field.name], errors="coerce").astype("Int64")
+    return pa.Table.from_pandas(df, schema=schema, preserve_index=False)
+
+
+def write_table(base_dir, table, row_group_rows=100000):
+    """
+    Append a table to a dataset directory as one new file per month.
+
+    Rows are sorted by channel and message ID and each channel gets its own
+    row groups, so filters on channel_username or message_id skip whole row
+    groups from their statistics. Returns the paths written.
+    """
+    if table.num_rows == 0:
+        return []
+    months = pc.strftime(table["message_date"], format="%Y-%m").fill_null(NULL_PARTITION)
+    # Dictionary columns cannot be sorted on, so the channel is decoded into a sort key
+    channels = pc.cast(table["channel_username"], pa.string()).fill_null("")
+    keys = pa.table({"month": months, "channel": channels, "message_id": table["message_id"]})
+    order = pc.sort_indices(keys, [("month", "ascending"), ("channel", "ascending"), ("message_id", "ascending")])
+    table, keys = table.take(order), keys.take(order)
+    token = uuid.uuid4().hex
+    paths = []
+    for month in pc.unique(keys["month"]).to_pylist():
+        mask = pc.equal(keys["month"], month)
+        part = table.filter(mask)
+        directory = os.path.join(base_dir, f"{PARTITION_FIELD}={month}")
+        os.makedirs(directory, exist_ok=True)
+        path = os.path.join(directory, f"part-{token}.parquet")
+        tmp_path = f"{path}.tmp"
+        # Each channel is one contiguous slice of the sorted rows
+        codes = pc.dictionary_encode(keys["channel"].filter(mask)).combine_chunks().indices.to_numpy()
+        boundaries = [0, *(np.flatnonzero(np.diff(codes)) + 1), len(codes)]
+        with pq.ParquetWriter(tmp_path, part.schema, compression="zstd") as writer:
+            for start, end in zip(boundaries, boundaries[1:]):
+                writer.write_table(part.slice(start, end - start), row_group_size=row_group_rows)
+        # Readers never see a half-written file
+        os.replace(tmp_path, path)
+        paths.append(path)
+    return paths
+
+
+def write_dataframe(base_dir, df, schema, row_group_rows=100000):
+    return write_table(base_dir, to_table(df, schema), row_group_rows)
+
+
+def dataset_files(base_dir):
+    """ Complete Parquet files of a dataset, in a stable order. """
+    files = []
+    for root, _, names in os.walk(base_dir):
+        files.extend(os.path.join(root, name) for name in names if name.endswith(".parquet"))
+    return sorted(files)
+
+
+def open_dataset(base_dir, schema, files=None):
+    """ The dataset at base_dir (or just the given files of it) with the schema plus message_month. """
+    files = dataset_files(base_dir) if files is None else list(files)
+    return ds.dataset(
+        files, schema=schema.append(pa.field(PARTITION_FIELD, pa.string())), format="parquet",
+        partitioning=PARTITIONING, partition_base_dir=base_dir,
+    )
+
+
+def date_filter(start=None, end=None, column="message_date"):
+    """
+    Filter rows with start <= column < end. The matching message_month
+    directories are pruned before any file is opened.
+    """
+    conditions = []
+    # Months sort as strings; the end month itself may still hold matching rows
+    if start is not None:
+        start = _utc(start)
+        conditions.append(ds.field(column) >= pa.scalar(start, TIMESTAMP))
+        conditions.append(ds.field(PARTITION_FIELD) >= start.strftime("%Y-%m"))
+    if end is not None:
+        end = _utc(end)
+        conditions.append(ds.field(column) < pa.scalar(end, TIMESTAMP))
+        conditions.append(ds.field(PARTITION_FIELD) <= end.strftime("%Y-%m"))
+    return all_of(conditions)
+
+
+def all_of(conditions):
+    """ AND together filter expressions, skipping None; None when nothing is left. """
+    expression = None
+    for condition in conditions:
+        if condition is not None:
+            expression = condition if expression is None else expression & condition
+    return expression
+
+
+def _utc(value):
+    value = pd.Timestamp(value)
+    value = value.tz_localize("UTC") if value.tzinfo is None else value.tz_convert("UTC")
+    return value.to_pydatetime()
+
+
+def _plain(table):
+    """ Decode dictionary columns so pandas gets strings rather than categoricals. """
+    return table.cast(pa.schema([
+        pa.field(field.name, field.type.value_type if pa.types.is_dictionary(field.type) else field.type)
+        for field in table.schema
+    ]))
+
+
+def read_dataframe(base_dir, schema, columns=None, filter=None, files=None):
+    """ Read the projected columns of rows matching the filter into a DataFrame. """
+    table = open_dataset(base_dir, schema, files).to_table(columns=columns or schema.names, filter=filter)
+    return _plain(table).to_pandas()
+
+
+def iter_dataframes(base_dir, schema, columns=None, filter=None, batch_size=100000, files=None):
+    """ Like read_dataframe, but yield DataFrames of up to batch_size rows, file by file. """
+    dataset = open_dataset(base_dir, schema, files)
+    for batch in dataset.to_batches(columns=columns or schema.names, filter=filter, batch_size=batch_size):
+        if batch.num_rows:
+            yield _plain(pa.Table.from_batches([batch])).to_pandas()
+
+
+def raw_dataframe(df):
+    """ Rename raw columns to the raw CSV header names that DataCleaner works with. """
+    return df.rename(columns=RAW_CSV_COLUMNS)
+
+
+class ColumnarWriter:
+    """
+    Writer for TelegramScraper rows with the file interface of the CSV output:
+    writerow() buffers a row, flush() writes the buffered rows as new Parquet
+    files and close() flushes. `buffered` tells how many rows are pending.
+    """
+
+    def __init__(self, base_dir, schema=RAW_SCHEMA, row_group_rows=50000):
+        self.base_dir = base_dir
+        self.schema = schema
+        self.row_group_rows = row_group_rows
+        self.rows = []
+        os.makedirs(base_dir, exist_ok=True)
+
+    @property
+    def buffered(self):
+        return len(self.rows)
+
+    def writerow(self, row):
+        self.rows.append(row)
+
+    def flush(self):
+        if not self.rows:
+            return
+        df = pd.DataFrame(self.rows, columns=self.schema.names)
+        write_dataframe(self.base_dir, df, self.schema, self.row_group_rows)
+        self.rows = []
+
+    def close(self):
+        self.flush()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+
+def convert_csv(csv_path, base_dir, raw=True, chunksize=200000):
+    """ Convert a raw (or cleaned) CSV into a dataset, chunk by chunk. Returns the rows written. """
+    schema = RAW_SCHEMA if raw else CLEANED_SCHEMA
+    rows = 0
+    try:
+        for chunk in pd.read_csv(csv_path, chunksize=chunksize, dtype=str):
+            if raw:
+                chunk = chunk.rename(columns={v: k for k, v in RAW_CSV_COLUMNS.items()})
+            write_dataframe(base_dir, chunk, schema)
+            rows += len(chunk)
+        logging.info(f"✅ Converted {rows} rows from '{csv_path}' to '{base_dir}'.")
+        return rows
+    except Exception as e:
+        logging.error(f"❌ Error converting '{csv_path}' to Parquet: {e}")
+        raise
+
+
+def export_csv(base_dir, csv_path, schema=CLEANED_SCHEMA, columns=None, filter=None, batch_size=100000):
+    """ Export a dataset (optionally projected and filtered) as CSV. Returns the rows written. """
+    rows = 0
+    try:
+        os.makedirs(os.path.dirname(os.path.abspath(csv_path)), exist_ok=True)
+        with open(csv_path, "w", newline="", encoding="utf-8") as f:
+            for df in iter_dataframes(base_dir, schema, columns, filter, batch_size):
+                df.to_csv(f, header=rows == 0, index=False)
+                rows += len(df)
+        logging.info(f"✅ Exported {rows} rows from '{base_dir}' to '{csv_path}'.")
+        return rows
+    except Exception as e:
+        logging.error(f"❌ Error exporting '{base_dir}' to CSV: {e}")
+        raise
+
+
+if __name__ == "__main__":
+    os.makedirs("logs", exist_ok=True)
+    logging.basicConfig(
+        filename="logs/columnar.log",
+        level=logging.INFO,
+        format="%(asctime)s - %(levelname)s - %(message)s"
+    )
+
+    parser = argparse.ArgumentParser(description="Convert between the CSV files and the Parquet datasets.")
+    commands = parser.add_subparsers(dest="command", required=True)
+    convert = commands.add_parser("convert", help="Convert a CSV file into a Parquet dataset.")
+    convert.add_argument("csv_path")
+    convert.add_argument("dataset")
+    convert.add_argument("--cleaned", action="store_true", help="The CSV is cleaned data rather than raw scraped data.")
+    export = commands.add_parser("export", help="Export a Parquet dataset as CSV.")
+    export.add_argument("dataset")
+    export.add_argument("csv_path")
+    export.add_argument("--raw", action="store_true", help="The dataset holds raw scraped data.")
+    export.add_argument("--columns", nargs="+", help="Columns to export (default: all).")
+    export.add_argument("--channel", help="Only rows of this channel username.")
+    export.add_argument("--date-from", type=datetime.fromisoformat)
+    export.add_argument("--date-to", type=datetime.fromisoformat)
+    args = parser.parse_args()
+
+    if args.command == "convert":
+        print(convert_csv(args.csv_path, args.dataset, raw=not args.cleaned))
+    else:
+        row_filter = all_of([
+            date_filter(args.date_from, args.date_to),
+            ds.field("channel_username") == args.channel if args.channel else None,
+        ])
+        schema = RAW_SCHEMA if args.raw else CLEANED_SCHEMA
+        print(export_csv(args.dataset, args.csv_path, schema, args.columns, row_filter))
@@ -1,13 +1,94 @@
 import pandas as pd
+import numpy as np
+import argparse
+import csv
+import hashlib
+import io
+import json
 import logging
 import re
 import os
-import emoji
+import shutil
+import sys
+
+# Allow running as `python scripts/data_cleaning.py` as well as importing from the project root
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), "..")))
+
+from scripts import columnar
+from scripts.metrics import REGISTRY, stage_timer
+from scripts.near_duplicates import NearDuplicateIndex
+from scripts.text_normalizer import EMOJI_PATTERN, TextNormalizer
+
+# Text columns are read as strings so chunks with only missing values keep their dtype
+TEXT_COLUMNS = {"Channel Title": str, "Channel Username": str, "Message": str, "Media Path": str}
+
+# Bytes hashed at the start of the raw file and just before the watermark offset
+WATERMARK_WINDOW = 65536
+
+ROWS_CLEANED = REGISTRY.counter("cleaner_rows_total", "Raw rows read and cleaned rows written.", ["outcome"])
+CHUNK_SECONDS = REGISTRY.histogram("cleaner_chunk_seconds", "Time to clean and append one chunk.")
+
+
+class SeenIds:
+    """ Compact set of message IDs backed by a sorted int64 array (8 bytes per ID). """
+
+    def __init__(self):
+        self.ids = np.empty(0, dtype=np.int64)
+        self.has_missing = False
+
+    def __len__(self):
+        return len(self.ids) + int(self.has_missing)
+
+    def add_new(self, ids):
+        """
+        Record a chunk of IDs and return a boolean mask of rows to keep.
+
+        A row is kept when its ID was not seen in an earlier chunk and is the
+        first occurrence within this chunk, matching drop_duplicates(subset=["ID"]).
+        """
+        values = pd.to_numeric(ids, errors="coerce")
+        keep = ~values.duplicated().to_numpy()
+        present = values.notna().to_numpy()
+
+        keys = values[present].astype(np.int64).to_numpy()
+        keep[present] &= ~np.isin(keys, self.ids)
+        if self.has_missing:
+            keep[~present] = False
+        elif (keep & ~present).any():
+            self.has_missing = True
+
+        self.ids = np.union1d(self.ids, keys[keep[present]])
+        return keep
+
+    def save(self, path):
+        """ Persist the IDs atomically as a .npy file. """
+        tmp_path = f"{path}.tmp"
+        with open(tmp_path, "wb") as f:
+            np.save(f, self.ids)
+        os.replace(tmp_path, path)
+
+    @classmethod
+    def load(cls, path, has_missing=False):
+        """ Load IDs saved with save(). """
+        seen_ids = cls()
+        seen_ids.ids = np.load(path)
+        seen_ids.has_missing = has_missing
+        return seen_ids
+
 
 class DataCleaner:
     def __init__(self, input_path="data/raw/scraped_data.csv", output_path="data/preprocessed/cleaned_data.csv"):
         self.input_path = input_path
         self.output_path = output_path
+        self.normalizer = TextNormalizer()
+        self.near_duplicates = NearDuplicateIndex()
+
+        # Incremental state stored next to the cleaned output
+        self.watermark_path = f"{output_path}.watermark.json"
+        self.seen_ids_path = f"{output_path}.seen_ids.npy"
+        self.near_duplicates_path = f"{output_path}.near_duplicates.npz"
+        # (watermark, seen_ids) kept in memory by resume() for clean_until()
+        self.resumed = None
 
         # Ensure logs directory exists
         os.makedirs("logs", exist_ok=True)
@@ -38,14 +119,14 @@ class DataCleaner:
 
     @staticmethod
     def extract_emojis(text):
-        """ Extract emojis from text. """
-        emojis = ''.join(c for c in text if c in emoji.EMOJI_DATA)
+        """ Extract emojis (including multi-codepoint sequences) from text. """
+        emojis = ''.join(EMOJI_PATTERN.findall(text))
         return emojis if emojis else "No emoji"
 
     @staticmethod
     def remove_emojis(text):
-        """ Remove emojis from text. """
-        return ''.join(c for c in text if c not in emoji.EMOJI_DATA)
+        """ Remove emojis (including multi-codepoint sequences) from text. """
+        return EMOJI_PATTERN.sub('', text)
 
     def clean_dataframe(self, df):
         """ Perform all cleaning and standardization steps. """
@@ -59,20 +140,22 @@ class DataCleaner:
             logging.info("✅ Date column formatted to datetime.")
 
             # Handle missing values
-            df['Message'] = df['Message'].fillna("No Message")
-            df['Media Path'] = df['Media Path'].fillna("No Media")
+            df['Media Path'] = df['Media Path'].fillna(columnar.NO_MEDIA)
             logging.info("✅ Missing values filled.")
 
             # Standardize text columns
             df['Channel Title'] = df['Channel Title'].str.strip()
             df['Channel Username'] = df['Channel Username'].str.strip()
-            df['Message'] = df['Message'].apply(self.clean_text)
-            logging.info("✅ Text columns standardized.")
 
-            # Extract and remove emojis
-            df['emoji_used'] = df['Message'].apply(self.extract_emojis)
-            df['Message'] = df['Message'].apply(self.remove_emojis)
-            logging.info("✅ Emojis processed.")
+            # Clean messages and extract emojis in a single normalization pass
+            df['Message'], df['emoji_used'] = self.normalizer.normalize(df['Message'])
+            logging.info("✅ Text columns standardized and emojis processed.")
+
+            # Tag reposted adverts with their near-duplicate cluster instead of dropping them
+            cluster_ids, canonical_ids = self.near_duplicates.assign(df['ID'], df['Message'])
+            df['cluster_id'] = cluster_ids.array
+            df['canonical_message_id'] = canonical_ids.array
+            logging.info("✅ Near-duplicate clusters tagged.")
 
             # Rename columns for consistency
             df.rename(columns={
@@ -96,18 +179,351 @@ class DataCleaner:
         try:
             os.makedirs(os.path.dirname(self.output_path), exist_ok=True)
             df.to_csv(self.output_path, index=False)
+            # A full rewrite invalidates any incremental watermark
+            self.clear_watermark()
             logging.info(f"✅ Cleaned data saved successfully to '{self.output_path}'.")
         except Exception as e:
             logging.error(f"❌ Error saving cleaned data: {e}")
             raise
 
-    def run(self):
-        """ Execute the data cleaning pipeline. """
+    def clear_watermark(self):
+        """ Remove the incremental watermark so the next incremental run rebuilds. """
+        for path in (self.watermark_path, self.seen_ids_path, self.near_duplicates_path):
+            if os.path.exists(path):
+                os.remove(path)
+
+    @staticmethod
+    def _hash_range(f, start, end):
+        """ SHA-256 of the raw file bytes in [start, end). """
+        f.seek(start)
+        return hashlib.sha256(f.read(end - start)).hexdigest()
+
+    def _save_watermark(self, f, offset, header, seen_ids):
+        """ Record how far the raw file has been cleaned. """
+        seen_ids.save(self.seen_ids_path)
+        self.near_duplicates.save(self.near_duplicates_path)
+        watermark = {
+            "offset": offset,
+            "header": header,
+            "head_sha256": self._hash_range(f, 0, min(offset, WATERMARK_WINDOW)),
+            "tail_sha256": self._hash_range(f, max(0, offset - WATERMARK_WINDOW), offset),
+            "output_size": os.path.getsize(self.output_path),
+            "seen_ids": len(seen_ids.ids),
+            "has_missing_id": seen_ids.has_missing,
+            "near_duplicate_ids": len(self.near_duplicates),
+        }
+        tmp_path = f"{self.watermark_path}.tmp"
+        with open(tmp_path, "w") as wf:
+            json.dump(watermark, wf)
+        os.replace(tmp_path, self.watermark_path)
+
+    def _load_watermark(self, f, size):
+        """
+        Load the watermark and seen IDs if they still describe the raw file.
+
+        Returns (watermark, seen_ids), or None when the raw file was truncated
+        or rewritten, or the incremental state is missing or inconsistent.
+        """
+        state_paths = (self.watermark_path, self.seen_ids_path, self.near_duplicates_path, self.output_path)
+        if not all(os.path.exists(path) for path in state_paths):
+            logging.info("No incremental watermark found; running a full rebuild.")
+            return None
+
+        with open(self.watermark_path, "r") as wf:
+            watermark = json.load(wf)
+        offset = watermark["offset"]
+
+        f.seek(0)
+        header = f.readline().decode("utf-8").rstrip("\r\n")
+        if (
+            size < offset
+            or header != watermark["header"]
+            or self._hash_range(f, 0, min(offset, WATERMARK_WINDOW)) != watermark["head_sha256"]
+            or self._hash_range(f, max(0, offset - WATERMARK_WINDOW), offset) != watermark["tail_sha256"]
+        ):
+            logging.warning(f"⚠️ '{self.input_path}' was truncated or rewritten; running a full rebuild.")
+            return None
+
+        seen_ids = SeenIds.load(self.seen_ids_path, watermark["has_missing_id"])
+        near_duplicates = NearDuplicateIndex.load(self.near_duplicates_path)
+        if (
+            len(seen_ids.ids) != watermark["seen_ids"]
+            or len(near_duplicates) != watermark.get("near_duplicate_ids")
+            or os.path.getsize(self.output_path) < watermark["output_size"]
+        ):
+            logging.warning("⚠️ Incremental state is inconsistent with the output; running a full rebuild.")
+            return None
+
+        self.near_duplicates = near_duplicates
+        return watermark, seen_ids
+
+    def _stream_chunks(self, source, seen_ids, chunksize, **read_kwargs):
+        """ Clean CSV chunks from an open source, append them to the output and yield them. """
+        for chunk in pd.read_csv(source, chunksize=chunksize, dtype=TEXT_COLUMNS, **read_kwargs):
+            with CHUNK_SECONDS.time():
+                ROWS_CLEANED.inc(len(chunk), outcome="read")
+                chunk = chunk[seen_ids.add_new(chunk["ID"])]
+                cleaned_chunk = self.clean_dataframe(chunk)
+                write_header = os.path.getsize(self.output_path) == 0
+                cleaned_chunk.to_csv(self.output_path, mode="a", header=write_header, index=False)
+                ROWS_CLEANED.inc(len(cleaned_chunk), outcome="written")
+            yield cleaned_chunk
+
+    def run_streaming(self, chunksize=100000):
+        """
+        Clean the CSV chunk by chunk, appending each chunk to the output file.
+
+        IDs are deduplicated across chunks with a SeenIds set, so the output
+        matches whole-file cleaning while peak memory is bounded by chunksize.
+        A watermark is saved so later incremental runs can resume from here.
+        """
+        try:
+            os.makedirs(os.path.dirname(self.output_path), exist_ok=True)
+            open(self.output_path, "w").close()
+            seen_ids = SeenIds()
+            self.near_duplicates = NearDuplicateIndex()
+
+            with open(self.input_path, "rb") as f:
+                header = f.readline().decode("utf-8").rstrip("\r\n")
+                f.seek(0)
+                rows_written = sum(len(chunk) for chunk in self._stream_chunks(f, seen_ids, chunksize))
+                self._save_watermark(f, f.tell(), header, seen_ids)
+
+            logging.info(
+                f"✅ Streamed {rows_written} cleaned rows to '{self.output_path}' "
+                f"({len(seen_ids)} unique IDs)."
+            )
+        except Exception as e:
+            logging.error(f"❌ Error streaming cleaned data: {e}")
+            raise
+
+    def run_incremental(self, chunksize=100000):
+        """
+        Clean only the rows appended to the raw CSV since the last run.
+
+        New rows are deduplicated against every ID already cleaned and appended
+        to the existing output. Falls back to a full rebuild when the raw file
+        was truncated or rewritten.
+        """
+        try:
+            with open(self.input_path, "rb") as f:
+                size = os.fstat(f.fileno()).st_size
+                state = self._load_watermark(f, size)
+                if state is not None:
+                    watermark, seen_ids = state
+                    new_bytes = size - watermark["offset"]
+
+                    # Drop rows appended by an interrupted run after the last watermark
+                    if os.path.getsize(self.output_path) > watermark["output_size"]:
+                        os.truncate(self.output_path, watermark["output_size"])
+
+                    rows_written = 0
+                    if new_bytes > 0:
+                        f.seek(watermark["offset"])
+                        names = next(csv.reader([watermark["header"]]))
+                        chunks = self._stream_chunks(f, seen_ids, chunksize, header=None, names=names)
+                        rows_written = sum(len(chunk) for chunk in chunks)
+                        self._save_watermark(f, f.tell(), watermark["header"], seen_ids)
+
+            if state is None:
+                self.run_streaming(chunksize)
+                return
+
+            logging.info(
+                f"✅ Incrementally appended {rows_written} cleaned rows "
+                f"({new_bytes} new bytes) to '{self.output_path}'."
+            )
+        except Exception as e:
+            logging.error(f"❌ Error during incremental cleaning: {e}")
+            raise
+
+    def _load_file_watermark(self, raw_files):
+        """
+        Load the incremental state of a columnar run.
+
+        Returns (cleaned raw files, seen_ids), or None when the state is missing,
+        inconsistent or lists raw files that no longer exist. Output files
+        written after the watermark by an interrupted run are removed.
+        """
+        state_paths = (self.watermark_path, self.seen_ids_path, self.near_duplicates_path, self.output_path)
+        if not all(os.path.exists(path) for path in state_paths):
+            logging.info("No incremental watermark found; running a full rebuild.")
+            return None
+
+        with open(self.watermark_path, "r") as wf:
+            watermark = json.load(wf)
+        cleaned_files = watermark.get("raw_files")
+        if cleaned_files is None or not set(cleaned_files) <= set(raw_files):
+            logging.warning(f"⚠️ '{self.input_path}' lost files since the last run; running a full rebuild.")
+            return None
+
+        seen_ids = SeenIds.load(self.seen_ids_path, watermark["has_missing_id"])
+        near_duplicates = NearDuplicateIndex.load(self.near_duplicates_path)
+        output_files = set(self._relative_files(self.output_path))
+        if (
+            len(seen_ids.ids) != watermark["seen_ids"]
+            or len(near_duplicates) != watermark["near_duplicate_ids"]
+            or not set(watermark["output_files"]) <= output_files
+        ):
+            logging.warning("⚠️ Incremental state is inconsistent with the output; running a full rebuild.")
+            return None
+
+        for path in output_files - set(watermark["output_files"]):
+            os.remove(os.path.join(self.output_path, path))
+        self.near_duplicates = near_duplicates
+        return cleaned_files, seen_ids
+
+    @staticmethod
+    def _relative_files(base_dir):
+        return [os.path.relpath(path, base_dir) for path in columnar.dataset_files(base_dir)]
+
+    def run_columnar(self, chunksize=100000, incremental=False):
+        """
+        Clean a Parquet dataset of raw rows into a Parquet dataset of cleaned rows.
+
+        Dates, IDs and channel names arrive typed, so nothing is re-parsed.
+        Raw files are never modified once written, so the watermark is the list
+        of raw files already cleaned and an incremental run cleans the new ones.
+        """
+        try:
+            raw_files = self._relative_files(self.input_path)
+            state = self._load_file_watermark(raw_files) if incremental else None
+            if state is None:
+                shutil.rmtree(self.output_path, ignore_errors=True)
+                cleaned_files, seen_ids = [], SeenIds()
+                self.near_duplicates = NearDuplicateIndex()
+            else:
+                cleaned_files, seen_ids = state
+
+            done = set(cleaned_files)
+            new_files = [path for path in raw_files if path not in done]
+            rows_written = 0
+            if new_files:
+                batches = columnar.iter_dataframes(
+                    self.input_path, columnar.RAW_SCHEMA, batch_size=chunksize,
+                    files=[os.path.join(self.input_path, path) for path in new_files],
+                )
+                for df in batches:
+                    with CHUNK_SECONDS.time():
+                        ROWS_CLEANED.inc(len(df), outcome="read")
+                        df = columnar.raw_dataframe(df)
+                        cleaned_chunk = self.clean_dataframe(df[seen_ids.add_new(df["ID"])])
+                        columnar.write_dataframe(self.output_path, cleaned_chunk, columnar.CLEANED_SCHEMA)
+                        ROWS_CLEANED.inc(len(cleaned_chunk), outcome="written")
+                    rows_written += len(cleaned_chunk)
+
+            os.makedirs(self.output_path, exist_ok=True)
+            seen_ids.save(self.seen_ids_path)
+            self.near_duplicates.save(self.near_duplicates_path)
+            watermark = {
+                "raw_files": cleaned_files + new_files,
+                "output_files": self._relative_files(self.output_path),
+                "seen_ids": len(seen_ids.ids),
+                "has_missing_id": seen_ids.has_missing,
+                "near_duplicate_ids": len(self.near_duplicates),
+            }
+            tmp_path = f"{self.watermark_path}.tmp"
+            with open(tmp_path, "w") as wf:
+                json.dump(watermark, wf)
+            os.replace(tmp_path, self.watermark_path)
+
+            logging.info(
+                f"✅ Cleaned {rows_written} rows from {len(new_files)} new Parquet files "
+                f"into '{self.output_path}'."
+            )
+        except Exception as e:
+            logging.error(f"❌ Error cleaning Parquet data: {e}")
+            raise
+
+    def resume(self, chunksize=100000):
+        """
+        Catch up incrementally with the raw CSV and keep the watermark in memory.
+
+        Rows appended to the raw CSV afterwards are cleaned batch by batch with
+        clean_until() without reloading the incremental state each time.
+        """
+        try:
+            self.run_incremental(chunksize)
+            with open(self.input_path, "rb") as f:
+                self.resumed = self._load_watermark(f, os.fstat(f.fileno()).st_size)
+            if self.resumed is None:
+                raise RuntimeError(f"No incremental watermark for '{self.input_path}' after catching up")
+            return self.resumed[0]["offset"]
+        except Exception as e:
+            logging.error(f"❌ Error resuming incremental cleaning: {e}")
+            raise
+
+    def clean_until(self, offset, chunksize=100000):
+        """
+        Clean the raw rows between the in-memory watermark and byte `offset`.
+
+        `offset` must fall on a row boundary, e.g. the raw file size after a
+        flush. The rows are appended to the output and returned; the watermark
+        on disk is only updated by save_watermark().
+        """
+        watermark, seen_ids = self.resumed
+        start = watermark["offset"]
+        if offset <= start:
+            return None
+        try:
+            with open(self.input_path, "rb") as f:
+                f.seek(start)
+                source = io.BytesIO(f.read(offset - start))
+            names = next(csv.reader([watermark["header"]]))
+            chunks = list(self._stream_chunks(source, seen_ids, chunksize, header=None, names=names))
+            watermark["offset"] = offset
+            return pd.concat(chunks) if chunks else None
+        except Exception as e:
+            logging.error(f"❌ Error cleaning appended rows: {e}")
+            raise
+
+    def save_watermark(self):
+        """ Persist the in-memory watermark of resume() and clean_until(). """
+        watermark, seen_ids = self.resumed
+        with open(self.input_path, "rb") as f:
+            self._save_watermark(f, watermark["offset"], watermark["header"], seen_ids)
+
+    def run(self, chunksize=None, incremental=False):
+        """
+        Execute the data cleaning pipeline.
+
+        With incremental=True only rows appended since the last run are cleaned;
+        with chunksize set the input is streamed in chunks to bound memory.
+        A .parquet input dataset is cleaned into a .parquet output dataset.
+        """
+        if columnar.is_dataset_path(self.input_path):
+            self.run_columnar(chunksize or 100000, incremental)
+            return
+        if incremental:
+            self.run_incremental(chunksize or 100000)
+            return
+        if chunksize:
+            self.run_streaming(chunksize)
+            return
+
         df = self.load_csv()
+        ROWS_CLEANED.inc(len(df), outcome="read")
+        self.near_duplicates = NearDuplicateIndex()
         cleaned_df = self.clean_dataframe(df)
         self.save_cleaned_data(cleaned_df)
+        ROWS_CLEANED.inc(len(cleaned_df), outcome="written")
 
 # Main execution
 if __name__ == "__main__":
-    cleaner = DataCleaner()
-    cleaner.run()
+    parser = argparse.ArgumentParser(description="Clean scraped Telegram data.")
+    parser.add_argument("--chunksize", type=int, default=None,
+                        help="Stream the input in chunks of this many rows to bound memory.")
+    parser.add_argument("--incremental", action="store_true",
+                        help="Only clean rows appended to the raw CSV since the last run.")
+    parser.add_argument("--format", choices=["csv", "parquet"], default="csv",
+                        help="Clean scraped_data.csv into cleaned_data.csv, or the .parquet datasets.")
+    args = parser.parse_args()
+
+    if args.format == "parquet":
+        cleaner = DataCleaner("data/raw/scraped_data.parquet", "data/preprocessed/cleaned_data.parquet")
+    else:
+        cleaner = DataCleaner()
+    with stage_timer("clean") as timer:
+        cleaner.run(chunksize=args.chunksize, incremental=args.incremental)
+        timer.add(ROWS_CLEANED.value(outcome="read"))
+    REGISTRY.dump_summary()
@@ -1,9 +1,38 @@
+import io
 import os
+import sys
 import logging
 from dotenv import load_dotenv
 from sqlalchemy import create_engine, text
 import pandas as pd
 
+# Add the project root to sys.path so the sibling module resolves when run as a script
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), "..")))
+
+from scripts import columnar, migrations, rollups
+from scripts.metrics import REGISTRY, row_log
+
+# Columns loaded into each table by the bulk loaders
+MESSAGE_COLUMNS = [
+    "channel_title", "channel_username", "message_id", "message",
+    "message_date", "media_path", "emoji_used", "youtube_links",
+    "cluster_id", "canonical_message_id",
+]
+DETECTION_COLUMNS = [
+    "image_name", "class_id", "x_center", "y_center", "width", "height", "confidence",
+]
+
+# Marker used for NULL values in the COPY stream
+COPY_NULL = r"\N"
+
+# Key of a table's generation in the API's shared response cache (GENERATION_KEY in my_project/cache.py)
+API_CACHE_GENERATION_KEY = "api-cache:generation:{table}"
+
+ROWS_INSERTED = REGISTRY.counter("db_rows_inserted_total", "Rows inserted, by table and loader.", ["table", "method"])
+COPY_BATCH_SECONDS = REGISTRY.histogram(
+    "db_copy_batch_seconds", "Time to COPY one batch into a staging table and merge it.", ["table"]
+)
+
 class DatabaseManager:
     def __init__(self, log_dir="logs", env_file=".env"):
         # Ensure logs folder exists
@@ -42,46 +71,71 @@ class DatabaseManager:
             logging.error(f"❌ Database connection failed: {e}")
             raise
 
+    def migrate(self):
+        """Bring the schema up to date by applying pending migrations; safe to call repeatedly."""
+        try:
+            applied = migrations.migrate(self.engine)
+            logging.info(f"✅ Schema is up to date ({len(applied)} migrations applied).")
+            return applied
+        except Exception as e:
+            logging.error(f"❌ Error migrating schema: {e}")
+            raise
+
     def create_table(self):
-        """Create the telegram_messages table if it does not exist."""
-        create_table_query = """
-        CREATE TABLE IF NOT EXISTS telegram_messages (
-            id SERIAL PRIMARY KEY,
-            channel_title TEXT,
-            channel_username TEXT,
-            message_id BIGINT UNIQUE,
-            message TEXT,
-            message_date TIMESTAMP,
-            media_path TEXT,
-            emoji_used TEXT,
-            youtube_links TEXT
-        );
+        """Create the telegram_messages table (partitioned by month) through the migrations."""
+        self.migrate()
+
+    def ensure_partitions(self, months=None, months_ahead=3):
         """
+        Create the monthly telegram_messages partitions for the given months.
+
+        Defaults to the current month and months_ahead months after it. Does
+        nothing until the table has been partitioned by the migrations.
+        """
+        if months is None:
+            months = migrations.upcoming_months(months_ahead)
         try:
-            with self.engine.connect().execution_options(isolation_level="AUTOCOMMIT") as connection:
-                connection.execute(text(create_table_query))
+            with self.engine.begin() as connection:
+                if not migrations.is_partitioned(connection):
+                    return []
+                return migrations.ensure_month_partitions(connection, months)
+        except Exception as e:
+            logging.error(f"❌ Error creating partitions: {e}")
+            raise
 
-            logging.info("✅ Table 'telegram_messages' created successfully.")
+    def drop_partitions_before(self, cutoff):
+        """Retention: drop the monthly partitions holding only messages older than cutoff."""
+        try:
+            with self.engine.begin() as connection:
+                dropped = migrations.drop_month_partitions_before(connection, cutoff)
+            logging.info(f"✅ Dropped {len(dropped)} partitions older than {cutoff}.")
+            return dropped
         except Exception as e:
-            logging.error(f"❌ Error creating table: {e}")
+            logging.error(f"❌ Error dropping partitions: {e}")
             raise
 
     def insert_data(self, cleaned_df):
         """Insert cleaned Telegram data into the database."""
         try:
-            # Convert NaT timestamps to None (NULL in SQL)
-            cleaned_df["message_date"] = cleaned_df["message_date"].apply(lambda x: None if pd.isna(x) else str(x))
+            # Native timestamps (strings from CSV are parsed once, column-wise); NaT becomes None (NULL in SQL)
+            dates = pd.to_datetime(cleaned_df["message_date"], errors="coerce", utc=True).dt.tz_localize(None)
+            cleaned_df["message_date"] = dates.astype(object).where(dates.notna(), None)
+            # Route rows to monthly partitions instead of the DEFAULT one
+            if dates.notna().any():
+                self.ensure_partitions(dates.dropna().dt.to_period("M").dt.start_time.unique())
 
             insert_query = """
             INSERT INTO telegram_messages 
-            (channel_title, channel_username, message_id, message, message_date, media_path, emoji_used, youtube_links) 
-            VALUES (:channel_title, :channel_username, :message_id, :message, :message_date, :media_path, :emoji_used, :youtube_links)
-            ON CONFLICT (message_id) DO NOTHING;
+            (channel_title, channel_username, message_id, message, message_date, media_path, emoji_used, youtube_links,
+             cluster_id, canonical_message_id) 
+            VALUES (:channel_title, :channel_username, :message_id, :message, :message_date, :media_path, :emoji_used, :youtube_links,
+                    :cluster_id, :canonical_message_id)
+            ON CONFLICT DO NOTHING;
             """
 
             with self.engine.begin() as connection:
                 for _, row in cleaned_df.iterrows():
-                    logging.info(f"Inserting: {row['message_id']} - {row['message_date']}")
+                    row_log("insert", "Inserting: %s - %s", row["message_id"], row["message_date"])
 
                     connection.execute(
                         text(insert_query),
@@ -93,37 +147,150 @@ class DatabaseManager:
                             "message_date": row["message_date"],
                             "media_path": row["media_path"],
                             "emoji_used": row["emoji_used"],
-                            "youtube_links": row["youtube_links"]
+                            "youtube_links": row["youtube_links"],
+                            # Near-duplicate tags are missing from data cleaned before they existed
+                            "cluster_id": None if pd.isna(row.get("cluster_id")) else int(row["cluster_id"]),
+                            "canonical_message_id": (
+                                None if pd.isna(row.get("canonical_message_id")) else int(row["canonical_message_id"])
+                            ),
                         }
                     )
 
+            ROWS_INSERTED.inc(len(cleaned_df), table="telegram_messages", method="insert")
             logging.info(f"✅ {len(cleaned_df)} records inserted into PostgreSQL database.")
+            self.refresh_rollups(message_keys=self._message_keys(cleaned_df))
+            self.invalidate_api_cache("telegram_messages", "analytics")
         except Exception as e:
             logging.error(f"❌ Error inserting data: {e}")
             raise
 
-    def create_detected_objects_table(self):
-        """Create the detected_objects table if it does not exist."""
-        create_table_query = """
-        CREATE TABLE detected_objects (
-            id SERIAL PRIMARY KEY,
-            image_name TEXT NOT NULL,
-            class_id INTEGER NOT NULL,
-            x_center FLOAT NOT NULL,
-            y_center FLOAT NOT NULL,
-            width FLOAT NOT NULL,
-            height FLOAT NOT NULL,
-            confidence FLOAT NOT NULL,
-            detection_timestamp TIMESTAMP DEFAULT NOW()
-        );
+    def _copy_dataframe(self, cursor, table, columns, df):
+        """Stream a DataFrame into a table using PostgreSQL COPY."""
+        buffer = io.StringIO()
+        df.reindex(columns=columns).to_csv(buffer, index=False, header=False, na_rep=COPY_NULL)
+        buffer.seek(0)
+        cursor.copy_expert(
+            f"COPY {table} ({', '.join(columns)}) FROM STDIN WITH (FORMAT csv, NULL '{COPY_NULL}')",
+            buffer
+        )
+
+    def _bulk_load(self, df, staging_ddl, staging_table, columns, merge_query, batch_size):
+        """COPY a DataFrame into a staging table batch by batch and merge each batch."""
+        inserted = 0
+        table = staging_table.removesuffix("_staging")
+        raw_connection = self.engine.raw_connection()
+        try:
+            cursor = raw_connection.cursor()
+            try:
+                cursor.execute(staging_ddl)
+                for start in range(0, len(df), batch_size):
+                    batch = df.iloc[start:start + batch_size]
+                    with COPY_BATCH_SECONDS.time(table=table):
+                        self._copy_dataframe(cursor, staging_table, columns, batch)
+                        cursor.execute(merge_query)
+                        inserted += cursor.rowcount
+                        # Staging rows are dropped on commit (ON COMMIT DELETE ROWS)
+                        raw_connection.commit()
+                    ROWS_INSERTED.inc(cursor.rowcount, table=table, method="copy")
+                    logging.info(f"Merged batch of {len(batch)} rows from '{staging_table}' ({cursor.rowcount} new).")
+            finally:
+                cursor.close()
+        except Exception:
+            raw_connection.rollback()
+            raise
+        finally:
+            raw_connection.close()
+
+        return {"inserted": inserted, "skipped": len(df) - inserted}
+
+    def bulk_insert_data(self, cleaned_df, batch_size=50000):
+        """
+        Bulk load cleaned Telegram data through a COPY staging table.
+
+        Rows whose message_id already exists (in the table or earlier in the
+        DataFrame) are skipped; rows without a message_id are all inserted, as
+        insert_data does. Returns a dict with inserted and skipped counts.
+        """
+        staging_ddl = """
+        CREATE TEMP TABLE IF NOT EXISTS telegram_messages_staging (
+            seq BIGSERIAL,
+            channel_title TEXT,
+            channel_username TEXT,
+            message_id BIGINT,
+            message TEXT,
+            message_date TIMESTAMP,
+            media_path TEXT,
+            emoji_used TEXT,
+            youtube_links TEXT,
+            cluster_id BIGINT,
+            canonical_message_id BIGINT
+        ) ON COMMIT DELETE ROWS;
+        """
+        # DISTINCT ON ordered by seq keeps the first occurrence of each message_id; it would also
+        # collapse the rows without one into a single row, so those are added back separately.
+        # IDs already stored are skipped by the unique index or, once partitioned, by the ID registry trigger
+        columns = ', '.join(MESSAGE_COLUMNS)
+        merge_query = f"""
+        INSERT INTO telegram_messages ({columns})
+        SELECT {columns} FROM (
+            (SELECT DISTINCT ON (message_id) {columns}, seq
+             FROM telegram_messages_staging
+             WHERE message_id IS NOT NULL
+             ORDER BY message_id, seq)
+            UNION ALL
+            SELECT {columns}, seq
+            FROM telegram_messages_staging
+            WHERE message_id IS NULL
+        ) AS batch
+        ORDER BY seq
+        ON CONFLICT DO NOTHING;
         """
         try:
-            with self.engine.connect().execution_options(isolation_level="AUTOCOMMIT") as connection:
-                connection.execute(text(create_table_query))
+            df = cleaned_df.copy()
+            for column in ("message_id", "cluster_id", "canonical_message_id"):
+                if column in df:
+                    df[column] = pd.to_numeric(df[column], errors="coerce").astype("Int64")
+
+            # Route rows to monthly partitions instead of the DEFAULT one
+            dates = pd.to_datetime(df["message_date"], errors="coerce").dropna()
+            if not dates.empty:
+                self.ensure_partitions(dates.dt.to_period("M").dt.start_time.unique())
+
+            counts = self._bulk_load(
+                df, staging_ddl, "telegram_messages_staging", MESSAGE_COLUMNS, merge_query, batch_size
+            )
+            logging.info(
+                f"✅ Bulk load finished: {counts['inserted']} records inserted, "
+                f"{counts['skipped']} duplicates skipped."
+            )
+            if counts["inserted"]:
+                self.refresh_rollups(message_keys=self._message_keys(df))
+                self.invalidate_api_cache("telegram_messages", "analytics")
+            return counts
+        except Exception as e:
+            logging.error(f"❌ Error bulk inserting data: {e}")
+            raise
 
-            logging.info("✅ Table 'detected_objects' created successfully.")
+    def load_columnar(self, dataset_path, filter=None, batch_size=100000):
+        """
+        Bulk load a cleaned Parquet dataset, optionally filtered (e.g. with
+        columnar.date_filter), batch by batch. Returns inserted and skipped counts.
+        """
+        totals = {"inserted": 0, "skipped": 0}
+        try:
+            for df in columnar.iter_dataframes(dataset_path, columnar.CLEANED_SCHEMA, filter=filter, batch_size=batch_size):
+                counts = self.bulk_insert_data(df, batch_size)
+                totals["inserted"] += counts["inserted"]
+                totals["skipped"] += counts["skipped"]
+            logging.info(f"✅ Loaded '{dataset_path}': {totals['inserted']} inserted, {totals['skipped']} skipped.")
+            return totals
         except Exception as e:
-            logging.error(f"❌ Error creating table: {e}")
+            logging.error(f"❌ Error loading '{dataset_path}': {e}")
+            raise
+
+    def create_detected_objects_table(self):
+        """Create the detected_objects table through the migrations."""
+        self.migrate()
 
     def insert_detection_results(self, detection_results_df):
         """Insert YOLOv5 detection results into the detected_objects table."""
@@ -149,19 +316,155 @@ class DatabaseManager:
                             "confidence": row["confidence"]
                         }
                     )
+            ROWS_INSERTED.inc(len(detection_results_df), table="detected_objects", method="insert")
             logging.info(f"✅ {len(detection_results_df)} detection results inserted into database.")
+            self.refresh_rollups(image_names=detection_results_df["image_name"])
+            self.invalidate_api_cache("detected_objects", "analytics")
         except Exception as e:
             logging.error(f"❌ Error inserting detection results: {e}")
             raise
 
+    def bulk_insert_detection_results(self, detection_results_df, batch_size=50000):
+        """Bulk load YOLOv5 detection results through a COPY staging table."""
+        staging_ddl = """
+        CREATE TEMP TABLE IF NOT EXISTS detected_objects_staging (
+            image_name TEXT,
+            class_id INTEGER,
+            x_center FLOAT,
+            y_center FLOAT,
+            width FLOAT,
+            height FLOAT,
+            confidence FLOAT
+        ) ON COMMIT DELETE ROWS;
+        """
+        merge_query = f"""
+        INSERT INTO detected_objects ({', '.join(DETECTION_COLUMNS)})
+        SELECT {', '.join(DETECTION_COLUMNS)} FROM detected_objects_staging;
+        """
+        try:
+            counts = self._bulk_load(
+                detection_results_df, staging_ddl, "detected_objects_staging",
+                DETECTION_COLUMNS, merge_query, batch_size
+            )
+            logging.info(f"✅ {counts['inserted']} detection results bulk inserted into database.")
+            if counts["inserted"]:
+                self.refresh_rollups(image_names=detection_results_df["image_name"])
+                self.invalidate_api_cache("detected_objects", "analytics")
+            return counts
+        except Exception as e:
+            logging.error(f"❌ Error bulk inserting detection results: {e}")
+            raise
+
+    def detected_image_names(self, image_names):
+        """Return the set of image names that already have rows in detected_objects."""
+        try:
+            with self.engine.connect() as connection:
+                result = connection.execute(
+                    text("SELECT DISTINCT image_name FROM detected_objects WHERE image_name = ANY(:names)"),
+                    {"names": list(image_names)}
+                )
+                return {row[0] for row in result}
+        except Exception as e:
+            logging.error(f"❌ Error reading detected image names: {e}")
+            raise
+
+    def create_rollup_tables(self):
+        """Create the channel x day (x detected class) rollup tables through the migrations."""
+        self.migrate()
+
+    @staticmethod
+    def _message_keys(df):
+        """Distinct (channel_username, message_day) pairs of a messages DataFrame."""
+        keys = pd.DataFrame({
+            "channel_username": df["channel_username"],
+            "message_day": pd.to_datetime(df["message_date"], errors="coerce").dt.date,
+        })
+        return keys.dropna().drop_duplicates()
+
+    def refresh_rollups(self, message_keys=None, image_names=None):
+        """
+        Recompute the rollup rows of the channel/day pairs touched by a load.
+
+        message_keys is a DataFrame of channel_username and message_day; image_names
+        adds the days of the messages those images belong to. With neither, the
+        rollups are rebuilt from scratch.
+        """
+        rebuild = message_keys is None and image_names is None
+        try:
+            raw_connection = self.engine.raw_connection()
+            try:
+                cursor = raw_connection.cursor()
+                cursor.execute("SELECT pg_advisory_xact_lock(%s);", (rollups.ROLLUP_LOCK_KEY,))
+                cursor.execute(
+                    "CREATE TEMP TABLE rollup_keys (channel_username TEXT, message_day DATE) ON COMMIT DROP;"
+                )
+                if rebuild:
+                    cursor.execute("TRUNCATE channel_daily_rollup, channel_daily_class_rollup;")
+                    cursor.execute(
+                        "INSERT INTO rollup_keys SELECT DISTINCT channel_username, message_date::DATE "
+                        "FROM telegram_messages WHERE message_date IS NOT NULL;"
+                    )
+                else:
+                    if message_keys is not None:
+                        self._copy_dataframe(cursor, "rollup_keys", ["channel_username", "message_day"], message_keys)
+                    if image_names is not None:
+                        cursor.execute("CREATE TEMP TABLE rollup_images (image_name TEXT) ON COMMIT DROP;")
+                        images = pd.DataFrame({"image_name": pd.Series(image_names).dropna().unique()})
+                        self._copy_dataframe(cursor, "rollup_images", ["image_name"], images)
+                        cursor.execute(f"INSERT INTO rollup_keys {rollups.image_keys_query('rollup_images i')};")
+                    for statement in rollups.DELETE_STATEMENTS:
+                        cursor.execute(statement)
+                for statement in rollups.INSERT_STATEMENTS:
+                    cursor.execute(statement)
+                cursor.execute("SELECT COUNT(DISTINCT (channel_username, message_day)) FROM rollup_keys;")
+                refreshed = cursor.fetchone()[0]
+                raw_connection.commit()
+            except Exception:
+                raw_connection.rollback()
+                raise
+            finally:
+                raw_connection.close()
+            logging.info(f"✅ Refreshed rollups for {refreshed} channel-days.")
+            return refreshed
+        except Exception as e:
+            logging.error(f"❌ Error refreshing rollups: {e}")
+            raise
+
+    def invalidate_api_cache(self, *tables):
+        """
+        Bump the API response cache generation of tables after writing to them.
+
+        Only the shared cache (REDIS_URL), the API's default whenever REDIS_URL
+        is set, is reachable from here; API workers explicitly configured with
+        a per-process backend (CACHE_BACKEND=lru) see new rows once their
+        entries expire after CACHE_TTL.
+        """
+        redis_url = os.getenv("REDIS_URL")
+        if not redis_url:
+            return
+        try:
+            import redis
+
+            client = redis.Redis.from_url(redis_url)
+            for table in tables:
+                client.incr(API_CACHE_GENERATION_KEY.format(table=table))
+            logging.info(f"✅ Invalidated API cache for {', '.join(tables)}.")
+        except Exception as e:
+            logging.warning(f"⚠️ Could not invalidate API cache for {', '.join(tables)}: {e}")
+
 
 # Example Usage
 if __name__ == "__main__":
     db_manager = DatabaseManager()
     db_manager.connect_to_database()
-    db_manager.create_table()
+    db_manager.migrate()
 
-    # Example: Load cleaned data and insert into database
-    cleaned_data_path = "data/preprocessed/cleaned_telegram_data.csv"
-    cleaned_df = pd.read_csv(cleaned_data_path)
-    db_manager.insert_data(cleaned_df)
+    # Example: Load cleaned data and insert into database (the Parquet dataset when there is one)
+    cleaned_dataset_path = "data/preprocessed/cleaned_data.parquet"
+    if os.path.isdir(cleaned_dataset_path):
+        db_manager.load_columnar(cleaned_dataset_path)
+    else:
+        cleaned_data_path = "data/preprocessed/cleaned_telegram_data.csv"
+        cleaned_df = pd.read_csv(cleaned_data_path)
+        db_manager.bulk_insert_data(cleaned_df)
+    REGISTRY.dump_summary()
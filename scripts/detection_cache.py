@@ -0,0 +1,122 @@
+import argparse
+import hashlib
+import logging
+import os
+import sqlite3
+import numpy as np
+
+# Columns of each cached box: xmin, ymin, xmax, ymax, confidence, class id
+BOX_COLUMNS = 6
+
+
+class DetectionCache:
+    """
+    Persistent YOLO detection results keyed by image content and model identity.
+
+    Byte-identical images (e.g. reposts across channels) share one entry, so an
+    image is only inferred again when its content, the model weights or the
+    inference thresholds change.
+    """
+
+    def __init__(self, path="data/preprocessed/detection_cache.sqlite"):
+        self.path = path
+        os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+        self.connection = sqlite3.connect(path, check_same_thread=False)
+        self.connection.execute(
+            """
+            CREATE TABLE IF NOT EXISTS detections (
+                image_hash TEXT NOT NULL,
+                model_key TEXT NOT NULL,
+                boxes BLOB NOT NULL,
+                created_at TEXT DEFAULT CURRENT_TIMESTAMP,
+                PRIMARY KEY (image_hash, model_key)
+            )
+            """
+        )
+        self.connection.commit()
+
+    @staticmethod
+    def hash_file(path, chunk_size=1024 * 1024):
+        """SHA-256 of a file's content."""
+        digest = hashlib.sha256()
+        with open(path, "rb") as f:
+            for chunk in iter(lambda: f.read(chunk_size), b""):
+                digest.update(chunk)
+        return digest.hexdigest()
+
+    @classmethod
+    def model_key(cls, model_name, conf, iou, img_size, weights_path=None, engine="eager", source=None):
+        """
+        Identify a model, its thresholds and the engine running it (exported and
+        quantized engines can differ slightly); includes a weights hash when the
+        file exists locally. source names a derived input the model ran on
+        instead of the original image (e.g. a media store thumbnail).
+        """
+        weights = cls.hash_file(weights_path)[:16] if weights_path and os.path.isfile(weights_path) else "hub"
+        key = f"{model_name}|{weights}|conf={conf}|iou={iou}|size={img_size}"
+        if engine != "eager":
+            key = f"{key}|engine={engine}"
+        return key if source is None else f"{key}|source={source}"
+
+    def get_many(self, image_hashes, model_key, chunk_size=500):
+        """Return {image_hash: boxes array} for the hashes present in the cache."""
+        image_hashes = list(image_hashes)
+        found = {}
+        for start in range(0, len(image_hashes), chunk_size):
+            chunk = image_hashes[start:start + chunk_size]
+            rows = self.connection.execute(
+                f"SELECT image_hash, boxes FROM detections WHERE model_key = ? "
+                f"AND image_hash IN ({', '.join('?' * len(chunk))})",
+                [model_key, *chunk],
+            )
+            for image_hash, boxes in rows:
+                found[image_hash] = np.frombuffer(boxes, dtype=np.float64).reshape(-1, BOX_COLUMNS)
+        return found
+
+    def put_many(self, items, model_key):
+        """Store (image_hash, boxes array) pairs for a model."""
+        self.connection.executemany(
+            "INSERT OR REPLACE INTO detections (image_hash, model_key, boxes) VALUES (?, ?, ?)",
+            [(image_hash, model_key, np.ascontiguousarray(boxes, dtype=np.float64).tobytes())
+             for image_hash, boxes in items],
+        )
+        self.connection.commit()
+
+    def invalidate(self, model_name=None):
+        """Delete cached results for one model name (every weights/threshold variant), or all of them."""
+        if model_name:
+            prefix = f"{model_name}|"
+            cursor = self.connection.execute(
+                "DELETE FROM detections WHERE substr(model_key, 1, ?) = ?", (len(prefix), prefix)
+            )
+        else:
+            cursor = self.connection.execute("DELETE FROM detections")
+        self.connection.commit()
+        logging.info(f"Invalidated {cursor.rowcount} cached detection results.")
+        return cursor.rowcount
+
+    def stats(self):
+        """Number of cached images per model key."""
+        return dict(self.connection.execute(
+            "SELECT model_key, COUNT(*) FROM detections GROUP BY model_key"
+        ).fetchall())
+
+    def close(self):
+        self.connection.close()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Inspect or invalidate the detection cache.")
+    parser.add_argument("command", choices=["stats", "invalidate"])
+    parser.add_argument("--cache", default="data/preprocessed/detection_cache.sqlite")
+    parser.add_argument("--model", default=None,
+                        help="Only invalidate entries for this model name (default: all models).")
+    args = parser.parse_args()
+
+    cache = DetectionCache(args.cache)
+    if args.command == "invalidate":
+        print(f"Removed {cache.invalidate(args.model)} cached results.")
+    else:
+        for key, count in cache.stats().items():
+            print(f"{count:>8}  {key}")
+    cache.close()
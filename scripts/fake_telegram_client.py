@@ -0,0 +1,93 @@
+import asyncio
+import os
+from datetime import datetime, timedelta, timezone
+from types import SimpleNamespace
+from telethon.errors import FloodWaitError
+
+
+class FakeTelegramClient:
+    """
+    In-process stand-in for telethon.TelegramClient.
+
+    Serves synthetic channels with simulated network latency so TelegramScraper
+    can be run and measured offline. Only the calls the scraper uses are
+    implemented: start, get_entity, iter_messages and download_media.
+    """
+
+    def __init__(self, channels, latency=0.05, page_size=100, media_every=3,
+                 media_size=50_000, bandwidth=5_000_000, flood_waits=None, flood_after=0):
+        # channels maps a username to its number of messages (IDs 1..n)
+        self.channels = channels
+        self.latency = latency
+        self.page_size = page_size
+        self.media_every = media_every
+        self.media_size = media_size
+        self.bandwidth = bandwidth
+        # flood_waits maps a username to the seconds of its first (one-off) FloodWaitError
+        self.flood_waits = dict(flood_waits or {})
+        # With flood_after, the error comes on the first page request after that many messages
+        self.flood_after = flood_after
+        self.requests = 0
+
+    async def _round_trip(self):
+        self.requests += 1
+        await asyncio.sleep(self.latency)
+
+    async def start(self, phone=None):
+        return self
+
+    async def get_entity(self, channel_username):
+        await self._round_trip()
+        if channel_username not in self.channels:
+            raise ValueError(f"No channel named {channel_username}")
+        return SimpleNamespace(username=channel_username, title=f"{channel_username.lstrip('@')} channel")
+
+    def _make_message(self, channel_username, message_id):
+        media = None
+        if self.media_every and message_id % self.media_every == 0:
+            if message_id % (self.media_every * 2) == 0:
+                media = SimpleNamespace(document=SimpleNamespace(mime_type="video/mp4", size=self.media_size * 20))
+            else:
+                media = SimpleNamespace(photo=SimpleNamespace(id=message_id), size=self.media_size)
+        return SimpleNamespace(
+            id=message_id,
+            message=f"Message {message_id} from {channel_username} 💊 መድሃኒት",
+            date=datetime(2024, 1, 1, tzinfo=timezone.utc) + timedelta(minutes=message_id),
+            media=media,
+        )
+
+    async def iter_messages(self, entity, limit=None, *, offset_id=0, min_id=0, max_id=0, reverse=False, **kwargs):
+        """ Yield messages newest-first (or oldest-first with reverse=True), one page per round trip. """
+        channel_username = entity.username
+        if channel_username in self.flood_waits and not self.flood_after:
+            await self._round_trip()
+            raise FloodWaitError(request=None, capture=self.flood_waits.pop(channel_username))
+
+        ids = range(1, self.channels[channel_username] + 1)
+        ids = [i for i in ids if i > min_id and (not max_id or i < max_id)]
+        if reverse:
+            ids = [i for i in ids if i > offset_id]
+        else:
+            ids = [i for i in reversed(ids) if not offset_id or i < offset_id]
+        if limit is not None:
+            ids = ids[:limit]
+
+        # An empty result still costs one request
+        if not ids:
+            await self._round_trip()
+        for position, message_id in enumerate(ids):
+            if position % self.page_size == 0:
+                await self._round_trip()
+                if self.flood_after and position >= self.flood_after and channel_username in self.flood_waits:
+                    raise FloodWaitError(request=None, capture=self.flood_waits.pop(channel_username))
+            yield self._make_message(channel_username, message_id)
+
+    async def download_media(self, media, file):
+        """ Write a file of the media's size after a bandwidth-proportional delay. """
+        size = media.document.size if hasattr(media, "document") else media.size
+        self.requests += 1
+        await asyncio.sleep(self.latency + size / self.bandwidth)
+        os.makedirs(os.path.dirname(file) or ".", exist_ok=True)
+        with open(file, "wb") as f:
+            f.write(b"\0" * size)
+        return file
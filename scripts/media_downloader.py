@@ -0,0 +1,146 @@
+import asyncio
+import json
+import logging
+import os
+import time
+from telethon.errors import FloodWaitError
+
+from scripts.metrics import REGISTRY, row_log
+
+DOWNLOADS = REGISTRY.counter("media_downloads_total", "Media downloads, by outcome.", ["status"])
+DOWNLOAD_SECONDS = REGISTRY.histogram("media_download_seconds", "Time to download one media file.")
+DOWNLOAD_BYTES = REGISTRY.counter("media_download_bytes_total", "Bytes of media downloaded.")
+
+
+class MediaDownloader:
+    """
+    Bounded pool of async workers that download message media off the scrape path.
+
+    The scraper decides a media path up front with plan(), writes the message row
+    immediately and hands the download to submit(). Workers fetch files into a
+    temporary ".part" file, rename it into place and append one JSON line per
+    file to a completion manifest. With a MediaStore, each finished file is
+    added to the store, so repeated content is kept once.
+    """
+
+    def __init__(self, client, media_dir, workers=4, queue_size=100, max_bytes=10 * 1024 * 1024,
+                 mime_prefixes=("image/",), flood_policy=None, max_retries=3, store=None):
+        self.client = client
+        self.media_dir = media_dir
+        self.workers = workers
+        self.queue_size = queue_size
+        # Created by start(), inside the running event loop: on Python 3.9 a queue
+        # built earlier is bound to another loop and its workers fail
+        self.queue = None
+        self.max_bytes = max_bytes
+        # None accepts every MIME type
+        self.mime_prefixes = tuple(mime_prefixes) if mime_prefixes else None
+        self.flood_policy = flood_policy
+        self.max_retries = max_retries
+        self.store = store
+        self.manifest_path = os.path.join(media_dir, "manifest.jsonl")
+        self.completed = self.load_manifest()
+        # Paths whose download failed in this run
+        self.failed = set()
+        self._tasks = []
+
+    def load_manifest(self):
+        """Return the set of media paths recorded as downloaded."""
+        completed = set()
+        try:
+            with open(self.manifest_path, "r", encoding="utf-8") as f:
+                for line in f:
+                    entry = json.loads(line)
+                    if entry.get("status") == "downloaded":
+                        completed.add(entry["path"])
+        except FileNotFoundError:
+            pass
+        return completed
+
+    def _record(self, **entry):
+        with open(self.manifest_path, "a", encoding="utf-8") as f:
+            f.write(json.dumps(entry) + "\n")
+
+    def plan(self, channel_username, message):
+        """
+        Choose the file path for a message's media, or None when it is filtered out.
+
+        Photos are saved as .jpg; documents use their MIME subtype as extension and
+        are dropped when their MIME type or size falls outside the filters.
+        """
+        media = message.media
+        if hasattr(media, "document") and media.document is not None:
+            mime_type = media.document.mime_type or ""
+            size = getattr(media.document, "size", None)
+            extension = mime_type.split("/")[-1]
+        elif hasattr(media, "photo"):
+            mime_type, size, extension = "image/jpeg", None, "jpg"
+        else:
+            return None
+
+        if self.mime_prefixes and not mime_type.startswith(self.mime_prefixes):
+            return None
+        if self.max_bytes and size is not None and size > self.max_bytes:
+            return None
+        return os.path.join(self.media_dir, f"{channel_username}_{message.id}.{extension}")
+
+    async def submit(self, media, media_path):
+        """Queue a download unless the file is already on disk; waits while the queue is full."""
+        if media_path in self.completed or os.path.exists(media_path):
+            return
+        if self.queue is None:
+            raise RuntimeError("MediaDownloader.start() must be awaited before submit()")
+        await self.queue.put((media, media_path))
+
+    async def start(self):
+        """Start the worker tasks."""
+        os.makedirs(self.media_dir, exist_ok=True)
+        self.queue = asyncio.Queue(maxsize=self.queue_size)
+        self._tasks = [asyncio.create_task(self._worker()) for _ in range(self.workers)]
+
+    async def close(self):
+        """Wait for every queued download to finish and stop the workers."""
+        for _ in self._tasks:
+            await self.queue.put(None)
+        await asyncio.gather(*self._tasks)
+        self._tasks = []
+        self.queue = None
+
+    async def _download(self, media, media_path):
+        """Download one file atomically, retrying after flood waits."""
+        for attempt in range(self.max_retries + 1):
+            if self.flood_policy:
+                await self.flood_policy.wait()
+            try:
+                part_path = await self.client.download_media(media, f"{media_path}.part")
+                os.replace(part_path, media_path)
+                return
+            except FloodWaitError as e:
+                if not self.flood_policy or attempt == self.max_retries:
+                    raise
+                self.flood_policy.backoff(attempt, e.seconds)
+
+    async def _worker(self):
+        while True:
+            item = await self.queue.get()
+            if item is None:
+                break
+            media, media_path = item
+            start = time.perf_counter()
+            try:
+                await self._download(media, media_path)
+                if self.store:
+                    await asyncio.to_thread(self.store.ingest, media_path)
+                seconds = time.perf_counter() - start
+                size = os.path.getsize(media_path)
+                self.completed.add(media_path)
+                self._record(path=media_path, status="downloaded", bytes=size, seconds=round(seconds, 3))
+                DOWNLOADS.inc(status="downloaded")
+                DOWNLOAD_SECONDS.observe(seconds)
+                DOWNLOAD_BYTES.inc(size)
+                row_log("media", "Downloaded media %s.", media_path)
+            except Exception as e:
+                DOWNLOADS.inc(status="failed")
+                self.failed.add(media_path)
+                self._record(path=media_path, status="failed", error=str(e))
+                logging.error(f"Error downloading media {media_path}: {e}")
@@ -0,0 +1,287 @@
+import argparse
+import logging
+import os
+import shutil
+import sqlite3
+import sys
+import threading
+import pandas as pd
+from PIL import Image, ImageOps
+
+# Allow running as `python scripts/media_store.py` as well as importing from the project root
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), "..")))
+
+from scripts.detection_cache import DetectionCache
+
+# EXIF tag telling how a photo was turned when it was taken
+EXIF_ORIENTATION = 0x0112
+
+
+class MediaStore:
+    """
+    Content-addressed store for downloaded media.
+
+    Each distinct file is kept once as a blob named by its SHA-256
+    (blobs/ab/abcd....jpg), with a thumbnail at the detector's input size
+    generated at ingest. The media table maps every message's media_path to
+    its blob, and the file at media_path becomes a hard link to the blob, so
+    existing readers keep working while reposts of the same image take no
+    extra space. Blobs are reference counted and removed by gc() once no
+    media_path points to them.
+    """
+
+    def __init__(self, root="data/raw/media_store", thumb_size=640, thumb_quality=90):
+        self.root = root
+        self.blob_dir = os.path.join(root, "blobs")
+        self.thumb_dir = os.path.join(root, "thumbs")
+        self.thumb_size = thumb_size
+        self.thumb_quality = thumb_quality
+        os.makedirs(self.blob_dir, exist_ok=True)
+        os.makedirs(self.thumb_dir, exist_ok=True)
+        # Shared by the download workers and the detection threads
+        self.lock = threading.Lock()
+        self.connection = sqlite3.connect(os.path.join(root, "index.sqlite"), check_same_thread=False)
+        self.connection.executescript(
+            """
+            CREATE TABLE IF NOT EXISTS blobs (
+                hash TEXT PRIMARY KEY,
+                extension TEXT NOT NULL,
+                bytes INTEGER NOT NULL,
+                width INTEGER,
+                height INTEGER,
+                refcount INTEGER NOT NULL DEFAULT 0,
+                created_at TEXT DEFAULT CURRENT_TIMESTAMP
+            );
+            CREATE TABLE IF NOT EXISTS media (
+                media_path TEXT PRIMARY KEY,
+                hash TEXT NOT NULL REFERENCES blobs (hash)
+            );
+            CREATE INDEX IF NOT EXISTS ix_media_hash ON media (hash);
+            """
+        )
+        self.connection.commit()
+
+    @staticmethod
+    def _key(media_path):
+        return os.path.normpath(media_path)
+
+    def blob_path(self, image_hash, extension):
+        return os.path.join(self.blob_dir, image_hash[:2], f"{image_hash}{extension}")
+
+    def thumb_path(self, image_hash):
+        return os.path.join(self.thumb_dir, image_hash[:2], f"{image_hash}.jpg")
+
+    @staticmethod
+    def _link(source, target):
+        """Atomically make target a hard link to source (a copy where links are unsupported)."""
+        tmp_path = f"{target}.link"
+        if os.path.lexists(tmp_path):
+            os.remove(tmp_path)
+        try:
+            os.link(source, tmp_path)
+        except OSError as e:
+            logging.warning(f"⚠️ Could not hard-link '{target}' to '{source}' ({e}); copying it instead.")
+            shutil.copy2(source, tmp_path)
+        os.replace(tmp_path, target)
+
+    def _make_thumbnail(self, blob, image_hash):
+        """Save an upright JPEG no larger than thumb_size and return the upright original (width, height), or None."""
+        try:
+            with Image.open(blob) as image:
+                size = image.size
+                # JPEGs are decoded at a reduced DCT scale straight away
+                image.draft("RGB", (self.thumb_size, self.thumb_size))
+                # Thumbnails are stored upright, so a quarter-turned original (orientations 5-8) reports its sides swapped
+                if image.getexif().get(EXIF_ORIENTATION) in (5, 6, 7, 8):
+                    size = size[::-1]
+                image = ImageOps.exif_transpose(image).convert("RGB")
+                image.thumbnail((self.thumb_size, self.thumb_size), Image.BILINEAR)
+                path = self.thumb_path(image_hash)
+                os.makedirs(os.path.dirname(path), exist_ok=True)
+                image.save(f"{path}.tmp", "JPEG", quality=self.thumb_quality)
+                os.replace(f"{path}.tmp", path)
+                return size
+        except Exception as e:
+            logging.warning(f"⚠️ No thumbnail for '{blob}': {e}")
+            return None
+
+    def ingest(self, media_path):
+        """
+        Add a downloaded file to the store and point media_path at its blob.
+
+        A file whose content is already stored is replaced by a link to the
+        existing blob. Ingesting a path again is a no-op. Returns the hash.
+        """
+        key = self._key(media_path)
+        image_hash = DetectionCache.hash_file(media_path)
+        extension = os.path.splitext(media_path)[1].lower()
+        blob = self.blob_path(image_hash, extension)
+        try:
+            with self.lock:
+                row = self.connection.execute("SELECT hash FROM media WHERE media_path = ?", (key,)).fetchone()
+                if row and row[0] == image_hash and os.path.exists(blob):
+                    return image_hash
+
+                stored = self.connection.execute("SELECT extension FROM blobs WHERE hash = ?", (image_hash,)).fetchone()
+                if stored and os.path.exists(self.blob_path(image_hash, stored[0])):
+                    # Known content: drop the new copy in favour of the stored blob
+                    self._link(self.blob_path(image_hash, stored[0]), media_path)
+                else:
+                    os.makedirs(os.path.dirname(blob), exist_ok=True)
+                    self._link(media_path, blob)
+                    size = self._make_thumbnail(blob, image_hash) or (None, None)
+                    self.connection.execute(
+                        "INSERT OR REPLACE INTO blobs (hash, extension, bytes, width, height, refcount) "
+                        "VALUES (?, ?, ?, ?, ?, (SELECT COUNT(*) FROM media WHERE hash = ?))",
+                        (image_hash, extension, os.path.getsize(blob), *size, image_hash),
+                    )
+
+                if row:
+                    self.connection.execute("UPDATE blobs SET refcount = refcount - 1 WHERE hash = ?", (row[0],))
+                self.connection.execute(
+                    "INSERT OR REPLACE INTO media (media_path, hash) VALUES (?, ?)", (key, image_hash)
+                )
+                self.connection.execute("UPDATE blobs SET refcount = refcount + 1 WHERE hash = ?", (image_hash,))
+                self.connection.commit()
+            return image_hash
+        except Exception as e:
+            self.connection.rollback()
+            logging.error(f"❌ Error adding '{media_path}' to the media store: {e}")
+            raise
+
+    def lookup(self, media_paths, chunk_size=500):
+        """
+        Return {media_path: (hash, thumbnail path or None, original width)}
+        for the paths in the store.
+        """
+        keys = {self._key(path): path for path in media_paths}
+        found = {}
+        items = list(keys)
+        for start in range(0, len(items), chunk_size):
+            chunk = items[start:start + chunk_size]
+            with self.lock:
+                rows = self.connection.execute(
+                    f"SELECT m.media_path, b.hash, b.width FROM media m JOIN blobs b ON b.hash = m.hash "
+                    f"WHERE m.media_path IN ({', '.join('?' * len(chunk))})",
+                    chunk,
+                ).fetchall()
+            for key, image_hash, width in rows:
+                thumb = self.thumb_path(image_hash)
+                found[keys[key]] = (image_hash, thumb if width and os.path.exists(thumb) else None, width)
+        return found
+
+    def release(self, media_paths):
+        """Unlink media paths from their blobs (and delete their files); gc() removes unused blobs."""
+        released = 0
+        with self.lock:
+            for media_path in media_paths:
+                key = self._key(media_path)
+                row = self.connection.execute("SELECT hash FROM media WHERE media_path = ?", (key,)).fetchone()
+                if not row:
+                    continue
+                self.connection.execute("DELETE FROM media WHERE media_path = ?", (key,))
+                self.connection.execute("UPDATE blobs SET refcount = refcount - 1 WHERE hash = ?", (row[0],))
+                if os.path.exists(media_path):
+                    os.remove(media_path)
+                released += 1
+            self.connection.commit()
+        return released
+
+    def release_unreferenced(self, referenced_paths):
+        """
+        Release every stored media path that is not in referenced_paths (e.g. after retention).
+
+        referenced_paths must include the raw data's: media of rows not cleaned
+        yet would otherwise be deleted, and the download manifest, which lists
+        them as completed, keeps them from being fetched again.
+        """
+        referenced = {self._key(path) for path in referenced_paths}
+        with self.lock:
+            stored = [row[0] for row in self.connection.execute("SELECT media_path FROM media")]
+        return self.release([path for path in stored if path not in referenced])
+
+    def gc(self):
+        """Delete blobs and thumbnails no media path refers to; returns (blobs, bytes) freed."""
+        with self.lock:
+            rows = self.connection.execute("SELECT hash, extension, bytes FROM blobs WHERE refcount <= 0").fetchall()
+            for image_hash, extension, _ in rows:
+                for path in (self.blob_path(image_hash, extension), self.thumb_path(image_hash)):
+                    if os.path.exists(path):
+                        os.remove(path)
+                self.connection.execute("DELETE FROM blobs WHERE hash = ?", (image_hash,))
+            self.connection.commit()
+        freed = sum(row[2] for row in rows)
+        logging.info(f"✅ Media store gc removed {len(rows)} blobs ({freed} bytes).")
+        return len(rows), freed
+
+    @property
+    def thumb_key(self):
+        """Identifies the thumbnails' size and quality, for caching results computed on them."""
+        return f"thumb{self.thumb_size}q{self.thumb_quality}"
+
+    def stats(self):
+        """Media paths, distinct blobs, and bytes stored versus bytes without deduplication."""
+        with self.lock:
+            paths, blobs, stored, logical = self.connection.execute(
+                "SELECT (SELECT COUNT(*) FROM media), COUNT(*), COALESCE(SUM(bytes), 0), "
+                "COALESCE(SUM(bytes * refcount), 0) FROM blobs"
+            ).fetchone()
+        return {"media_paths": paths, "blobs": blobs, "stored_bytes": stored, "logical_bytes": logical}
+
+    def close(self):
+        self.connection.close()
+
+
+def referenced_media_paths(data_path, raw=False):
+    """Media paths referenced by a raw (scraped) or cleaned CSV file or Parquet dataset."""
+    from scripts import columnar
+
+    if columnar.is_dataset_path(data_path):
+        schema = columnar.RAW_SCHEMA if raw else columnar.CLEANED_SCHEMA
+        paths = columnar.read_dataframe(data_path, schema, columns=["media_path"])["media_path"]
+    else:
+        column = columnar.RAW_CSV_COLUMNS["media_path"] if raw else "media_path"
+        paths = pd.read_csv(data_path, usecols=[column], dtype=str)[column]
+    return set(paths.dropna()) - {columnar.NO_MEDIA}
+
+
+if __name__ == "__main__":
+    os.makedirs("logs", exist_ok=True)
+    logging.basicConfig(
+        filename="logs/media_store.log",
+        level=logging.INFO,
+        format="%(asctime)s - %(levelname)s - %(message)s"
+    )
+
+    parser = argparse.ArgumentParser(description="Manage the content-addressed media store.")
+    parser.add_argument("command", choices=["ingest", "gc", "stats"])
+    parser.add_argument("--store", default="data/raw/media_store")
+    parser.add_argument("--media-dir", default="data/raw/photos", help="Directory of media files to ingest.")
+    parser.add_argument("--raw", nargs="+", default=None,
+                        help="With gc, first release media referenced by none of these raw CSV files or datasets "
+                             "(and of --cleaned).")
+    parser.add_argument("--cleaned", nargs="+", default=[],
+                        help="Cleaned CSV files or datasets whose media is also kept; requires --raw.")
+    args = parser.parse_args()
+    # Cleaned data lags the raw data, so it alone would release media of rows not cleaned yet
+    if args.cleaned and not args.raw:
+        parser.error("--cleaned requires --raw: media of raw rows not cleaned yet would be deleted")
+
+    store = MediaStore(args.store)
+    if args.command == "ingest":
+        names = sorted(name for name in os.listdir(args.media_dir) if not name.endswith((".part", ".jsonl", ".link")))
+        for name in names:
+            store.ingest(os.path.join(args.media_dir, name))
+        print(f"Ingested {len(names)} files.")
+    elif args.command == "gc":
+        if args.raw:
+            referenced = set()
+            for path in args.raw:
+                referenced |= referenced_media_paths(path, raw=True)
+            for path in args.cleaned:
+                referenced |= referenced_media_paths(path)
+            print(f"Released {store.release_unreferenced(referenced)} media paths.")
+        blobs, freed = store.gc()
+        print(f"Removed {blobs} blobs ({freed} bytes).")
+    print(store.stats())
+    store.close()
@@ -0,0 +1,290 @@
+import bisect
+import json
+import logging
+import math
+import os
+import threading
+import time
+from contextlib import contextmanager
+
+# Histogram bucket upper bounds in seconds: 0.5 ms to 60 s
+DEFAULT_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0)
+
+
+def _escape(value):
+    return str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+def _format_labels(labels, extra=None):
+    pairs = list(labels) + list(extra or ())
+    if not pairs:
+        return ""
+    return "{" + ",".join(f'{name}="{_escape(value)}"' for name, value in pairs) + "}"
+
+
+def _format_value(value):
+    if value == math.inf:
+        return "+Inf"
+    if isinstance(value, int):
+        return str(value)
+    return repr(float(value))
+
+
+class _Metric:
+    """ A named metric with one series per combination of label values. """
+
+    kind = None
+
+    def __init__(self, name, help_text, labelnames=()):
+        self.name = name
+        self.help = help_text
+        self.labelnames = tuple(labelnames)
+        self._series = {}
+        self._lock = threading.Lock()
+
+    def _key(self, labels):
+        if set(labels) != set(self.labelnames):
+            raise ValueError(f"{self.name} takes labels {self.labelnames}, got {tuple(labels)}")
+        return tuple((name, labels[name]) for name in self.labelnames)
+
+    def series(self):
+        with self._lock:
+            return list(self._series.items())
+
+
+class Counter(_Metric):
+    """ A value that only goes up, e.g. rows processed. """
+
+    kind = "counter"
+
+    def inc(self, amount=1, **labels):
+        key = self._key(labels)
+        with self._lock:
+            self._series[key] = self._series.get(key, 0) + amount
+
+    def value(self, **labels):
+        return self._series.get(self._key(labels), 0)
+
+    def samples(self):
+        return [(self.name, key, (), value) for key, value in self.series()]
+
+
+class Gauge(Counter):
+    """ A value that is set, e.g. the last measured rows/s. """
+
+    kind = "gauge"
+
+    def set(self, value, **labels):
+        key = self._key(labels)
+        with self._lock:
+            self._series[key] = value
+
+
+class Histogram(_Metric):
+    """ Counts of observations (seconds by default) in cumulative buckets, plus their sum. """
+
+    kind = "histogram"
+
+    def __init__(self, name, help_text, labelnames=(), buckets=DEFAULT_BUCKETS):
+        super().__init__(name, help_text, labelnames)
+        self.buckets = tuple(sorted(buckets)) + (math.inf,)
+
+    def observe(self, value, **labels):
+        key = self._key(labels)
+        with self._lock:
+            series = self._series.get(key)
+            if series is None:
+                series = self._series[key] = {"counts": [0] * len(self.buckets), "sum": 0.0, "count": 0}
+            series["counts"][bisect.bisect_left(self.buckets, value)] += 1
+            series["sum"] += value
+            series["count"] += 1
+
+    @contextmanager
+    def time(self, **labels):
+        """ Observe the seconds spent in the with block. """
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(time.perf_counter() - start, **labels)
+
+    def samples(self):
+        samples = []
+        for key, series in self.series():
+            cumulative = 0
+            for bound, count in zip(self.buckets, series["counts"]):
+                cumulative += count
+                samples.append((f"{self.name}_bucket", key, (("le", _format_value(bound)),), cumulative))
+            samples.append((f"{self.name}_sum", key, (), series["sum"]))
+            samples.append((f"{self.name}_count", key, (), series["count"]))
+        return samples
+
+    def quantile(self, q, **labels):
+        """ Estimate a quantile by linear interpolation inside its bucket (as histogram_quantile does). """
+        series = self._series.get(self._key(labels))
+        if not series or not series["count"]:
+            return None
+        return self._quantile(series, q)
+
+    def _quantile(self, series, q):
+        rank = q * series["count"]
+        cumulative, lower = 0, 0.0
+        for bound, count in zip(self.buckets, series["counts"]):
+            if count and cumulative + count >= rank:
+                if bound == math.inf:
+                    return lower
+                return lower + (bound - lower) * (rank - cumulative) / count
+            cumulative += count
+            lower = bound if bound != math.inf else lower
+        return lower
+
+
+class Registry:
+    """
+    Process-wide set of metrics.
+
+    Metrics are created on first use and shared by name afterwards, so a
+    module can declare the metrics it updates at import time.
+    """
+
+    def __init__(self):
+        self._metrics = {}
+        self._lock = threading.Lock()
+
+    def _get(self, cls, name, help_text, labelnames, **kwargs):
+        with self._lock:
+            metric = self._metrics.get(name)
+            if metric is None:
+                metric = self._metrics[name] = cls(name, help_text, labelnames, **kwargs)
+            elif type(metric) is not cls or metric.labelnames != tuple(labelnames):
+                raise ValueError(f"Metric {name} is already registered as a different {metric.kind}")
+            return metric
+
+    def counter(self, name, help_text, labelnames=()):
+        return self._get(Counter, name, help_text, labelnames)
+
+    def gauge(self, name, help_text, labelnames=()):
+        return self._get(Gauge, name, help_text, labelnames)
+
+    def histogram(self, name, help_text, labelnames=(), buckets=DEFAULT_BUCKETS):
+        return self._get(Histogram, name, help_text, labelnames, buckets=buckets)
+
+    def reset(self):
+        """ Drop every recorded value, keeping the metric definitions. """
+        for metric in list(self._metrics.values()):
+            with metric._lock:
+                metric._series.clear()
+
+    def render(self):
+        """ All metrics in the Prometheus text exposition format (version 0.0.4). """
+        lines = []
+        for name, metric in sorted(self._metrics.items()):
+            lines.append(f"# HELP {name} {metric.help}")
+            lines.append(f"# TYPE {name} {metric.kind}")
+            for sample_name, key, extra, value in metric.samples():
+                lines.append(f"{sample_name}{_format_labels(key, extra)} {_format_value(value)}")
+        return "\n".join(lines) + "\n"
+
+    def summary(self):
+        """
+        Recorded values as a JSON-friendly dict: one entry per metric and label set,
+        with count, sum, mean, p50 and p99 for histograms.
+        """
+        summary = {}
+        for name, metric in sorted(self._metrics.items()):
+            for key, value in metric.series():
+                series_name = name + _format_labels(key)
+                if metric.kind == "histogram":
+                    count = value["count"]
+                    summary[series_name] = {
+                        "count": count,
+                        "sum": round(value["sum"], 6),
+                        "mean": round(value["sum"] / count, 6) if count else None,
+                        "p50": round(metric._quantile(value, 0.5), 6) if count else None,
+                        "p99": round(metric._quantile(value, 0.99), 6) if count else None,
+                    }
+                else:
+                    summary[series_name] = value
+        return summary
+
+    def dump_summary(self, path=None):
+        """
+        Log the summary of a batch run and, with a path (default: METRICS_FILE),
+        also write it as JSON.
+        """
+        summary = self.summary()
+        for series_name, value in summary.items():
+            logging.info(f"Metric {series_name} {json.dumps(value)}")
+        path = path or os.getenv("METRICS_FILE")
+        if path:
+            os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+            with open(path, "w") as f:
+                json.dump(summary, f, indent=2)
+        return summary
+
+
+REGISTRY = Registry()
+
+STAGE_SECONDS = REGISTRY.histogram("pipeline_stage_seconds", "Wall time of a pipeline stage run.", ["stage"])
+STAGE_ROWS = REGISTRY.counter("pipeline_stage_rows_total", "Rows processed by a pipeline stage.", ["stage"])
+STAGE_ROWS_PER_SECOND = REGISTRY.gauge(
+    "pipeline_stage_rows_per_second", "Throughput of the last timed run of a pipeline stage.", ["stage"]
+)
+
+
+class StageTimer:
+    """ Times one run of a stage; add() the rows it processed to get its rows/s. """
+
+    def __init__(self, stage):
+        self.stage = stage
+        self.rows = 0
+
+    def add(self, rows):
+        self.rows += rows
+        STAGE_ROWS.inc(rows, stage=self.stage)
+
+
+@contextmanager
+def stage_timer(stage):
+    """ Record the wall time of a stage run, and its rows/s when rows were added to the timer. """
+    timer = StageTimer(stage)
+    start = time.perf_counter()
+    try:
+        yield timer
+    finally:
+        elapsed = time.perf_counter() - start
+        STAGE_SECONDS.observe(elapsed, stage=stage)
+        if timer.rows and elapsed > 0:
+            STAGE_ROWS_PER_SECOND.set(round(timer.rows / elapsed, 1), stage=stage)
+
+
+class RateLimitedLog:
+    """
+    Per-row log lines behind a level and a rate limit.
+
+    Nothing is formatted unless the level is enabled (DEBUG by default), and
+    then at most one line per key is written every `interval` seconds, noting
+    how many were suppressed in between.
+    """
+
+    def __init__(self, level=logging.DEBUG, interval=1.0):
+        self.level = level
+        self.interval = interval
+        self._next = {}
+        self._suppressed = {}
+
+    def __call__(self, key, message, *args):
+        if not logging.getLogger().isEnabledFor(self.level):
+            return
+        now = time.monotonic()
+        if now < self._next.get(key, 0.0):
+            self._suppressed[key] = self._suppressed.get(key, 0) + 1
+            return
+        self._next[key] = now + self.interval
+        suppressed = self._suppressed.pop(key, 0)
+        if suppressed:
+            message += f" ({suppressed} similar lines suppressed)"
+        logging.log(self.level, message, *args)
+
+
+row_log = RateLimitedLog(level=getattr(logging, os.getenv("ROW_LOG_LEVEL", "DEBUG").upper(), logging.DEBUG))
@@ -0,0 +1,382 @@
+import logging
+from datetime import date
+from sqlalchemy import text
+from my_project.search import FOLD_FROM, FOLD_TO
+
+# Monthly partitions of telegram_messages are named telegram_messages_pYYYY_MM
+PARTITION_PREFIX = "telegram_messages_p"
+DEFAULT_PARTITION = "telegram_messages_default"
+
+# Join key between a message's media file and a detection's image: the file name
+# without directory or extension (image names may or may not carry one)
+MEDIA_KEY_SQL = r"regexp_replace({column}, '^.*[/\\]|\.[^./\\]*$', '', 'g')"
+
+# PostgreSQL 13 is the first release with BEFORE ROW triggers on partitioned tables (m002)
+MIN_SERVER_VERSION = 130000
+
+
+def month_start(value):
+    """First day of the month containing a date or timestamp."""
+    return date(value.year, value.month, 1)
+
+
+def add_months(month, months):
+    index = month.year * 12 + month.month - 1 + months
+    return date(index // 12, index % 12 + 1, 1)
+
+
+def partition_name(month):
+    return f"{PARTITION_PREFIX}{month:%Y_%m}"
+
+
+def is_partitioned(connection, table="telegram_messages"):
+    return bool(connection.execute(
+        text("SELECT 1 FROM pg_partitioned_table WHERE partrelid = to_regclass(:table)"), {"table": table}
+    ).scalar())
+
+
+def list_month_partitions(connection):
+    """Return {month: partition name} for the monthly partitions of telegram_messages."""
+    names = connection.execute(text("""
+        SELECT c.relname FROM pg_inherits i JOIN pg_class c ON c.oid = i.inhrelid
+        WHERE i.inhparent = 'telegram_messages'::regclass
+    """)).scalars()
+    partitions = {}
+    for name in names:
+        if name.startswith(PARTITION_PREFIX):
+            year, month = name[len(PARTITION_PREFIX):].split("_")
+            partitions[date(int(year), int(month), 1)] = name
+    return partitions
+
+
+def insertable_columns(connection, table="telegram_messages"):
+    """Comma-separated columns of a table, minus the generated ones."""
+    return connection.execute(text("""
+        SELECT string_agg(quote_ident(attname), ', ' ORDER BY attnum) FROM pg_attribute
+        WHERE attrelid = to_regclass(:table) AND attnum > 0 AND NOT attisdropped AND attgenerated = ''
+    """), {"table": table}).scalar()
+
+
+def create_month_partition(connection, month):
+    """
+    Create the partition for one month.
+
+    Rows of that month already sitting in the DEFAULT partition are moved into
+    the new table before it is attached, since ATTACH refuses a range the
+    default partition still holds rows for.
+    """
+    name = partition_name(month)
+    bounds = {"lower": month, "upper": add_months(month, 1)}
+    columns = insertable_columns(connection)
+    connection.execute(text(f"CREATE TABLE {name} (LIKE telegram_messages INCLUDING DEFAULTS INCLUDING GENERATED)"))
+    connection.execute(text(f"""
+        WITH moved AS (
+            DELETE FROM {DEFAULT_PARTITION}
+            WHERE message_date >= :lower AND message_date < :upper
+            RETURNING *
+        )
+        INSERT INTO {name} ({columns}) SELECT {columns} FROM moved
+    """), bounds)
+    connection.execute(text(
+        f"ALTER TABLE telegram_messages ATTACH PARTITION {name} "
+        f"FOR VALUES FROM ('{bounds['lower']}') TO ('{bounds['upper']}')"
+    ))
+    logging.info(f"Created partition {name}.")
+    return name
+
+
+def month_range(start, end):
+    """Month starts from start's month through end's month."""
+    month = month_start(start)
+    while month <= month_start(end):
+        yield month
+        month = add_months(month, 1)
+
+
+def upcoming_months(months_ahead=3):
+    """The current month and months_ahead months after it."""
+    today = date.today()
+    return list(month_range(today, add_months(today, months_ahead)))
+
+
+def ensure_month_partitions(connection, months):
+    """Create the partitions missing for the given months; concurrent callers are serialized."""
+    connection.execute(text("SELECT pg_advisory_xact_lock(hashtext('telegram_messages_partitions'))"))
+    existing = list_month_partitions(connection)
+    return [
+        create_month_partition(connection, month)
+        for month in sorted({month_start(month) for month in months})
+        if month not in existing
+    ]
+
+
+def drop_month_partitions_before(connection, cutoff):
+    """
+    Drop every monthly partition that ends on or before cutoff.
+
+    Their message_ids are released from the dedup registry first, so the same
+    messages could be loaded again later.
+    """
+    dropped = []
+    for month, name in sorted(list_month_partitions(connection).items()):
+        if add_months(month, 1) > cutoff:
+            continue
+        connection.execute(text(
+            f"DELETE FROM telegram_message_ids r USING {name} p WHERE r.message_id = p.message_id"
+        ))
+        connection.execute(text(f"ALTER TABLE telegram_messages DETACH PARTITION {name}"))
+        connection.execute(text(f"DROP TABLE {name}"))
+        dropped.append(name)
+        logging.info(f"Dropped partition {name}.")
+    return dropped
+
+
+def m001_base_tables(connection):
+    connection.execute(text("""
+        CREATE TABLE IF NOT EXISTS telegram_messages (
+            id SERIAL PRIMARY KEY,
+            channel_title TEXT,
+            channel_username TEXT,
+            message_id BIGINT UNIQUE,
+            message TEXT,
+            message_date TIMESTAMP,
+            media_path TEXT,
+            emoji_used TEXT,
+            youtube_links TEXT
+        )
+    """))
+    connection.execute(text("""
+        CREATE TABLE IF NOT EXISTS detected_objects (
+            id SERIAL PRIMARY KEY,
+            image_name TEXT NOT NULL,
+            class_id INTEGER NOT NULL,
+            x_center FLOAT NOT NULL,
+            y_center FLOAT NOT NULL,
+            width FLOAT NOT NULL,
+            height FLOAT NOT NULL,
+            confidence FLOAT NOT NULL,
+            detection_timestamp TIMESTAMP DEFAULT NOW()
+        )
+    """))
+
+
+def m002_partition_telegram_messages(connection, months_ahead=3):
+    """
+    Rebuild telegram_messages as a table range-partitioned by month on message_date.
+
+    A unique index on a partitioned table must contain the partition key, so
+    message_id uniqueness moves to the telegram_message_ids registry. A BEFORE
+    INSERT trigger claims each message_id there and silently drops the row when
+    the ID is already taken, which keeps the loaders' skip-duplicates behaviour.
+    Row triggers on a partitioned table need PostgreSQL 13 or later.
+    """
+    if is_partitioned(connection):
+        return
+
+    columns = "id, channel_title, channel_username, message_id, message, message_date, media_path, emoji_used, youtube_links"
+    connection.execute(text("ALTER TABLE telegram_messages RENAME TO telegram_messages_unpartitioned"))
+    # Keep the id sequence alive after the old table is dropped
+    connection.execute(text("ALTER SEQUENCE telegram_messages_id_seq OWNED BY NONE"))
+    connection.execute(text("""
+        CREATE TABLE telegram_messages (
+            id INTEGER NOT NULL DEFAULT nextval('telegram_messages_id_seq'),
+            channel_title TEXT,
+            channel_username TEXT,
+            message_id BIGINT,
+            message TEXT,
+            message_date TIMESTAMP,
+            media_path TEXT,
+            emoji_used TEXT,
+            youtube_links TEXT
+        ) PARTITION BY RANGE (message_date)
+    """))
+    connection.execute(text("ALTER SEQUENCE telegram_messages_id_seq OWNED BY telegram_messages.id"))
+    # Rows without a date, or outside every monthly partition, land here
+    connection.execute(text(f"CREATE TABLE {DEFAULT_PARTITION} PARTITION OF telegram_messages DEFAULT"))
+
+    connection.execute(text("CREATE TABLE IF NOT EXISTS telegram_message_ids (message_id BIGINT PRIMARY KEY)"))
+    connection.execute(text("""
+        CREATE OR REPLACE FUNCTION telegram_messages_claim_id() RETURNS trigger AS $$
+        BEGIN
+            IF NEW.message_id IS NULL THEN
+                RETURN NEW;
+            END IF;
+            INSERT INTO telegram_message_ids (message_id) VALUES (NEW.message_id) ON CONFLICT DO NOTHING;
+            IF NOT FOUND THEN
+                RETURN NULL;
+            END IF;
+            RETURN NEW;
+        END;
+        $$ LANGUAGE plpgsql
+    """))
+    connection.execute(text("""
+        CREATE TRIGGER telegram_messages_claim_id BEFORE INSERT ON telegram_messages
+        FOR EACH ROW EXECUTE FUNCTION telegram_messages_claim_id()
+    """))
+
+    # One partition per month that holds data, plus the current month and months_ahead more
+    months = connection.execute(text(
+        "SELECT DISTINCT date_trunc('month', message_date) FROM telegram_messages_unpartitioned "
+        "WHERE message_date IS NOT NULL"
+    )).scalars().all()
+    ensure_month_partitions(connection, [*months, *upcoming_months(months_ahead)])
+
+    moved = connection.execute(text(f"""
+        INSERT INTO telegram_messages ({columns})
+        SELECT {columns} FROM telegram_messages_unpartitioned ORDER BY id
+    """)).rowcount
+    connection.execute(text("DROP TABLE telegram_messages_unpartitioned"))
+    logging.info(f"Moved {moved} rows into the partitioned telegram_messages table.")
+
+
+def m003_indexes(connection):
+    """BRIN indexes on the date columns, plus the B-tree indexes the API and rollups filter on."""
+    for statement in [
+        "CREATE INDEX IF NOT EXISTS ix_telegram_messages_message_date_brin ON telegram_messages USING BRIN (message_date)",
+        "CREATE INDEX IF NOT EXISTS ix_detected_objects_detection_timestamp_brin ON detected_objects USING BRIN (detection_timestamp)",
+        "CREATE INDEX IF NOT EXISTS ix_telegram_messages_id ON telegram_messages (id)",
+        "CREATE INDEX IF NOT EXISTS ix_telegram_messages_message_id ON telegram_messages (message_id)",
+        "CREATE INDEX IF NOT EXISTS ix_telegram_messages_channel_username_id ON telegram_messages (channel_username, id)",
+        "CREATE INDEX IF NOT EXISTS ix_telegram_messages_channel_username_message_date "
+        "ON telegram_messages (channel_username, message_date)",
+    ]:
+        connection.execute(text(statement))
+
+
+def m004_message_search(connection):
+    """
+    Full-text search over message text: a stored tsvector column with a GIN index.
+
+    The column is generated, so every insert path (loaders, API, moves between
+    partitions) maintains it. Text goes through telegram_search_text(), which
+    folds Amharic homophone letters and Ethiopic punctuation like
+    my_project/search.py, and is indexed with both the english configuration
+    (stemmed English words) and the simple one (every other word, Amharic
+    included, as written).
+    """
+    connection.execute(text(f"""
+        CREATE OR REPLACE FUNCTION telegram_search_text(body TEXT) RETURNS TEXT
+        LANGUAGE sql IMMUTABLE PARALLEL SAFE
+        AS $$ SELECT translate(lower(coalesce(body, '')), '{FOLD_FROM}', '{FOLD_TO}') $$
+    """))
+    connection.execute(text("""
+        ALTER TABLE telegram_messages ADD COLUMN IF NOT EXISTS search_vector tsvector
+        GENERATED ALWAYS AS (
+            to_tsvector('english'::regconfig, telegram_search_text(message))
+            || to_tsvector('simple'::regconfig, telegram_search_text(message))
+        ) STORED
+    """))
+    connection.execute(text(
+        "CREATE INDEX IF NOT EXISTS ix_telegram_messages_search_vector ON telegram_messages USING GIN (search_vector)"
+    ))
+
+
+def m005_near_duplicate_columns(connection):
+    """Near-duplicate tags written by the cleaning stage (scripts/near_duplicates.py)."""
+    connection.execute(text("""
+        ALTER TABLE telegram_messages
+            ADD COLUMN IF NOT EXISTS cluster_id BIGINT,
+            ADD COLUMN IF NOT EXISTS canonical_message_id BIGINT
+    """))
+    connection.execute(text(
+        "CREATE INDEX IF NOT EXISTS ix_telegram_messages_canonical_message_id ON telegram_messages (canonical_message_id)"
+    ))
+
+
+def m006_rollup_tables(connection):
+    """
+    Channel x day (x detected class) rollups behind the /analytics endpoints,
+    kept up to date by DatabaseManager.refresh_rollups, and the media key
+    indexes their refresh joins messages and detections on.
+    """
+    for statement in [
+        """
+        CREATE TABLE IF NOT EXISTS channel_daily_rollup (
+            channel_username TEXT NOT NULL,
+            message_day DATE NOT NULL,
+            channel_title TEXT,
+            total_messages INTEGER NOT NULL,
+            total_media INTEGER NOT NULL,
+            PRIMARY KEY (channel_username, message_day)
+        )
+        """,
+        """
+        CREATE TABLE IF NOT EXISTS channel_daily_class_rollup (
+            channel_username TEXT NOT NULL,
+            message_day DATE NOT NULL,
+            class_id INTEGER NOT NULL,
+            detections INTEGER NOT NULL,
+            images INTEGER NOT NULL,
+            confidence_sum DOUBLE PRECISION NOT NULL,
+            PRIMARY KEY (channel_username, message_day, class_id)
+        )
+        """,
+        f"CREATE INDEX IF NOT EXISTS ix_telegram_messages_media_key ON telegram_messages "
+        f"(({MEDIA_KEY_SQL.format(column='media_path')}))",
+        f"CREATE INDEX IF NOT EXISTS ix_detected_objects_image_key ON detected_objects "
+        f"(({MEDIA_KEY_SQL.format(column='image_name')}))",
+    ]:
+        connection.execute(text(statement))
+
+
+def m007_keyset_indexes(connection):
+    """Indexes backing the API's keyset pages (ORDER BY id) under its date, class and confidence filters."""
+    for statement in [
+        "CREATE INDEX IF NOT EXISTS ix_telegram_messages_message_date_id ON telegram_messages (message_date, id)",
+        "CREATE INDEX IF NOT EXISTS ix_detected_objects_class_id_id ON detected_objects (class_id, id)",
+        "CREATE INDEX IF NOT EXISTS ix_detected_objects_confidence_id ON detected_objects (confidence, id)",
+    ]:
+        connection.execute(text(statement))
+
+
+# (version, description, migration); append new entries, never edit applied ones
+MIGRATIONS = [
+    (1, "base telegram_messages and detected_objects tables", m001_base_tables),
+    (2, "partition telegram_messages by month on message_date", m002_partition_telegram_messages),
+    (3, "BRIN date indexes and query indexes", m003_indexes),
+    (4, "search_vector column and GIN index on telegram_messages", m004_message_search),
+    (5, "near-duplicate cluster columns on telegram_messages", m005_near_duplicate_columns),
+    (6, "channel daily rollup tables and media key indexes", m006_rollup_tables),
+    (7, "keyset pagination indexes on message dates and detection classes", m007_keyset_indexes),
+]
+
+
+def migrate(engine, migrations=MIGRATIONS):
+    """
+    Apply the migrations not yet recorded in schema_migrations, in version order.
+
+    Each migration runs in its own transaction together with its bookkeeping
+    row, under an advisory lock so concurrent callers apply it only once.
+    Returns the versions applied by this call.
+    """
+    with engine.begin() as connection:
+        server_version = int(connection.execute(text("SHOW server_version_num")).scalar())
+        if server_version < MIN_SERVER_VERSION:
+            raise RuntimeError(
+                f"PostgreSQL 13 or later is required (server version number {server_version}): "
+                "the partitioned telegram_messages table relies on row triggers"
+            )
+        connection.execute(text("""
+            CREATE TABLE IF NOT EXISTS schema_migrations (
+                version INTEGER PRIMARY KEY,
+                description TEXT NOT NULL,
+                applied_at TIMESTAMP NOT NULL DEFAULT NOW()
+            )
+        """))
+
+    applied = []
+    for version, description, migration in sorted(migrations, key=lambda m: m[0]):
+        with engine.begin() as connection:
+            connection.execute(text("SELECT pg_advisory_xact_lock(hashtext('schema_migrations'))"))
+            if connection.execute(
+                text("SELECT 1 FROM schema_migrations WHERE version = :version"), {"version": version}
+            ).scalar():
+                continue
+            migration(connection)
+            connection.execute(
+                text("INSERT INTO schema_migrations (version, description) VALUES (:version, :description)"),
+                {"version": version, "description": description},
+            )
+        applied.append(version)
+        logging.info(f"✅ Applied migration {version}: {description}.")
+    return applied
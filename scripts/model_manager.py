@@ -0,0 +1,437 @@
+import argparse
+import ast
+import json
+import logging
+import os
+import shutil
+import sys
+import tempfile
+import time
+from datetime import datetime, timezone
+from pathlib import Path
+
+import numpy as np
+import torch
+from PIL import Image
+from yolov5.models.common import AutoShape, Detections
+from yolov5.models.yolo import Detect
+from yolov5.utils.dataloaders import exif_transpose, letterbox
+from yolov5.utils.general import Profile, make_divisible, non_max_suppression, scale_boxes
+
+# Allow running as `python scripts/model_manager.py` as well as importing from the project root
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), "..")))
+
+from scripts.detection_cache import DetectionCache
+
+# eager runs the PyTorch checkpoint through yolov5's AutoShape; the others run an exported graph
+ENGINES = ("eager", "torchscript", "onnx", "onnx-int8")
+# File names of the exported graphs, with the suffixes yolov5's DetectMultiBackend recognises
+EXPORT_FILES = {"torchscript": "model.torchscript", "onnx": "model.onnx", "onnx-int8": "model.int8.onnx"}
+ONNX_OPSET = 17
+
+
+def configure_threads(threads=None, inter_op_threads=None):
+    """
+    Set the intra-op (per operator) and inter-op (between operators) thread
+    pools of PyTorch; None keeps the default of one thread per core.
+    """
+    if threads:
+        torch.set_num_threads(threads)
+    if inter_op_threads:
+        try:
+            torch.set_num_interop_threads(inter_op_threads)
+        except RuntimeError as e:
+            # Only possible before the first parallel operator has run in the process
+            logging.warning(f"⚠️ Inter-op threads left at {torch.get_num_interop_threads()}: {e}")
+
+
+def load_checkpoint(weights_path):
+    """
+    Load a YOLOv5 checkpoint as a fused FP32 DetectionModel in eval mode.
+
+    Checkpoints pickle the model class, which torch.load only unpickles with
+    weights_only=False; callers pass files whose hash they have checked.
+    """
+    checkpoint = torch.load(weights_path, map_location="cpu", weights_only=False)
+    model = (checkpoint.get("ema") or checkpoint["model"]).float()
+    if not hasattr(model, "stride"):
+        model.stride = torch.tensor([32.0])
+    if isinstance(model.names, (list, tuple)):
+        model.names = dict(enumerate(model.names))
+    return model.fuse().eval()
+
+
+class ExportedEngine:
+    """
+    Runs an exported TorchScript or ONNX graph with the pre- and post-processing
+    of yolov5's AutoShape (letterbox, NMS, boxes scaled back), so it can stand
+    in for the eager model: engine(images, size=640) returns Detections.
+    """
+
+    def __init__(self, kind, forward, names, stride):
+        self.kind = kind
+        self.forward = forward
+        self.names = names
+        self.stride = stride
+        # Same defaults as AutoShape
+        self.conf = 0.25
+        self.iou = 0.45
+        self.classes = None
+        self.agnostic = False
+        self.multi_label = False
+        self.max_det = 1000
+
+    @torch.inference_mode()
+    def __call__(self, ims, size=640):
+        dt = (Profile(), Profile(), Profile())
+        with dt[0]:
+            n, ims = (len(ims), list(ims)) if isinstance(ims, (list, tuple)) else (1, [ims])
+            shape0, shape1, files = [], [], []
+            for i, im in enumerate(ims):
+                f = f"image{i}"
+                if isinstance(im, (str, Path)):
+                    with Image.open(im) as image:
+                        im, f = np.asarray(exif_transpose(image).convert("RGB")), im
+                files.append(Path(f).with_suffix(".jpg").name)
+                im = im[..., :3]
+                s = im.shape[:2]
+                shape0.append(s)
+                g = size / max(s)
+                shape1.append([int(y * g) for y in s])
+                ims[i] = np.ascontiguousarray(im)
+            shape1 = [make_divisible(x, self.stride) for x in np.array(shape1).max(0)]
+            x = np.stack([letterbox(im, shape1, auto=False)[0] for im in ims]).transpose((0, 3, 1, 2))
+            x = torch.from_numpy(np.ascontiguousarray(x)).float() / 255
+
+        with dt[1]:
+            y = self.forward(x)
+
+        with dt[2]:
+            y = non_max_suppression(y, self.conf, self.iou, self.classes, self.agnostic, self.multi_label,
+                                    max_det=self.max_det)
+            for i in range(n):
+                scale_boxes(shape1, y[i][:, :4], shape0[i])
+
+        return Detections(ims, y, files, dt, self.names, x.shape)
+
+
+class ModelManager:
+    """
+    Local, versioned cache of detection weights and the engines exported from them.
+
+    Layout: <cache_dir>/<name>/<version>/ holds weights.pt, its exports and a
+    manifest.json with their SHA-256s; <cache_dir>/<name>/current names the
+    version used by default. Loading never touches the network, so a cache
+    filled with `add` (or `fetch`) on a connected machine can be copied to
+    air-gapped workers.
+    """
+
+    def __init__(self, cache_dir=None):
+        self.cache_dir = cache_dir or os.getenv("MODEL_CACHE", "data/models")
+
+    def version_dir(self, name, version):
+        return os.path.join(self.cache_dir, name, version)
+
+    def weights_path(self, name, version):
+        # Absolute, so yolov5 never mistakes the path for a Hugging Face repo ID
+        return os.path.abspath(os.path.join(self.version_dir(name, version), "weights.pt"))
+
+    def manifest(self, name, version):
+        with open(os.path.join(self.version_dir(name, version), "manifest.json")) as f:
+            return json.load(f)
+
+    def _save_manifest(self, manifest):
+        path = os.path.join(self.version_dir(manifest["name"], manifest["version"]), "manifest.json")
+        with open(f"{path}.tmp", "w") as f:
+            json.dump(manifest, f, indent=2)
+        os.replace(f"{path}.tmp", path)
+
+    def versions(self, name):
+        directory = os.path.join(self.cache_dir, name)
+        if not os.path.isdir(directory):
+            return []
+        return sorted(
+            entry for entry in os.listdir(directory)
+            if os.path.isfile(os.path.join(directory, entry, "manifest.json"))
+        )
+
+    def current(self, name):
+        try:
+            with open(os.path.join(self.cache_dir, name, "current")) as f:
+                return f.read().strip()
+        except FileNotFoundError:
+            return None
+
+    def set_current(self, name, version):
+        if version not in self.versions(name):
+            raise ValueError(f"No version '{version}' of '{name}' in {self.cache_dir}")
+        path = os.path.join(self.cache_dir, name, "current")
+        with open(f"{path}.tmp", "w") as f:
+            f.write(version)
+        os.replace(f"{path}.tmp", path)
+
+    def add(self, weights_path, name=None, version=None, make_current=True):
+        """
+        Copy a weights file into the cache; the version defaults to the start of
+        its SHA-256, so adding the same file again is a no-op. Returns (name, version).
+        """
+        try:
+            sha256 = DetectionCache.hash_file(weights_path)
+            name = name or Path(weights_path).stem
+            version = version or sha256[:12]
+            directory = self.version_dir(name, version)
+            if version in self.versions(name):
+                if self.manifest(name, version)["sha256"] != sha256:
+                    raise ValueError(f"Version '{version}' of '{name}' already holds different weights")
+            else:
+                os.makedirs(directory, exist_ok=True)
+                shutil.copyfile(weights_path, f"{self.weights_path(name, version)}.tmp")
+                os.replace(f"{self.weights_path(name, version)}.tmp", self.weights_path(name, version))
+                self._save_manifest({
+                    "name": name,
+                    "version": version,
+                    "sha256": sha256,
+                    "source": os.path.abspath(weights_path),
+                    "added_at": datetime.now(timezone.utc).isoformat(timespec="seconds"),
+                    "exports": {},
+                })
+                logging.info(f"✅ Added '{weights_path}' to the model cache as {name}/{version}.")
+            if make_current or not self.current(name):
+                self.set_current(name, version)
+            return name, version
+        except Exception as e:
+            logging.error(f"❌ Error adding '{weights_path}' to the model cache: {e}")
+            raise
+
+    def fetch(self, name, version=None):
+        """
+        Download released weights (e.g. yolov5s) from the yolov5 GitHub releases
+        into the cache. The only method that needs network access.
+        """
+        from yolov5.utils.downloads import attempt_download
+
+        with tempfile.TemporaryDirectory() as directory:
+            path = attempt_download(os.path.join(directory, f"{name}.pt"))
+            return self.add(path, name, version)
+
+    def resolve(self, model, version=None):
+        """
+        Turn a cached model name (and optional version) or a weights file path
+        into (name, version); a file is added to the cache first.
+        """
+        if os.path.isfile(model):
+            return self.add(model, make_current=False)
+        version = version or self.current(model)
+        if not version or version not in self.versions(model):
+            raise FileNotFoundError(
+                f"No cached weights for '{model}'{f' version {version}' if version else ''} in {self.cache_dir}. "
+                f"Add them with `python scripts/model_manager.py add <weights.pt> --name {model}`, "
+                f"or `fetch {model}` where GitHub is reachable."
+            )
+        return model, version
+
+    def verify(self, name, version):
+        """Check the cached weights against the hash recorded when they were added."""
+        path = self.weights_path(name, version)
+        if DetectionCache.hash_file(path) != self.manifest(name, version)["sha256"]:
+            raise ValueError(f"Cached weights {path} do not match their manifest; add them again")
+        return path
+
+    def export(self, name, version=None, engine="onnx", img_size=640):
+        """
+        Export the weights to an engine's graph unless already done for this
+        torch version. Graphs take any batch size and image shape; img_size is
+        only the shape traced. Returns the exported file.
+        """
+        if engine not in EXPORT_FILES:
+            raise ValueError(f"Cannot export to '{engine}'; choose one of {', '.join(EXPORT_FILES)}")
+        name, version = self.resolve(name, version)
+        manifest = self.manifest(name, version)
+        path = os.path.join(self.version_dir(name, version), EXPORT_FILES[engine])
+        recorded = manifest["exports"].get(engine)
+        if recorded and recorded["torch"] == torch.__version__ and os.path.exists(path):
+            return path
+
+        try:
+            start = time.perf_counter()
+            if engine == "onnx-int8":
+                self._quantize_onnx(self.export(name, version, "onnx", img_size), path)
+            else:
+                model = load_checkpoint(self.verify(name, version))
+                for module in model.modules():
+                    if isinstance(module, Detect):
+                        # Grids are rebuilt from the input shape, so the graph is not tied to img_size
+                        module.inplace, module.dynamic, module.export = False, True, True
+                metadata = {"stride": int(max(model.stride)), "names": model.names}
+                example = torch.zeros(1, 3, img_size, img_size)
+                if engine == "torchscript":
+                    self._export_torchscript(model, example, metadata, path)
+                else:
+                    self._export_onnx(model, example, metadata, path)
+
+            manifest = self.manifest(name, version)
+            manifest["exports"][engine] = {
+                "file": EXPORT_FILES[engine],
+                "sha256": DetectionCache.hash_file(path),
+                "torch": torch.__version__,
+                "exported_at": datetime.now(timezone.utc).isoformat(timespec="seconds"),
+            }
+            self._save_manifest(manifest)
+            logging.info(f"✅ Exported {name}/{version} to {engine} in {time.perf_counter() - start:.1f}s.")
+            return path
+        except Exception as e:
+            logging.error(f"❌ Error exporting {name}/{version} to {engine}: {e}")
+            raise
+
+    @staticmethod
+    def _export_torchscript(model, example, metadata, path):
+        with torch.inference_mode():
+            traced = torch.jit.trace(model, example, strict=False)
+        # Metadata as yolov5's export writes it, so its detect.py can run the file too
+        config = json.dumps({"shape": list(example.shape), **metadata})
+        traced.save(f"{path}.tmp", _extra_files={"config.txt": config})
+        os.replace(f"{path}.tmp", path)
+
+    @staticmethod
+    def _export_onnx(model, example, metadata, path):
+        import onnx
+
+        torch.onnx.export(
+            model, example, f"{path}.tmp", opset_version=ONNX_OPSET, do_constant_folding=True,
+            input_names=["images"], output_names=["output0"],
+            dynamic_axes={"images": {0: "batch", 2: "height", 3: "width"}, "output0": {0: "batch", 1: "anchors"}},
+            dynamo=False,
+        )
+        graph = onnx.load(f"{path}.tmp")
+        ModelManager._set_onnx_metadata(graph, metadata)
+        onnx.save(graph, f"{path}.tmp")
+        os.replace(f"{path}.tmp", path)
+
+    @staticmethod
+    def _quantize_onnx(source, path):
+        """Dynamic int8 quantization: int8 weights, activations quantized per batch at run time."""
+        import onnx
+        from onnxruntime.quantization import QuantType, quantize_dynamic
+
+        quantize_dynamic(source, f"{path}.tmp", weight_type=QuantType.QUInt8)
+        graph = onnx.load(f"{path}.tmp")
+        metadata = {prop.key: prop.value for prop in onnx.load(source, load_external_data=False).metadata_props}
+        ModelManager._set_onnx_metadata(graph, metadata)
+        onnx.save(graph, f"{path}.tmp")
+        os.replace(f"{path}.tmp", path)
+
+    @staticmethod
+    def _set_onnx_metadata(graph, metadata):
+        del graph.metadata_props[:]
+        for key, value in metadata.items():
+            prop = graph.metadata_props.add()
+            prop.key, prop.value = key, str(value)
+
+    def load(self, model="yolov5s", version=None, engine="eager", threads=None, inter_op_threads=None):
+        """
+        Load a cached model as an engine, exporting it first when needed.
+
+        Returns an object called like yolov5's AutoShape model:
+        engine(images, size=...) -> Detections, with names, conf and iou.
+        """
+        if engine not in ENGINES:
+            raise ValueError(f"Unknown engine '{engine}'; choose one of {', '.join(ENGINES)}")
+        start = time.perf_counter()
+        name, version = self.resolve(model, version)
+        configure_threads(threads, inter_op_threads)
+        try:
+            if engine == "eager":
+                loaded = AutoShape(load_checkpoint(self.verify(name, version)))
+            elif engine == "torchscript":
+                loaded = self._load_torchscript(self.export(name, version, engine))
+            else:
+                loaded = self._load_onnx(self.export(name, version, engine), threads, inter_op_threads)
+        except Exception as e:
+            logging.error(f"❌ Error loading {name}/{version} as {engine}: {e}")
+            raise
+        logging.info(
+            f"✅ Loaded {name}/{version} as {engine} in {time.perf_counter() - start:.2f}s "
+            f"({torch.get_num_threads()} threads, {torch.get_num_interop_threads()} inter-op)."
+        )
+        return loaded
+
+    @staticmethod
+    def _load_torchscript(path):
+        extra_files = {"config.txt": ""}
+        module = torch.jit.load(path, _extra_files=extra_files, map_location="cpu").eval()
+        config = json.loads(extra_files["config.txt"])
+        names = {int(key): value for key, value in config["names"].items()}
+        return ExportedEngine("torchscript", lambda x: module(x)[0], names, config["stride"])
+
+    @staticmethod
+    def _load_onnx(path, threads=None, inter_op_threads=None):
+        import onnxruntime
+
+        options = onnxruntime.SessionOptions()
+        options.graph_optimization_level = onnxruntime.GraphOptimizationLevel.ORT_ENABLE_ALL
+        if threads:
+            options.intra_op_num_threads = threads
+        if inter_op_threads:
+            options.inter_op_num_threads = inter_op_threads
+            if inter_op_threads > 1:
+                options.execution_mode = onnxruntime.ExecutionMode.ORT_PARALLEL
+        session = onnxruntime.InferenceSession(path, options, providers=["CPUExecutionProvider"])
+        metadata = session.get_modelmeta().custom_metadata_map
+        # Written as a Python dict literal, as yolov5's export does
+        names = ast.literal_eval(metadata["names"])
+        input_name, output_name = session.get_inputs()[0].name, session.get_outputs()[0].name
+        kind = "onnx-int8" if path.endswith(EXPORT_FILES["onnx-int8"]) else "onnx"
+
+        def forward(x):
+            return torch.from_numpy(session.run([output_name], {input_name: x.numpy()})[0])
+
+        return ExportedEngine(kind, forward, names, int(metadata["stride"]))
+
+
+if __name__ == "__main__":
+    os.makedirs("logs", exist_ok=True)
+    logging.basicConfig(
+        filename="logs/model_manager.log",
+        level=logging.INFO,
+        format="%(asctime)s - %(levelname)s - %(message)s"
+    )
+
+    parser = argparse.ArgumentParser(description="Manage the local cache of detection weights and exported engines.")
+    parser.add_argument("--cache-dir", default=None, help="Cache directory (default: MODEL_CACHE or data/models).")
+    commands = parser.add_subparsers(dest="command", required=True)
+    add = commands.add_parser("add", help="Copy a weights file into the cache.")
+    add.add_argument("weights")
+    add.add_argument("--name", help="Model name (default: the file name without .pt).")
+    add.add_argument("--version", help="Version label (default: the start of the file's SHA-256).")
+    fetch = commands.add_parser("fetch", help="Download released weights, e.g. yolov5s (needs network access).")
+    fetch.add_argument("name")
+    fetch.add_argument("--version")
+    export = commands.add_parser("export", help="Export cached weights to an engine.")
+    export.add_argument("name")
+    export.add_argument("--version")
+    export.add_argument("--engine", choices=list(EXPORT_FILES), nargs="+", default=["onnx"])
+    export.add_argument("--img-size", type=int, default=640)
+    use = commands.add_parser("use", help="Make a version the default one.")
+    use.add_argument("name")
+    use.add_argument("version")
+    listing = commands.add_parser("list", help="Show cached versions and their exports.")
+    listing.add_argument("name", nargs="?")
+    args = parser.parse_args()
+
+    manager = ModelManager(args.cache_dir)
+    if args.command == "add":
+        print("/".join(manager.add(args.weights, args.name, args.version)))
+    elif args.command == "fetch":
+        print("/".join(manager.fetch(args.name, args.version)))
+    elif args.command == "export":
+        for engine in args.engine:
+            print(manager.export(args.name, args.version, engine, args.img_size))
+    elif args.command == "use":
+        manager.set_current(args.name, args.version)
+    else:
+        names = [args.name] if args.name else sorted(os.listdir(manager.cache_dir)) if os.path.isdir(manager.cache_dir) else []
+        for name in names:
+            for version in manager.versions(name):
+                marker = "*" if version == manager.current(name) else " "
+                exports = ", ".join(manager.manifest(name, version)["exports"]) or "no exports"
+                print(f"{marker} {name}/{version}  ({exports})")
@@ -0,0 +1,406 @@
+import argparse
+import logging
+import os
+import sys
+import numpy as np
+import pandas as pd
+
+# Add the project root to sys.path so the sibling packages resolve when run as a script
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), "..")))
+
+from my_project.search import FOLD_FROM, FOLD_TO
+
+# Which Basic Multilingual Plane code points are word characters (\w): letters, digits, underscore
+WORD_CHARS = np.array([chr(codepoint).isalnum() for codepoint in range(0x10000)])
+WORD_CHARS[ord("_")] = True
+# The search index's homophone folding as a lookup table over the same code points
+FOLD_CODEPOINTS = np.arange(0x10000, dtype=np.uint32)
+FOLD_CODEPOINTS[[ord(char) for char in FOLD_FROM]] = [ord(char) for char in FOLD_TO]
+
+# Odd multipliers combining consecutive characters into shingles, and band rows into keys
+MIX32 = np.uint32(0x9E3779B1)
+MIX = np.uint64(0x9E3779B97F4A7C15)
+NO_CLUSTER = np.iinfo(np.int64).max
+
+
+def _mix32(values):
+    """Multiply and fold the high half into the low half, so both halves depend on every input bit."""
+    values = values * np.uint32(0x85EBCA6B)
+    return values ^ (values >> np.uint32(16))
+
+
+def _mix64(values):
+    values = values * np.uint64(0xBF58476D1CE4E5B9)
+    return values ^ (values >> np.uint64(32))
+
+
+def _components(n, left, right):
+    """Label each of n nodes with the smallest node connected to it through the (left, right) edges."""
+    labels = np.arange(n)
+    while True:
+        updated = labels.copy()
+        np.minimum.at(updated, left, labels[right])
+        np.minimum.at(updated, right, labels[left])
+        updated = updated[updated]
+        if np.array_equal(updated, labels):
+            return labels
+        labels = updated
+
+
+def _unique_pairs(left, right):
+    """Distinct (left, right) pairs of non-negative integers, as two arrays."""
+    base = int(right.max()) + 1 if len(right) else 1
+    # Sorting beats np.unique's hashing on the millions of pairs a batch of reposts produces
+    pairs = np.sort(left * base + right)
+    pairs = pairs[np.concatenate(([True], pairs[1:] != pairs[:-1]))[:len(pairs)]]
+    return pairs // base, pairs % base
+
+
+def _band_mates(keys, rows):
+    """(later, earlier) pairs of rows holding the same key, every earlier holder of it for each row."""
+    order = np.lexsort((rows, keys))
+    keys, rows = keys[order], rows[order]
+    positions = np.arange(len(keys))
+    group_start = np.maximum.accumulate(np.where(np.concatenate(([True], keys[1:] != keys[:-1])), positions, 0))
+    earlier_holders = positions - group_start
+    offsets = np.arange(earlier_holders.sum()) - np.repeat(np.cumsum(earlier_holders) - earlier_holders, earlier_holders)
+    later = np.repeat(rows, earlier_holders)
+    earlier = rows[np.repeat(group_start, earlier_holders) + offsets]
+    return later[later != earlier], earlier[later != earlier]
+
+
+def _sorted_insert(keys, values, new_keys, new_values):
+    """Insert new_keys (absent from keys) into the sorted keys array, keeping values aligned."""
+    order = np.argsort(new_keys, kind="stable")
+    new_keys, new_values = new_keys[order], new_values[order]
+    positions = np.searchsorted(keys, new_keys)
+    return np.insert(keys, positions, new_keys), np.insert(values, positions, new_values)
+
+
+class NearDuplicateIndex:
+    """
+    MinHash/LSH index grouping reposted messages that differ only by small edits.
+
+    Messages are lowercased, reduced to their words like the search index
+    (Amharic homophone letters folded), rejoined with single spaces and cut
+    into character shingles of `shingle_size`, which keeps a changed price or
+    an added word from moving a message far from its original. Signatures use
+    one-permutation MinHash: each shingle is hashed once and its hash kept in
+    one of `num_perm` bins, with empty bins filled from their right neighbour.
+    The signature is split into `bands` bands. Messages with fewer than
+    `min_tokens` words, such as the "No Message" placeholder, stay in clusters
+    of their own.
+
+    Messages are clustered as if they arrived one at a time in input order:
+    each is compared with the canonical (first) message of every earlier
+    cluster it shares a band with, and joins the oldest one whose signature's
+    low bytes agree with its own on at least `threshold` of the bins, an
+    estimate of their Jaccard similarity; otherwise it starts a cluster and
+    becomes its canonical message. Comparing with canonical messages only
+    keeps clusters from drifting through chains of edits, and clusters are
+    never merged afterwards. The index keeps the band keys of the canonical
+    messages and each message's cluster, so it can be saved and later runs
+    only hash messages it has not seen.
+
+    Clusters are exported by the message_id of their canonical message. The
+    cluster_id column carries the same value as canonical_message_id: it is
+    the grouping key of the warehouse and API schemas, while
+    canonical_message_id names the message to show for the cluster, and the
+    index's internal cluster numbers are not exported because they restart
+    with every new index.
+    """
+
+    def __init__(self, num_perm=128, bands=16, shingle_size=5, min_tokens=3, threshold=0.7, seed=1):
+        if num_perm & (num_perm - 1) or num_perm % bands:
+            raise ValueError("num_perm must be a power of two and a multiple of bands")
+        self.num_perm = num_perm
+        self.bands = bands
+        self.shingle_size = shingle_size
+        self.min_tokens = min_tokens
+        self.threshold = threshold
+        self.seed = seed
+
+        rng = np.random.default_rng(seed)
+        self.hash_seed = rng.integers(0, 2 ** 32, dtype=np.uint32)
+        self.band_salts = rng.integers(0, 2 ** 63, bands, dtype=np.uint64)
+
+        # Sorted band keys and the cluster each one belongs to
+        self.keys = np.empty(0, dtype=np.uint64)
+        self.key_clusters = np.empty(0, dtype=np.int64)
+        # Sorted message_ids already assigned and their clusters
+        self.message_ids = np.empty(0, dtype=np.int64)
+        self.message_clusters = np.empty(0, dtype=np.int64)
+        # Canonical message_id of each cluster and the low byte of its signature, indexed by cluster id
+        self.canonical = np.empty(0, dtype=np.int64)
+        self.sketches = np.empty((0, num_perm), dtype=np.uint8)
+
+    def __len__(self):
+        return len(self.message_ids)
+
+    @property
+    def params(self):
+        return np.array([self.num_perm, self.bands, self.shingle_size, self.min_tokens, self.threshold, self.seed])
+
+    def shingle_hashes(self, messages):
+        """
+        Hash the character shingles of each message.
+
+        Returns (hashes, counts): one flat uint32 array of shingle hashes and
+        the number of shingles per message, 0 for messages that are too short.
+        """
+        # Lowercase the batch as one string ("\x00" separates messages) and work on code points
+        batch = "\x00".join(message.replace("\x00", " ") if isinstance(message, str) else "" for message in messages)
+        codepoints = np.frombuffer(batch.lower().encode("utf-32-le"), dtype=np.uint32)
+        message_of = np.cumsum(codepoints == 0, dtype=np.int32)
+        # U+FFFF is not a word character, so clipping sends every code point above the BMP there
+        is_word = WORD_CHARS[np.minimum(codepoints, 0xFFFF)]
+
+        # Reduce each message to its words separated by single spaces, like the search tokenizer
+        chars = np.flatnonzero(is_word)
+        message_of = message_of[chars]
+        word_start = ~np.concatenate(([False], is_word[:-1]))[chars]
+        first_char = np.concatenate(([True], message_of[1:] != message_of[:-1]))
+        space_before = word_start & ~first_char
+        words = np.bincount(message_of[word_start], minlength=len(messages))
+        lengths = np.bincount(message_of, minlength=len(messages)) + np.bincount(
+            message_of[space_before], minlength=len(messages)
+        )
+        lengths[words < self.min_tokens] = 0
+
+        keep = lengths[message_of] > 0
+        chars, space_before = chars[keep], space_before[keep]
+        text = np.full(lengths.sum(), ord(" "), dtype=np.uint32)
+        text[np.cumsum(1 + space_before) - 1] = FOLD_CODEPOINTS[codepoints[chars]]
+
+        used = lengths[lengths > 0].astype(np.int32)
+        ends = np.cumsum(used, dtype=np.int32)
+        # Characters left in the message from each position on, the current one included
+        remaining = np.repeat(ends, used) - np.arange(len(text), dtype=np.int32)
+        first = np.zeros(len(text), dtype=bool)
+        first[ends - used] = True
+
+        # Fold each character with the next shingle_size - 1 characters of the same message
+        # (characters of the next message only need masking when some message is shorter than a shingle)
+        short = used.min(initial=self.shingle_size) < self.shingle_size
+        hashes = text + self.hash_seed
+        for offset in range(1, self.shingle_size):
+            hashes *= MIX32
+            following = text[offset:]
+            hashes[:-offset] += np.where(remaining[:-offset] > offset, following, np.uint32(0)) if short else following
+
+        # Keep the shingles starting early enough to be complete (one for very short messages)
+        keep = (remaining >= self.shingle_size) | first
+        counts = lengths.copy()
+        counts[lengths > 0] = np.maximum(1, used - self.shingle_size + 1)
+        return _mix32(hashes[keep]), counts
+
+    def signatures(self, hashes, counts):
+        """One-permutation MinHash signatures (uint32, one row per message with shingles)."""
+        rows = len(counts[counts > 0])
+        # The top bits of a shingle hash pick its bin, the rest is its value
+        value_bits = np.uint32(32 - self.num_perm.bit_length() + 1)
+        slots = np.repeat(np.arange(rows, dtype=np.int64) * self.num_perm, counts[counts > 0])
+        slots += hashes >> value_bits
+        empty = np.iinfo(np.uint32).max
+        signatures = np.full(rows * self.num_perm, empty, dtype=np.uint32)
+        np.minimum.at(signatures, slots, hashes & ((np.uint32(1) << value_bits) - np.uint32(1)))
+        signatures = signatures.reshape(rows, self.num_perm)
+
+        # Densify: an empty bin takes the next filled bin to its right (wrapping around),
+        # offset by the distance so different gaps do not produce equal values
+        filled = np.tile(signatures != empty, 2)
+        columns = np.where(filled, np.arange(2 * self.num_perm), 2 * self.num_perm)
+        nearest = np.minimum.accumulate(columns[:, ::-1], axis=1)[:, ::-1][:, :self.num_perm]
+        distance = (nearest - np.arange(self.num_perm)).astype(np.uint32)
+        values = np.take_along_axis(np.tile(signatures, 2), np.minimum(nearest, 2 * self.num_perm - 1), axis=1)
+        return values + distance * np.uint32(0x9E3779B1)
+
+    def band_keys(self, signatures):
+        """One uint64 key per band of each signature, salted by band so bands never collide."""
+        rows = signatures.reshape(len(signatures), self.bands, self.num_perm // self.bands).astype(np.uint64)
+        keys = np.zeros(rows.shape[:2], dtype=np.uint64)
+        for column in range(rows.shape[2]):
+            keys = keys * MIX + rows[:, :, column]
+        return _mix64(keys ^ self.band_salts)
+
+    def _similar(self, sketches, rows, others):
+        """Mask of candidate pairs whose sketches agree on at least `threshold` of the bins."""
+        agree = np.empty(len(rows), dtype=np.float64)
+        for start in range(0, len(rows), 100000):
+            chunk = slice(start, start + 100000)
+            agree[chunk] = (sketches[rows[chunk]] == others[chunk]).mean(axis=1)
+        return agree >= self.threshold
+
+    def _assign_new(self, message_ids, messages):
+        """Cluster messages whose (unique) ids are not in the index yet and add them."""
+        hashes, counts = self.shingle_hashes(messages)
+        eligible = np.flatnonzero(counts > 0)
+        clusters = np.full(len(message_ids), -1, dtype=np.int64)
+
+        # Messages with the same signature as an earlier one in the batch always follow it,
+        # so only the first is clustered (reposted adverts otherwise pair up quadratically)
+        signatures = self.signatures(hashes, counts)
+        _, first_of, same_as = np.unique(signatures, axis=0, return_index=True, return_inverse=True)
+        same_as = same_as.ravel()
+        distinct = np.sort(first_of)
+        rank = np.empty(len(signatures), dtype=np.int64)
+        rank[distinct] = np.arange(len(distinct))
+        signatures = signatures[distinct]
+        sketches = signatures.astype(np.uint8)
+        keys = self.band_keys(signatures)
+        flat = keys.ravel()
+        rows = np.repeat(np.arange(len(keys)), self.bands)
+
+        # Clusters already in the index whose canonical message shares a band key; a message
+        # similar to any of them joins the oldest, as they are all older than the batch
+        starts = np.searchsorted(self.keys, flat, side="left")
+        hits = np.searchsorted(self.keys, flat, side="right") - starts
+        positions = np.repeat(starts - np.cumsum(hits) + hits, hits) + np.arange(hits.sum())
+        candidate_rows, candidate_clusters = _unique_pairs(np.repeat(rows, hits), self.key_clusters[positions])
+        similar = self._similar(sketches, candidate_rows, self.sketches[candidate_clusters])
+        known = np.full(len(keys), NO_CLUSTER, dtype=np.int64)
+        np.minimum.at(known, candidate_rows[similar], candidate_clusters[similar])
+
+        # Similar pairs of a message and an earlier one of the batch sharing a band key, the earlier
+        # one a possible canonical message (not already known to join an existing cluster)
+        later, earlier = _band_mates(flat, rows)
+        keep = known[earlier] == NO_CLUSTER
+        later, earlier = _unique_pairs(later[keep], earlier[keep])
+        similar = self._similar(sketches, later, sketches[earlier])
+        later, earlier = later[similar], earlier[similar]
+
+        # Decide the messages in rounds as if they came one at a time: a message joins its oldest
+        # similar canonical message once no undecided earlier one could turn out older, and is
+        # canonical itself once every similar earlier message joined some cluster. The oldest
+        # undecided message is always decided, so this terminates
+        undecided, canonical, member = 0, 1, 2
+        status = np.where(known == NO_CLUSTER, undecided, member)
+        joins = np.full(len(keys), -1, dtype=np.int64)
+        while True:
+            open_rows = status == undecided
+            if not open_rows.any():
+                break
+            pending = open_rows[later]
+            edges_later, edges_earlier = later[pending], earlier[pending]
+            oldest_canonical = np.full(len(keys), NO_CLUSTER, dtype=np.int64)
+            oldest_undecided = np.full(len(keys), NO_CLUSTER, dtype=np.int64)
+            is_canonical = status[edges_earlier] == canonical
+            np.minimum.at(oldest_canonical, edges_later[is_canonical], edges_earlier[is_canonical])
+            is_undecided = status[edges_earlier] == undecided
+            np.minimum.at(oldest_undecided, edges_later[is_undecided], edges_earlier[is_undecided])
+            joining = open_rows & (oldest_canonical < oldest_undecided)
+            founding = open_rows & (oldest_canonical == NO_CLUSTER) & (oldest_undecided == NO_CLUSTER)
+            joins[joining] = oldest_canonical[joining]
+            status[joining] = member
+            status[founding] = canonical
+
+        # New clusters are numbered in input order, after the ones in the index
+        founders = np.flatnonzero(status == canonical)
+        distinct_clusters = known.copy()
+        distinct_clusters[founders] = len(self.canonical) + np.arange(len(founders))
+        joined = joins >= 0
+        distinct_clusters[joined] = distinct_clusters[joins[joined]]
+        self.canonical = np.concatenate((self.canonical, message_ids[eligible[distinct[founders]]]))
+        self.sketches = np.concatenate((self.sketches, sketches[founders]))
+        clusters[eligible] = distinct_clusters[rank[first_of[same_as]]]
+
+        # Short messages are singletons and are not linked through the LSH bands
+        singles = np.flatnonzero(counts == 0)
+        clusters[singles] = len(self.canonical) + np.arange(len(singles))
+        self.canonical = np.concatenate((self.canonical, message_ids[singles]))
+        self.sketches = np.concatenate((self.sketches, np.zeros((len(singles), self.num_perm), dtype=np.uint8)))
+
+        # Only canonical messages are looked up by later messages, so only their band keys are kept
+        self.keys, self.key_clusters = _sorted_insert(
+            self.keys, self.key_clusters, keys[founders].ravel(), np.repeat(distinct_clusters[founders], self.bands)
+        )
+        self.message_ids, self.message_clusters = _sorted_insert(
+            self.message_ids, self.message_clusters, message_ids, clusters
+        )
+        return clusters
+
+    def assign(self, message_ids, messages, batch_size=100000):
+        """
+        Return (cluster_ids, canonical_message_ids) for each row as nullable Int64 Series.
+
+        Both are the canonical message_id of the row's cluster (see the class
+        docstring). Messages already in the index keep their stored cluster
+        without being hashed again; rows without a numeric message_id are left
+        untagged. New messages are processed batch_size at a time, which only
+        bounds memory: the clusters do not depend on it.
+        """
+        ids = pd.to_numeric(pd.Series(message_ids), errors="coerce")
+        messages = pd.Series(messages).reset_index(drop=True)
+        present = ids.notna().to_numpy()
+        values = ids[present].astype(np.int64).to_numpy()
+
+        unique_ids, first, inverse = np.unique(values, return_index=True, return_inverse=True)
+        positions = np.minimum(np.searchsorted(self.message_ids, unique_ids), max(len(self.message_ids) - 1, 0))
+        known = self.message_ids[positions] == unique_ids if len(self.message_ids) else np.zeros(len(unique_ids), bool)
+
+        # Hash new messages in input order so the first message of a cluster becomes canonical
+        new = np.flatnonzero(~known)
+        new = new[np.argsort(first[new], kind="stable")]
+        texts = messages[present].to_numpy()
+        for start in range(0, len(new), batch_size):
+            batch = new[start:start + batch_size]
+            self._assign_new(unique_ids[batch], texts[first[batch]])
+
+        positions = np.searchsorted(self.message_ids, unique_ids)
+        clusters = self.message_clusters[positions][inverse]
+        cluster_ids = pd.Series(pd.NA, index=range(len(ids)), dtype="Int64")
+        canonical_ids = pd.Series(pd.NA, index=range(len(ids)), dtype="Int64")
+        canonical_ids[present] = self.canonical[clusters]
+        cluster_ids[present] = canonical_ids[present]
+        return cluster_ids, canonical_ids
+
+    def tag(self, df, id_column="message_id", text_column="message"):
+        """Return df with cluster_id and canonical_message_id columns added."""
+        cluster_ids, canonical_ids = self.assign(df[id_column], df[text_column])
+        df = df.copy()
+        df["cluster_id"] = cluster_ids.array
+        df["canonical_message_id"] = canonical_ids.array
+        return df
+
+    def save(self, path):
+        """ Persist the index atomically as an .npz file. """
+        tmp_path = f"{path}.tmp"
+        with open(tmp_path, "wb") as f:
+            np.savez(
+                f, params=self.params, keys=self.keys, key_clusters=self.key_clusters,
+                message_ids=self.message_ids, message_clusters=self.message_clusters,
+                canonical=self.canonical, sketches=self.sketches,
+            )
+        os.replace(tmp_path, path)
+
+    @classmethod
+    def load(cls, path):
+        """ Load an index saved with save(). """
+        with np.load(path) as data:
+            num_perm, bands, shingle_size, min_tokens, threshold, seed = data["params"].tolist()
+            index = cls(int(num_perm), int(bands), int(shingle_size), int(min_tokens), threshold, int(seed))
+            index.keys = data["keys"]
+            index.key_clusters = data["key_clusters"]
+            index.message_ids = data["message_ids"]
+            index.message_clusters = data["message_clusters"]
+            index.canonical = data["canonical"]
+            index.sketches = data["sketches"]
+        return index
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Tag near-duplicate messages in a cleaned CSV.")
+    parser.add_argument("--input", default="data/preprocessed/cleaned_data.csv")
+    parser.add_argument("--output", default=None, help="Defaults to overwriting the input.")
+    parser.add_argument("--index", default="data/preprocessed/near_duplicates.npz",
+                        help="Index file; reused when it exists so only new messages are hashed.")
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.INFO, format="%(asctime)s - %(levelname)s - %(message)s")
+    index = NearDuplicateIndex.load(args.index) if os.path.exists(args.index) else NearDuplicateIndex()
+    df = index.tag(pd.read_csv(args.input))
+    df.to_csv(args.output or args.input, index=False)
+    index.save(args.index)
+
+    clusters = df["cluster_id"].nunique()
+    logging.info(f"✅ Tagged {len(df)} messages: {clusters} clusters, {len(df) - clusters} near-duplicates.")
@@ -1,11 +1,21 @@
 import os
+import sys
+import time
+import numpy as np
 import pandas as pd
-import torch
+from concurrent.futures import ThreadPoolExecutor
 from pathlib import Path
-from yolov5 import detect
-from PIL import Image
+from PIL import Image, ImageOps
 import logging
 
+# Allow running as `python scripts/object_detection.py` as well as importing from the project root
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), "..")))
+
+from scripts.detection_cache import DetectionCache
+from scripts.media_store import EXIF_ORIENTATION
+from scripts.model_manager import ENGINES, ModelManager
+from scripts.metrics import REGISTRY, row_log, stage_timer
+
 # Set up logging
 os.makedirs("logs", exist_ok=True)
 logging.basicConfig(
@@ -14,20 +24,52 @@ logging.basicConfig(
     format="%(asctime)s - %(levelname)s - %(message)s"
 )
 
+INFERENCE_SECONDS = REGISTRY.histogram(
+    "detection_inference_seconds_per_image", "Model time per image (a batch's time split over its images).", ["mode"]
+)
+IMAGES_DETECTED = REGISTRY.counter("detection_images_total", "Images detected, by where the result came from.", ["source"])
+
 class YOLOObjectDetection:
-    def __init__(self, image_dir="data/raw/photos", output_dir="data/preprocessed/detections", model_name="yolov5s"):
+    def __init__(self, image_dir="data/raw/photos", output_dir="data/preprocessed/detections", model_name="yolov5s",
+                 batch_size=16, img_size=640, decode_workers=4,
+                 cache_path="data/preprocessed/detection_cache.sqlite", media_store=None, engine="eager",
+                 model_version=None, model_cache=None, threads=None, inter_op_threads=None):
         self.image_dir = Path(image_dir)
         self.output_dir = Path(output_dir)
-        self.model = torch.hub.load("ultralytics/yolov5", "custom", path=model_name, force_reload=True)
+        # model_name is a cached model name or a weights file; loading never goes to the network
+        self.models = ModelManager(model_cache)
+        name, version = self.models.resolve(model_name, model_version)
+        self.engine = engine
+        self.model = self.models.load(name, version, engine, threads, inter_op_threads)
+        self.batch_size = batch_size
+        self.img_size = img_size
+        self.decode_workers = decode_workers
+        self.last_run_stats = {}
+        # Content hashes and pre-resized thumbnails of ingested media come from the store
+        self.media_store = media_store
         os.makedirs(self.output_dir, exist_ok=True)
 
-    def run_detection(self):
+        # Results are cached by image content hash + model identity; None disables the cache
+        self.cache = DetectionCache(cache_path) if cache_path else None
+        identity = (name, getattr(self.model, "conf", None), getattr(self.model, "iou", None), img_size)
+        weights_path = self.models.weights_path(name, version)
+        self.model_key = DetectionCache.model_key(*identity, weights_path=weights_path, engine=engine)
+        # Detections on the store's (recompressed) thumbnails are cached apart from those on originals
+        self.thumb_model_key = DetectionCache.model_key(
+            *identity, weights_path=weights_path, engine=engine, source=media_store.thumb_key
+        ) if media_store else None
+
+    def run_detection(self, save_annotated=True):
         results = []
         for image_path in self.image_dir.glob("*.jpg"):
             try:
-                logging.info(f"Processing {image_path}")
+                row_log("detect", "Processing %s", image_path)
+                start = time.perf_counter()
                 detections = self.model(str(image_path))
-                detections.save(save_dir=self.output_dir)
+                INFERENCE_SECONDS.observe(time.perf_counter() - start, mode="single")
+                IMAGES_DETECTED.inc(source="inferred")
+                if save_annotated:
+                    detections.save(save_dir=self.output_dir)
 
                 for *box, conf, cls in detections.xyxy[0].tolist():
                     results.append({
@@ -44,6 +86,191 @@ class YOLOObjectDetection:
                 logging.error(f"Error processing {image_path}: {e}")
         return results
 
+    @staticmethod
+    def load_image(image_path, img_size, original_width=None):
+        """
+        Decode an image to RGB and downscale it so its longest side is at most img_size.
+
+        Returns the array and its scale relative to the original image, whose
+        width is given when image_path is a thumbnail of it.
+        """
+        with Image.open(image_path) as image:
+            width, height = image.size
+            scale = min(1.0, img_size / max(width, height))
+            size = (round(width * scale), round(height * scale))
+            # JPEGs are decoded at a reduced DCT scale instead of full size when much larger
+            image.draft("RGB", size)
+            # Photos stored sideways with an EXIF orientation are turned upright (5-8 swap the sides)
+            if image.getexif().get(EXIF_ORIENTATION) in (5, 6, 7, 8):
+                size = size[::-1]
+            image = ImageOps.exif_transpose(image).convert("RGB")
+            if scale < 1.0:
+                image = image.resize(size, Image.BILINEAR)
+            if original_width:
+                scale = image.width / original_width
+            return np.asarray(image), scale
+
+    def _decode(self, image_path, thumbnails=None):
+        try:
+            thumb, original_width = (thumbnails or {}).get(image_path, (None, None))
+            if thumb:
+                return image_path, *self.load_image(thumb, self.img_size, original_width)
+            return image_path, *self.load_image(image_path, self.img_size)
+        except Exception as e:
+            logging.error(f"Error decoding {image_path}: {e}")
+            return image_path, None, None
+
+    def _infer_batches(self, image_paths, batch_size, save_annotated, thumbnails=None):
+        """
+        Run the model over image paths in batches while the thread pool decodes the next batch.
+
+        Returns {path: (n, 6) array of xmin, ymin, xmax, ymax, confidence, class id}
+        in original image coordinates. Images that fail to decode are left out.
+        thumbnails maps paths to (thumbnail path, original width) to decode instead.
+        """
+        batches = [image_paths[i:i + batch_size] for i in range(0, len(image_paths), batch_size)]
+        inferred = {}
+
+        with ThreadPoolExecutor(max_workers=self.decode_workers) as pool:
+            pending = [pool.submit(self._decode, path, thumbnails) for path in batches[0]] if batches else []
+            for index in range(len(batches)):
+                decoded = [future.result() for future in pending]
+                # Prefetch: decode the next batch while the model runs on this one
+                if index + 1 < len(batches):
+                    pending = [pool.submit(self._decode, path, thumbnails) for path in batches[index + 1]]
+
+                decoded = [item for item in decoded if item[1] is not None]
+                if not decoded:
+                    continue
+                try:
+                    start = time.perf_counter()
+                    detections = self.model([array for _, array, _ in decoded], size=self.img_size)
+                    per_image = (time.perf_counter() - start) / len(decoded)
+                except Exception as e:
+                    logging.error(f"Error processing batch {index}: {e}")
+                    continue
+                for _ in decoded:
+                    INFERENCE_SECONDS.observe(per_image, mode="batched")
+                IMAGES_DETECTED.inc(len(decoded), source="inferred")
+
+                if save_annotated:
+                    detections.files = [path.name for path, _, _ in decoded]
+                    detections.save(save_dir=self.output_dir, exist_ok=True)
+
+                for (path, _, scale), found in zip(decoded, detections.xyxy):
+                    found = found.cpu().numpy().astype(np.float64)
+                    found[:, :4] /= scale
+                    inferred[path] = found
+        return inferred
+
+    def run_batched_detection(self, batch_size=None, save_annotated=False):
+        """
+        Run batched detection over every .jpg in image_dir, reusing cached results
+        for images seen before.
+
+        Returns columnar results: a dict of equal-length numpy arrays with the
+        same keys as run_detection (pd.DataFrame accepts it directly).
+        """
+        return self.detect_images(sorted(self.image_dir.glob("*.jpg")), batch_size, save_annotated)
+
+    def detect_images(self, image_paths, batch_size=None, save_annotated=False):
+        """
+        Run batched detection over the given image paths, reusing cached results.
+
+        Images are hashed first; only content missing from the cache for this
+        model is inferred, and byte-identical images are inferred once. Images
+        in the media store reuse its hashes and decode its thumbnails.
+        Throughput is logged and stored in last_run_stats.
+        """
+        batch_size = batch_size or self.batch_size
+        image_paths = [Path(path) for path in image_paths]
+        names = self.model.names
+        class_names = np.array([names[i] for i in range(len(names))], dtype=object)
+        start = time.perf_counter()
+
+        hashes, cached, thumbnails = {}, {}, {}
+        if self.media_store:
+            for path, (image_hash, thumb, width) in self.media_store.lookup(image_paths).items():
+                hashes[path] = image_hash
+                if thumb:
+                    thumbnails[path] = (thumb, width)
+        to_infer = image_paths
+        if self.cache:
+            unhashed = [path for path in image_paths if path not in hashes]
+            with ThreadPoolExecutor(max_workers=self.decode_workers) as pool:
+                hashes.update(zip(unhashed, pool.map(DetectionCache.hash_file, unhashed)))
+            # Results are keyed by (model key, content hash); the key depends on the decoded input
+            keys = {
+                path: (self.thumb_model_key if path in thumbnails else self.model_key, image_hash)
+                for path, image_hash in hashes.items()
+            }
+            for model_key in {model_key for model_key, _ in keys.values()}:
+                found = self.cache.get_many({h for k, h in keys.values() if k == model_key}, model_key)
+                cached.update(((model_key, image_hash), boxes) for image_hash, boxes in found.items())
+            # One representative path per uncached key
+            representatives = {}
+            for path, key in keys.items():
+                if key not in cached:
+                    representatives.setdefault(key, path)
+            to_infer = list(representatives.values())
+
+        inferred = self._infer_batches(to_infer, batch_size, save_annotated, thumbnails)
+        if self.cache:
+            fresh = {keys[path]: found for path, found in inferred.items()}
+            for model_key in {model_key for model_key, _ in fresh}:
+                self.cache.put_many([(h, found) for (k, h), found in fresh.items() if k == model_key], model_key)
+            cached.update(fresh)
+
+        images, boxes = [], []
+        for path in image_paths:
+            found = cached.get(keys[path]) if self.cache else inferred.get(path)
+            if found is None:
+                continue
+            images.append(np.full(len(found), path.name, dtype=object))
+            boxes.append(found)
+
+        boxes = np.concatenate(boxes) if boxes else np.empty((0, 6))
+        results = {
+            "image": np.concatenate(images) if images else np.empty(0, dtype=object),
+            "xmin": boxes[:, 0],
+            "ymin": boxes[:, 1],
+            "xmax": boxes[:, 2],
+            "ymax": boxes[:, 3],
+            "confidence": boxes[:, 4],
+            "class": class_names[boxes[:, 5].astype(np.int64)],
+        }
+
+        elapsed = time.perf_counter() - start
+        IMAGES_DETECTED.inc(len(image_paths) - len(to_infer), source="cache")
+        self.last_run_stats = {
+            "images": len(image_paths),
+            "inferred": len(inferred),
+            "cache_hits": len(image_paths) - len(to_infer),
+            "seconds": elapsed,
+            "images_per_second": len(image_paths) / elapsed if elapsed else 0.0,
+        }
+        logging.info(
+            f"Batched detection processed {len(image_paths)} images ({len(inferred)} inferred, "
+            f"{self.last_run_stats['cache_hits']} from cache) in {elapsed:.1f}s "
+            f"({self.last_run_stats['images_per_second']:.1f} images/s)."
+        )
+        return results
+
+    def to_detected_objects(self, results):
+        """ Convert columnar results to detected_objects rows: class ID, box centre and size. """
+        names = self.model.names
+        class_ids = {names[i]: i for i in range(len(names))}
+        xmin, ymin, xmax, ymax = (np.asarray(results[key], dtype=np.float64) for key in ("xmin", "ymin", "xmax", "ymax"))
+        return pd.DataFrame({
+            "image_name": results["image"],
+            "class_id": np.array([class_ids[name] for name in results["class"]], dtype=np.int64),
+            "x_center": (xmin + xmax) / 2,
+            "y_center": (ymin + ymax) / 2,
+            "width": xmax - xmin,
+            "height": ymax - ymin,
+            "confidence": results["confidence"],
+        })
+
     def save_results(self, results, output_csv="data/preprocessed/detection_results.csv"):
         df = pd.DataFrame(results)
         df.to_csv(output_csv, index=False)
@@ -51,6 +278,22 @@ class YOLOObjectDetection:
 
 
 if __name__ == "__main__":
-    detector = YOLOObjectDetection()
-    results = detector.run_detection()
+    import argparse
+
+    parser = argparse.ArgumentParser(description="Run batched object detection over the scraped images.")
+    parser.add_argument("--model", default="yolov5s", help="Cached model name or a weights file.")
+    parser.add_argument("--model-version", default=None, help="Cached version (default: the current one).")
+    parser.add_argument("--engine", choices=ENGINES, default="eager")
+    parser.add_argument("--threads", type=int, default=None, help="Intra-op threads (default: one per core).")
+    parser.add_argument("--inter-op-threads", type=int, default=None)
+    args = parser.parse_args()
+
+    detector = YOLOObjectDetection(
+        model_name=args.model, model_version=args.model_version, engine=args.engine,
+        threads=args.threads, inter_op_threads=args.inter_op_threads
+    )
+    with stage_timer("detect") as timer:
+        results = detector.run_batched_detection()
+        timer.add(detector.last_run_stats["images"])
     detector.save_results(results)
+    REGISTRY.dump_summary()
@@ -0,0 +1,476 @@
+import argparse
+import asyncio
+import csv
+import hashlib
+import json
+import logging
+import os
+import sys
+import time
+from collections import deque
+
+import pandas as pd
+
+# Allow running as `python scripts/pipeline.py` as well as importing from the project root
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), "..")))
+
+from scripts.data_cleaning import ROWS_CLEANED, WATERMARK_WINDOW, DataCleaner
+from scripts.metrics import REGISTRY, stage_timer
+from scripts.telegram_scraper import Checkpoint
+
+# Set up logging
+os.makedirs("logs", exist_ok=True)
+logging.basicConfig(
+    filename="logs/pipeline.log",
+    level=logging.INFO,
+    format="%(asctime)s - %(levelname)s - %(message)s"
+)
+
+STAGES = ("clean", "load", "detect")
+
+# Text columns of the cleaned CSV are read as strings, like the raw ones
+CLEANED_TEXT_COLUMNS = {
+    "channel_title": str, "channel_username": str, "message": str, "media_path": str, "emoji_used": str,
+}
+
+# Media files the detector runs on
+IMAGE_SUFFIXES = (".jpg", ".jpeg", ".png")
+
+# Queued by the raw writer when a micro-batch times out without a new row
+FLUSH = object()
+
+INGEST_LAG_SECONDS = REGISTRY.gauge(
+    "pipeline_ingest_lag_seconds", "Seconds between the newest loaded message being posted and being loaded."
+)
+QUEUE_DEPTH = REGISTRY.gauge("pipeline_queue_batches", "Micro-batches waiting between two stages.", ["queue"])
+
+
+class StageCheckpoint:
+    """
+    Byte offset up to which a stage has consumed its input file.
+
+    Saved with a hash of the bytes just before the offset, so a stage whose
+    input was rewritten (e.g. by a full cleaning rebuild) starts over instead
+    of resuming mid-row.
+    """
+
+    def __init__(self, path, input_path):
+        self.path = path
+        self.input_path = input_path
+
+    def _tail_sha256(self, offset):
+        start = max(0, offset - WATERMARK_WINDOW)
+        with open(self.input_path, "rb") as f:
+            f.seek(start)
+            return hashlib.sha256(f.read(offset - start)).hexdigest()
+
+    def load(self):
+        """Return the saved offset, or 0 when there is none or the input no longer matches it."""
+        try:
+            with open(self.path, "r") as f:
+                state = json.load(f)
+        except FileNotFoundError:
+            return 0
+        offset = state["offset"]
+        if (
+            not os.path.exists(self.input_path)
+            or os.path.getsize(self.input_path) < offset
+            or self._tail_sha256(offset) != state["tail_sha256"]
+        ):
+            logging.warning(f"⚠️ '{self.input_path}' no longer matches '{self.path}'; starting the stage over.")
+            return 0
+        return offset
+
+    def save(self, offset):
+        """Atomically record that the input has been consumed up to offset."""
+        os.makedirs(os.path.dirname(self.path) or ".", exist_ok=True)
+        tmp_path = f"{self.path}.tmp"
+        with open(tmp_path, "w") as f:
+            json.dump({"offset": offset, "tail_sha256": self._tail_sha256(offset)}, f)
+        os.replace(tmp_path, self.path)
+
+
+def read_cleaned(path, start, chunksize):
+    """ Yield DataFrame chunks of the cleaned CSV rows from byte offset start to the end of the file. """
+    with open(path, "rb") as f:
+        header = f.readline()
+        if not header:
+            return
+        names = next(csv.reader([header.decode("utf-8").rstrip("\r\n")]))
+        f.seek(max(start, len(header)))
+        if not f.peek(1):
+            return
+        yield from pd.read_csv(f, header=None, names=names, dtype=CLEANED_TEXT_COLUMNS, chunksize=chunksize)
+
+
+class PipelineRunner:
+    """
+    Runs scrape -> clean -> load -> detect as one streaming pipeline.
+
+    The stages reuse TelegramScraper, DataCleaner, DatabaseManager and
+    YOLOObjectDetection and are connected by bounded asyncio queues, so a slow
+    stage holds back the ones before it down to the channel scrapers. Rows
+    travel in micro-batches of up to batch_size rows or batch_timeout seconds.
+
+    Each stage keeps writing what it wrote as a separate script and
+    checkpoints how far it got:
+      - scrape: the per-channel checkpoints, saved once rows are in the raw CSV,
+      - clean: the DataCleaner watermark over the raw CSV,
+      - load and detect: byte offsets into the cleaned CSV (StageCheckpoint).
+    On start every stage catches up from its checkpoint. Replaying rows is
+    harmless: stored message IDs are skipped by the loader and images that
+    already have detections are not detected again.
+    """
+
+    def __init__(self, cleaner, db_manager=None, detector=None, scraper=None, state_dir="data/pipeline",
+                 batch_size=500, batch_timeout=2.0, queue_batches=4, watermark_interval=30.0, chunksize=100000):
+        self.cleaner = cleaner
+        self.db_manager = db_manager
+        self.detector = detector
+        self.scraper = scraper
+        self.batch_size = batch_size
+        self.batch_timeout = batch_timeout
+        self.queue_batches = queue_batches
+        # Saving the cleaning watermark rewrites the seen-ID and near-duplicate state, so it is throttled
+        self.watermark_interval = watermark_interval
+        self.chunksize = chunksize
+        self.load_checkpoint = StageCheckpoint(os.path.join(state_dir, "load.json"), cleaner.output_path)
+        self.detect_checkpoint = StageCheckpoint(os.path.join(state_dir, "detect.json"), cleaner.output_path)
+        self.media_done = None
+        self.stats = {"raw_rows": 0, "cleaned_rows": 0, "loaded_rows": 0, "detected_images": 0}
+
+    @staticmethod
+    def media_paths(df):
+        """Distinct image paths referenced by cleaned rows."""
+        if df is None or df.empty:
+            return []
+        paths = df["media_path"].dropna().unique()
+        return [path for path in paths if path.lower().endswith(IMAGE_SUFFIXES)]
+
+    def _load(self, df):
+        """Load cleaned rows into telegram_messages."""
+        if df is None or df.empty:
+            return
+        with stage_timer("load") as timer:
+            counts = self.db_manager.bulk_insert_data(df)
+            timer.add(len(df))
+        self.stats["loaded_rows"] += counts["inserted"]
+
+        posted = pd.to_datetime(df["message_date"], errors="coerce", utc=True).max()
+        if pd.notna(posted):
+            lag = (pd.Timestamp.now(tz="UTC") - posted).total_seconds()
+            INGEST_LAG_SECONDS.set(round(lag, 3))
+            logging.info(f"Loaded {counts['inserted']} rows; newest message was posted {lag:.1f}s ago.")
+
+    def _detect(self, image_paths):
+        """Detect objects in images on disk that have no detections yet and load the boxes."""
+        image_paths = [path for path in image_paths if os.path.exists(path)]
+        if not image_paths:
+            return
+        done = self.db_manager.detected_image_names([os.path.basename(path) for path in image_paths])
+        image_paths = [path for path in image_paths if os.path.basename(path) not in done]
+        if not image_paths:
+            return
+        with stage_timer("detect") as timer:
+            results = self.detector.detect_images(image_paths)
+            rows = self.detector.to_detected_objects(results)
+            if not rows.empty:
+                self.db_manager.bulk_insert_detection_results(rows)
+            timer.add(len(image_paths))
+        self.stats["detected_images"] += len(image_paths)
+
+    def _catch_up(self, name, checkpoint, process):
+        """ Feed the cleaned CSV from a stage's checkpoint to the end through process, then checkpoint. """
+        path = self.cleaner.output_path
+        if not os.path.exists(path):
+            return
+        start, end = checkpoint.load(), os.path.getsize(path)
+        if end <= start:
+            return
+        try:
+            rows = 0
+            for chunk in read_cleaned(path, start, self.chunksize):
+                process(chunk)
+                rows += len(chunk)
+            checkpoint.save(end)
+            logging.info(f"✅ {name} stage caught up with {rows} cleaned rows.")
+        except Exception as e:
+            logging.error(f"❌ Error catching up the {name} stage: {e}")
+            raise
+
+    def catch_up_load(self):
+        self._catch_up("load", self.load_checkpoint, self._load)
+
+    def catch_up_detect(self):
+        self._catch_up("detect", self.detect_checkpoint, lambda chunk: self._detect(self.media_paths(chunk)))
+
+    def run_batch(self, stages=STAGES):
+        """
+        Batch mode: run the chosen stages one after another over the files on disk.
+
+        Nothing is scraped, so a rerun over the same raw CSV gives the same
+        cleaned CSV and database rows. Used by the DVC stages.
+        """
+        if "clean" in stages:
+            with stage_timer("clean") as timer:
+                read = ROWS_CLEANED.value(outcome="read")
+                self.cleaner.run(chunksize=self.chunksize, incremental=True)
+                timer.add(ROWS_CLEANED.value(outcome="read") - read)
+        if "load" in stages:
+            self.catch_up_load()
+        if "detect" in stages:
+            self.catch_up_detect()
+        logging.info(f"✅ Batch run of {', '.join(stages)} finished.")
+
+    async def _scrape(self, rows, rounds, interval):
+        """Scrape every channel `rounds` times (0 for ever), `interval` seconds apart."""
+        downloader = self.scraper.media_downloader
+        try:
+            await self.scraper.client.start(self.scraper.phone)
+            logging.info("Telegram client started successfully.")
+            await downloader.start()
+            try:
+                completed = 0
+                while True:
+                    await self.scraper.scrape_all(rows)
+                    completed += 1
+                    if rounds and completed >= rounds:
+                        break
+                    await asyncio.sleep(interval)
+            finally:
+                await rows.put(None)
+                await downloader.close()
+        finally:
+            self.media_done.set()
+
+    async def _write_raw(self, rows, file, writer, raw_batches):
+        """
+        Single writer of the raw CSV (see TelegramScraper._write_rows) that cuts
+        rows into micro-batches.
+
+        Checkpoints are saved once the rows queued before them are flushed. A
+        batch ends after batch_size rows or batch_timeout seconds; the file is
+        then flushed and its size queued for the clean stage.
+        """
+        pending, deadline = 0, None
+        while True:
+            timeout = None if deadline is None else max(0.0, deadline - time.monotonic())
+            try:
+                item = await asyncio.wait_for(rows.get(), timeout)
+            except asyncio.TimeoutError:
+                item = FLUSH
+
+            if isinstance(item, Checkpoint):
+                file.flush()
+                self.scraper.save_checkpoint(item.channel_username, item.state)
+                continue
+            if isinstance(item, list):
+                writer.writerow(item)
+                pending += 1
+                deadline = deadline or time.monotonic() + self.batch_timeout
+
+            if pending and (not isinstance(item, list) or pending >= self.batch_size):
+                file.flush()
+                await raw_batches.put(os.fstat(file.fileno()).st_size)
+                QUEUE_DEPTH.set(raw_batches.qsize(), queue="raw")
+                self.stats["raw_rows"] += pending
+                pending, deadline = 0, None
+            if item is None:
+                await raw_batches.put(None)
+                return
+
+    async def _clean(self, raw_batches, cleaned):
+        """Clean raw batches and queue (rows, cleaned CSV size) for the load stage."""
+        saved_at = time.monotonic()
+        finished = False
+        while not finished:
+            # When cleaning falls behind, the batches already waiting are cleaned together
+            offsets = [await raw_batches.get()]
+            while offsets[-1] is not None and not raw_batches.empty():
+                offsets.append(raw_batches.get_nowait())
+            finished = offsets[-1] is None
+            offsets = [offset for offset in offsets if offset is not None]
+            if not offsets:
+                continue
+
+            with stage_timer("clean") as timer:
+                read = ROWS_CLEANED.value(outcome="read")
+                df = await asyncio.to_thread(self.cleaner.clean_until, offsets[-1], self.chunksize)
+                timer.add(ROWS_CLEANED.value(outcome="read") - read)
+            self.stats["cleaned_rows"] += 0 if df is None else len(df)
+            if time.monotonic() - saved_at >= self.watermark_interval:
+                await asyncio.to_thread(self.cleaner.save_watermark)
+                saved_at = time.monotonic()
+            await cleaned.put((df, os.path.getsize(self.cleaner.output_path)))
+            QUEUE_DEPTH.set(cleaned.qsize(), queue="cleaned")
+
+        await asyncio.to_thread(self.cleaner.save_watermark)
+        await cleaned.put(None)
+
+    async def _load_stage(self, cleaned, loaded):
+        """Load cleaned batches, checkpoint them and pass them on to the detect stage."""
+        while True:
+            item = await cleaned.get()
+            if item is None:
+                break
+            df, end = item
+            await asyncio.to_thread(self._load, df)
+            await asyncio.to_thread(self.load_checkpoint.save, end)
+            if self.detector:
+                await loaded.put(item)
+        if self.detector:
+            await loaded.put(None)
+
+    async def _detect_stage(self, loaded):
+        """
+        Detect objects in the images of loaded batches.
+
+        Media is downloaded in the background, so an image is detected once it
+        is on disk and dropped when its download failed or the scrape finished
+        without it. The checkpoint only moves past batches whose images are all
+        settled.
+        """
+        downloader = self.scraper.media_downloader
+        pending = deque()  # (cleaned CSV size, image paths not settled yet)
+        closed = False
+        while True:
+            ready = set()
+            for _, image_paths in pending:
+                for path in list(image_paths):
+                    if os.path.exists(path):
+                        ready.add(path)
+                    elif path not in downloader.failed and not self.media_done.is_set():
+                        continue
+                    image_paths.discard(path)
+            if ready:
+                await asyncio.to_thread(self._detect, sorted(ready))
+
+            end = None
+            while pending and not pending[0][1]:
+                end = pending.popleft()[0]
+            if end is not None:
+                await asyncio.to_thread(self.detect_checkpoint.save, end)
+
+            if closed:
+                if not pending:
+                    return
+                await asyncio.sleep(self.batch_timeout)
+                continue
+            try:
+                item = await asyncio.wait_for(loaded.get(), self.batch_timeout if pending else None)
+            except asyncio.TimeoutError:
+                continue
+            if item is None:
+                closed = True
+            else:
+                df, end = item
+                pending.append((end, set(self.media_paths(df))))
+
+    async def run(self, rounds=1, interval=60.0):
+        """
+        Streaming mode: scrape, clean, load and detect concurrently.
+
+        Every stage first catches up from its checkpoint, then rows flow through
+        the queues until the last scrape round is fully processed.
+        """
+        start = time.perf_counter()
+        file, writer = self.scraper.open_csv()
+        with file:
+            await asyncio.to_thread(self.cleaner.resume, self.chunksize)
+            await asyncio.to_thread(self.catch_up_load)
+            if self.detector:
+                await asyncio.to_thread(self.catch_up_detect)
+
+            rows = asyncio.Queue(maxsize=self.scraper.queue_size)
+            raw_batches = asyncio.Queue(maxsize=self.queue_batches)
+            cleaned = asyncio.Queue(maxsize=self.queue_batches)
+            loaded = asyncio.Queue(maxsize=self.queue_batches)
+            self.media_done = asyncio.Event()
+            tasks = [
+                asyncio.create_task(self._scrape(rows, rounds, interval)),
+                asyncio.create_task(self._write_raw(rows, file, writer, raw_batches)),
+                asyncio.create_task(self._clean(raw_batches, cleaned)),
+                asyncio.create_task(self._load_stage(cleaned, loaded)),
+            ]
+            if self.detector:
+                tasks.append(asyncio.create_task(self._detect_stage(loaded)))
+            try:
+                await asyncio.gather(*tasks)
+            except BaseException as e:
+                # One failed stage would leave the others blocked on their queues
+                for task in tasks:
+                    task.cancel()
+                await asyncio.gather(*tasks, return_exceptions=True)
+                logging.error(f"❌ Pipeline stopped: {e!r}")
+                raise
+
+        elapsed = time.perf_counter() - start
+        logging.info(
+            f"✅ Pipeline finished in {elapsed:.1f}s: {self.stats['raw_rows']} scraped, "
+            f"{self.stats['cleaned_rows']} cleaned, {self.stats['loaded_rows']} loaded, "
+            f"{self.stats['detected_images']} images detected."
+        )
+        return self.stats
+
+
+if __name__ == "__main__":
+    from scripts.database_setup import DatabaseManager
+
+    parser = argparse.ArgumentParser(description="Run scrape -> clean -> load -> detect as one pipeline.")
+    parser.add_argument("--batch", action="store_true",
+                        help="Replay the files on disk from each stage's checkpoint without scraping (DVC).")
+    parser.add_argument("--stages", nargs="+", choices=STAGES, default=list(STAGES),
+                        help="Stages run in batch mode.")
+    parser.add_argument("--no-detect", action="store_true", help="Skip object detection.")
+    parser.add_argument("--engine", choices=["eager", "torchscript", "onnx", "onnx-int8"], default="eager",
+                        help="Detection engine (see scripts/model_manager.py).")
+    parser.add_argument("--threads", type=int, default=None, help="Detection intra-op threads.")
+    parser.add_argument("--inter-op-threads", type=int, default=None, help="Detection inter-op threads.")
+    parser.add_argument("--rounds", type=int, default=1, help="Scrape rounds; 0 keeps scraping.")
+    parser.add_argument("--interval", type=float, default=60.0, help="Seconds between scrape rounds.")
+    parser.add_argument("--batch-size", type=int, default=500, help="Maximum rows per micro-batch.")
+    parser.add_argument("--batch-timeout", type=float, default=2.0,
+                        help="Seconds a partial micro-batch waits for more rows.")
+    parser.add_argument("--queue-batches", type=int, default=4, help="Micro-batches queued between stages.")
+    parser.add_argument("--concurrency", type=int, default=3, help="Maximum channels scraped at once.")
+    parser.add_argument("--mode", choices=["forward", "backfill"], default="forward",
+                        help="Fetch new messages (forward) or older history (backfill).")
+    parser.add_argument("--limit", type=int, default=100, help="Maximum messages per channel per round.")
+    parser.add_argument("--media-workers", type=int, default=4, help="Concurrent media downloads.")
+    parser.add_argument("--media-store", default=None,
+                        help="Deduplicate media into this content-addressed store and detect on its thumbnails.")
+    args = parser.parse_args()
+
+    stages = [stage for stage in (args.stages if args.batch else STAGES) if stage != "detect" or not args.no_detect]
+    db_manager = None
+    if "load" in stages or "detect" in stages:
+        db_manager = DatabaseManager()
+        db_manager.connect_to_database()
+        db_manager.migrate()
+    media_store = None
+    if args.media_store:
+        from scripts.media_store import MediaStore
+
+        media_store = MediaStore(args.media_store)
+    detector = None
+    if "detect" in stages:
+        from scripts.object_detection import YOLOObjectDetection
+
+        detector = YOLOObjectDetection(
+            media_store=media_store, engine=args.engine, threads=args.threads, inter_op_threads=args.inter_op_threads
+        )
+
+    runner_options = dict(batch_size=args.batch_size, batch_timeout=args.batch_timeout, queue_batches=args.queue_batches)
+    if args.batch:
+        runner = PipelineRunner(DataCleaner(), db_manager, detector, **runner_options)
+        runner.run_batch(stages)
+    else:
+        from scripts.telegram_scraper import TelegramScraper
+
+        scraper = TelegramScraper(
+            concurrency=args.concurrency, mode=args.mode, messages_per_run=args.limit,
+            media_workers=args.media_workers, media_store=media_store
+        )
+        runner = PipelineRunner(DataCleaner(input_path=scraper.csv_file), db_manager, detector, scraper, **runner_options)
+        asyncio.run(runner.run(rounds=args.rounds, interval=args.interval))
+    REGISTRY.dump_summary()
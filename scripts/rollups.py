@@ -0,0 +1,63 @@
+from scripts.columnar import NO_MEDIA
+from scripts.migrations import MEDIA_KEY_SQL
+
+# SQL maintaining the channel x day (x detected class) rollups created by migration 6, shared by
+# DatabaseManager.refresh_rollups and the API's write endpoints. The statements read the
+# channel-days to refresh from a `rollup_keys` relation (channel_username, message_day), a
+# temporary table for the loaders and a WITH clause for the API
+
+# Advisory lock held while the rollup tables are refreshed: concurrent refreshes (e.g. message and
+# detection loads of the pipeline) could otherwise both re-insert a channel-day after deleting it
+ROLLUP_LOCK_KEY = 20160
+ROLLUP_TABLES = ("channel_daily_rollup", "channel_daily_class_rollup")
+
+# Cleaned rows without media carry a placeholder instead of NULL
+HAS_MEDIA = f"m.media_path IS NOT NULL AND m.media_path <> '{NO_MEDIA}'"
+MEDIA_KEY = MEDIA_KEY_SQL.format(column="m.media_path")
+
+# Messages of a key, found through the (channel_username, message_date) index
+KEY_MESSAGES = """
+    FROM (SELECT DISTINCT channel_username, message_day FROM rollup_keys) k
+    JOIN telegram_messages m
+      ON m.channel_username = k.channel_username
+     AND m.message_date >= k.message_day
+     AND m.message_date < k.message_day + 1
+"""
+
+DELETE_STATEMENTS = [
+    f"""
+    DELETE FROM {table} r USING rollup_keys k
+    WHERE r.channel_username = k.channel_username AND r.message_day = k.message_day
+    """
+    for table in ROLLUP_TABLES
+]
+
+INSERT_STATEMENTS = [
+    f"""
+    INSERT INTO channel_daily_rollup (channel_username, message_day, channel_title, total_messages, total_media)
+    SELECT k.channel_username, k.message_day, MAX(m.channel_title), COUNT(*),
+           COUNT(*) FILTER (WHERE {HAS_MEDIA})
+    {KEY_MESSAGES}
+    GROUP BY k.channel_username, k.message_day
+    """,
+    f"""
+    INSERT INTO channel_daily_class_rollup
+        (channel_username, message_day, class_id, detections, images, confidence_sum)
+    SELECT k.channel_username, k.message_day, d.class_id,
+           COUNT(*), COUNT(DISTINCT d.image_name), SUM(d.confidence)
+    {KEY_MESSAGES}
+    JOIN detected_objects d ON {MEDIA_KEY_SQL.format(column="d.image_name")} = {MEDIA_KEY}
+    WHERE {HAS_MEDIA}
+    GROUP BY k.channel_username, k.message_day, d.class_id
+    """,
+]
+
+
+def image_keys_query(images):
+    """Channel-days of the messages whose media are the images of `images`, a relation aliased i with image_name."""
+    return f"""
+    SELECT DISTINCT m.channel_username, m.message_date::DATE
+    FROM {images}
+    JOIN telegram_messages m ON {MEDIA_KEY} = {MEDIA_KEY_SQL.format(column="i.image_name")}
+    WHERE m.message_date IS NOT NULL
+    """
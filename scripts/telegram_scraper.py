@@ -1,15 +1,67 @@
+import asyncio
 import logging
+import time
 from telethon import TelegramClient
+from telethon.errors import FloodWaitError
 import csv
 import os
 import json
+import sys
+from collections import namedtuple
 from dotenv import load_dotenv
 
+# Allow running as `python scripts/telegram_scraper.py` as well as importing from the project root
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), "..")))
+
+from scripts.columnar import ColumnarWriter
+from scripts.media_downloader import MediaDownloader
+from scripts.metrics import REGISTRY, row_log, stage_timer
+
+# Queued behind a channel's rows so the checkpoint is only saved once they are written
+Checkpoint = namedtuple("Checkpoint", ["channel_username", "state"])
+
+# Header of the raw CSV
+CSV_HEADER = ["Channel Title", "Channel Username", "ID", "Message", "Date", "Media Path"]
+
+MESSAGES_SCRAPED = REGISTRY.counter("scraper_messages_total", "Messages scraped, by channel.", ["channel"])
+CHANNEL_SECONDS = REGISTRY.histogram("scraper_channel_seconds", "Time to scrape one channel once.", ["channel"])
+
+
+class FloodWaitPolicy:
+    """Flood-wait and backoff state shared by all concurrent channel tasks."""
+
+    def __init__(self, max_retries=3, base_delay=1.0, max_delay=600.0):
+        self.max_retries = max_retries
+        self.base_delay = base_delay
+        self.max_delay = max_delay
+        self.resume_at = 0.0
+
+    async def wait(self):
+        """Sleep until any active flood wait has expired."""
+        delay = self.resume_at - time.monotonic()
+        if delay > 0:
+            await asyncio.sleep(delay)
+
+    def backoff(self, attempt, flood_seconds=0):
+        """Pause every task for the requested flood wait plus an exponential backoff."""
+        delay = min(self.max_delay, flood_seconds + self.base_delay * 2 ** attempt)
+        self.resume_at = max(self.resume_at, time.monotonic() + delay)
+        return delay
+
+
 class TelegramScraper:
-    def __init__(self, raw_data_dir="data/raw/", log_dir="logs/", channels_file="channels.json"):
+    def __init__(self, raw_data_dir="data/raw/", log_dir="logs/", channels_file="channels.json",
+                 concurrency=3, client=None, flood_policy=None, queue_size=1000,
+                 mode="forward", messages_per_run=100, checkpoint_every=50,
+                 media_workers=4, media_max_bytes=10 * 1024 * 1024, media_mime_prefixes=("image/",),
+                 output_format="csv", media_store=None):
         # Directories for raw data and logs
         self.raw_data_dir = raw_data_dir
         self.media_dir = os.path.join(self.raw_data_dir, "photos")
+        self.csv_file = os.path.join(self.raw_data_dir, "scraped_data.csv")
+        # "parquet" writes typed row groups to a dataset directory instead of the CSV
+        self.output_format = output_format
+        self.parquet_dir = os.path.join(self.raw_data_dir, "scraped_data.parquet")
         os.makedirs(self.raw_data_dir, exist_ok=True)
         os.makedirs(self.media_dir, exist_ok=True)
         os.makedirs(log_dir, exist_ok=True)
@@ -28,8 +80,24 @@ class TelegramScraper:
         self.phone = os.getenv("phone")
         self.session_name = os.getenv("SESSION_NAME")
 
-        # Initialize Telegram client
-        self.client = TelegramClient(self.session_name, self.api_id, self.api_hash)
+        # Initialize Telegram client (a stand-in such as FakeTelegramClient may be injected)
+        self.client = client or TelegramClient(self.session_name, self.api_id, self.api_hash)
+
+        # Channels are scraped concurrently, at most `concurrency` at a time
+        self.concurrency = concurrency
+        self.flood_policy = flood_policy or FloodWaitPolicy()
+        self.queue_size = queue_size
+
+        # "forward" fetches new messages, "backfill" fetches older history
+        self.mode = mode
+        self.messages_per_run = messages_per_run
+        self.checkpoint_every = checkpoint_every
+
+        # Media is downloaded by a worker pool so large files never stall message ingestion
+        self.media_downloader = MediaDownloader(
+            self.client, self.media_dir, workers=media_workers, max_bytes=media_max_bytes,
+            mime_prefixes=media_mime_prefixes, flood_policy=self.flood_policy, store=media_store
+        )
 
         # Load channels from JSON file
         self.channels_file = channels_file
@@ -48,50 +116,110 @@ class TelegramScraper:
             logging.error(f"Error decoding JSON file {self.channels_file}: {e}")
             return []
 
-    def get_last_processed_id(self, channel_username):
-        """Retrieve the last processed message ID for a channel."""
+    def open_csv(self):
+        """Open the raw CSV for appending, writing the header if the file is empty; returns (file, writer)."""
+        file = open(self.csv_file, "a", newline="", encoding="utf-8")
+        writer = csv.writer(file)
+        if os.stat(self.csv_file).st_size == 0:
+            writer.writerow(CSV_HEADER)
+            file.flush()
+        return file, writer
+
+    def open_output(self):
+        """Open the raw output in the configured format; returns (file, writer)."""
+        if self.output_format == "parquet":
+            writer = ColumnarWriter(self.parquet_dir)
+            return writer, writer
+        return self.open_csv()
+
+    def _checkpoint_path(self, channel_username):
+        return os.path.join(self.raw_data_dir, f"{channel_username}_last_id.json")
+
+    def get_checkpoint(self, channel_username):
+        """Retrieve the newest (last_id) and oldest (first_id) scraped message IDs for a channel."""
         try:
-            file_path = os.path.join(self.raw_data_dir, f"{channel_username}_last_id.json")
-            with open(file_path, "r") as f:
-                return json.load(f).get("last_id", 0)
+            with open(self._checkpoint_path(channel_username), "r") as f:
+                data = json.load(f)
         except FileNotFoundError:
             logging.warning(f"No last ID file found for {channel_username}. Starting from 0.")
-            return 0
+            return {"last_id": 0, "first_id": 0}
+
+        last_id = data.get("last_id", 0)
+        return {"last_id": last_id, "first_id": data.get("first_id", last_id)}
+
+    def save_checkpoint(self, channel_username, checkpoint):
+        """Atomically save the resume checkpoint for a channel."""
+        file_path = self._checkpoint_path(channel_username)
+        tmp_path = f"{file_path}.tmp"
+        with open(tmp_path, "w") as f:
+            json.dump(checkpoint, f)
+        os.replace(tmp_path, file_path)
+        logging.info(f"Saved checkpoint {checkpoint} for {channel_username}.")
+
+    def get_last_processed_id(self, channel_username):
+        """Retrieve the last processed message ID for a channel."""
+        return self.get_checkpoint(channel_username)["last_id"]
 
     def save_last_processed_id(self, channel_username, last_id):
         """Save the last processed message ID for a channel."""
-        file_path = os.path.join(self.raw_data_dir, f"{channel_username}_last_id.json")
-        with open(file_path, "w") as f:
-            json.dump({"last_id": last_id}, f)
-            logging.info(f"Saved last processed ID {last_id} for {channel_username}.")
+        checkpoint = self.get_checkpoint(channel_username)
+        checkpoint["last_id"] = last_id
+        self.save_checkpoint(channel_username, checkpoint)
 
-    async def scrape_channel(self, channel_username, writer):
-        """Scrape messages from a single Telegram channel."""
+    def _iter_new_messages(self, entity, checkpoint, newest_first, limit):
+        """Build the server-side bounded message iterator for a scrape direction."""
+        if newest_first:
+            # History older than the oldest scraped message, newest to oldest. On a first
+            # run first_id is 0, so this starts at the newest message; older history is
+            # left to backfill
+            return self.client.iter_messages(entity, limit=limit, offset_id=checkpoint["first_id"])
+        # Only messages newer than the checkpoint, oldest first so last_id only grows
+        return self.client.iter_messages(entity, limit=limit, min_id=checkpoint["last_id"], reverse=True)
+
+    async def scrape_channel(self, channel_username, rows, mode=None, progress=None):
+        """
+        Scrape messages from a single Telegram channel, queueing CSV rows on `rows`.
+
+        Resume bounds are sent to the server (min_id for forward, offset_id for
+        backfill) and a checkpoint is queued every `checkpoint_every` messages.
+        `progress` carries the in-memory checkpoint between attempts: a retry
+        after a flood wait resumes after the last queued message rather than
+        from the saved checkpoint, which lags the queue.
+        """
+        mode = mode or self.mode
+        progress = {} if progress is None else progress
+        message_count = 0
         try:
             entity = await self.client.get_entity(channel_username)
             channel_title = entity.title
 
-            last_id = self.get_last_processed_id(channel_username)
-            is_first_run = (last_id == 0)  # Check if this is the first run
-            message_count = 0
-
-            async for message in self.client.iter_messages(entity):
-                # Skip previously processed messages unless it's the first run
-                if not is_first_run and message.id <= last_id:
-                    continue
+            if not progress:
+                checkpoint = self.get_checkpoint(channel_username)
+                # Message IDs start at 1, so there is no history below first_id == 1; a channel
+                # without a checkpoint (first_id 0) is backfilled from its newest message
+                if mode == "backfill" and checkpoint["first_id"] == 1:
+                    logging.info(f"Nothing to backfill for {channel_username}.")
+                    return
+                progress.update(
+                    checkpoint=checkpoint,
+                    queued=dict(checkpoint),
+                    remaining=self.messages_per_run,
+                    newest_first=mode == "backfill" or not checkpoint["last_id"],
+                )
+            checkpoint = progress["checkpoint"]
+            if progress["remaining"] <= 0:
+                return
 
+            messages = self._iter_new_messages(entity, checkpoint, progress["newest_first"], progress["remaining"])
+            async for message in messages:
+                # The row is written now; the file arrives later at media_path
                 media_path = None
                 if message.media:
-                    filename = (
-                        f"{channel_username}_{message.id}.jpg"
-                        if not hasattr(message.media, "document")
-                        else f"{channel_username}_{message.id}.{message.media.document.mime_type.split('/')[-1]}"
-                    )
-                    media_path = os.path.join(self.media_dir, filename)
-                    await self.client.download_media(message.media, media_path)
-                    logging.info(f"Downloaded media for message ID {message.id}.")
+                    media_path = self.media_downloader.plan(channel_username, message)
+                    if media_path:
+                        await self.media_downloader.submit(message.media, media_path)
 
-                writer.writerow(
+                await rows.put(
                     [
                         channel_title,
                         channel_username,
@@ -101,48 +229,138 @@ class TelegramScraper:
                         media_path,
                     ]
                 )
-                logging.info(f"Processed message ID {message.id} from {channel_username}.")
+                row_log(channel_username, "Processed message ID %s from %s.", message.id, channel_username)
 
-                last_id = message.id
+                checkpoint["last_id"] = max(checkpoint["last_id"], message.id)
+                checkpoint["first_id"] = min(checkpoint["first_id"] or message.id, message.id)
+                progress["remaining"] -= 1
                 message_count += 1
 
-                # Stop after scraping 100 messages
-                if message_count >= 100:
-                    break
-
-            self.save_last_processed_id(channel_username, last_id)
+                if message_count % self.checkpoint_every == 0:
+                    await self._queue_checkpoint(channel_username, rows, progress)
+                # A flood wait hit by another channel pauses this one before its next request
+                await self.flood_policy.wait()
 
+            MESSAGES_SCRAPED.inc(message_count, channel=channel_username)
             if message_count == 0:
                 logging.info(f"No new messages found for {channel_username}.")
+            await self._queue_checkpoint(channel_username, rows, progress)
 
+        except FloodWaitError:
+            # Rows queued so far are covered by a checkpoint even if the retries give up;
+            # the flood wait itself is handled by the shared policy in _scrape_with_limits
+            MESSAGES_SCRAPED.inc(message_count, channel=channel_username)
+            await self._queue_checkpoint(channel_username, rows, progress)
+            raise
         except Exception as e:
             logging.error(f"Error while scraping {channel_username}: {e}")
 
+    @staticmethod
+    async def _queue_checkpoint(channel_username, rows, progress):
+        """Queue the in-memory checkpoint behind the rows if it moved since it was last queued."""
+        if progress and progress["checkpoint"] != progress["queued"]:
+            progress["queued"] = dict(progress["checkpoint"])
+            await rows.put(Checkpoint(channel_username, dict(progress["checkpoint"])))
+
+    async def _scrape_with_limits(self, channel_username, rows, semaphore):
+        """Scrape one channel under the concurrency limit, retrying after flood waits."""
+        async with semaphore:
+            # Shared by the attempts, so a retry resumes after the last queued message
+            progress = {}
+            for attempt in range(self.flood_policy.max_retries + 1):
+                await self.flood_policy.wait()
+                try:
+                    with CHANNEL_SECONDS.time(channel=channel_username):
+                        await self.scrape_channel(channel_username, rows, progress=progress)
+                    logging.info(f"Scraped data from {channel_username}.")
+                    return
+                except FloodWaitError as e:
+                    delay = self.flood_policy.backoff(attempt, e.seconds)
+                    logging.warning(
+                        f"Flood wait of {e.seconds}s while scraping {channel_username}; "
+                        f"pausing all channels for {delay:.0f}s."
+                    )
+            logging.error(f"Giving up on {channel_username} after {self.flood_policy.max_retries} retries.")
+
+    async def scrape_all(self, rows):
+        """Scrape every channel once, at most `concurrency` at a time, queueing rows and checkpoints on `rows`."""
+        semaphore = asyncio.Semaphore(self.concurrency)
+        await asyncio.gather(*(self._scrape_with_limits(channel, rows, semaphore) for channel in self.channels))
+
+    async def _write_rows(self, rows, file, writer, timer=None):
+        """
+        Single writer task: drain queued rows into the output until a None sentinel.
+
+        Checkpoints are saved only after the rows queued before them are flushed.
+        The CSV is flushed at every checkpoint; Parquet output holds checkpoints
+        back until a full row group is buffered, so files are not one per checkpoint.
+        """
+        held = []
+        while True:
+            item = await rows.get()
+            if item is None:
+                break
+            if isinstance(item, Checkpoint):
+                held.append(item)
+            else:
+                writer.writerow(item)
+                if timer:
+                    timer.add(1)
+            if held and getattr(file, "buffered", 0) >= getattr(file, "row_group_rows", 0):
+                file.flush()
+                for checkpoint in held:
+                    self.save_checkpoint(checkpoint.channel_username, checkpoint.state)
+                held = []
+        file.flush()
+        for checkpoint in held:
+            self.save_checkpoint(checkpoint.channel_username, checkpoint.state)
 
     async def run(self):
-        """Run the scraper for multiple channels."""
+        """Run the scraper for multiple channels concurrently."""
         try:
             await self.client.start(self.phone)
             logging.info("Telegram client started successfully.")
 
-            csv_file = os.path.join(self.raw_data_dir, "scraped_data.csv")
-            with open(csv_file, "a", newline="", encoding="utf-8") as file:
-                writer = csv.writer(file)
-                if os.stat(csv_file).st_size == 0:  # Write headers only if the file is empty
-                    writer.writerow(
-                        ["Channel Title", "Channel Username", "ID", "Message", "Date", "Media Path"]
-                    )
-
-                for channel in self.channels:
-                    await self.scrape_channel(channel, writer)
-                    logging.info(f"Scraped data from {channel}.")
+            file, writer = self.open_output()
+            with file, stage_timer("scrape") as timer:
+                # Channel tasks only enqueue rows; one writer task owns the file
+                rows = asyncio.Queue(maxsize=self.queue_size)
+                writer_task = asyncio.create_task(self._write_rows(rows, file, writer, timer))
+                await self.media_downloader.start()
+                try:
+                    await self.scrape_all(rows)
+                finally:
+                    await rows.put(None)
+                    await writer_task
+                    await self.media_downloader.close()
 
         except Exception as e:
             logging.error(f"Error in run function: {e}")
 
 # Main function
 if __name__ == "__main__":
-    import asyncio
+    import argparse
+
+    parser = argparse.ArgumentParser(description="Scrape Telegram channels listed in channels.json.")
+    parser.add_argument("--concurrency", type=int, default=3, help="Maximum channels scraped at once.")
+    parser.add_argument("--mode", choices=["forward", "backfill"], default="forward",
+                        help="Fetch new messages (forward) or older history (backfill).")
+    parser.add_argument("--limit", type=int, default=100, help="Maximum messages per channel per run.")
+    parser.add_argument("--media-workers", type=int, default=4, help="Concurrent media downloads.")
+    parser.add_argument("--format", choices=["csv", "parquet"], default="csv",
+                        help="Write raw rows to scraped_data.csv or to the scraped_data.parquet dataset.")
+    parser.add_argument("--media-store", default=None,
+                        help="Deduplicate downloaded media into this content-addressed store.")
+    args = parser.parse_args()
+
+    media_store = None
+    if args.media_store:
+        from scripts.media_store import MediaStore
 
-    scraper = TelegramScraper()
+        media_store = MediaStore(args.media_store)
+    scraper = TelegramScraper(
+        concurrency=args.concurrency, mode=args.mode, messages_per_run=args.limit,
+        media_workers=args.media_workers, output_format=args.format, media_store=media_store
+    )
     asyncio.run(scraper.run())
+    REGISTRY.dump_summary()
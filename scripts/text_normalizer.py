@@ -0,0 +1,114 @@
+import re
+import emoji
+import pandas as pd
+
+
+def _trie_pattern(node):
+    """ Render a character trie as a regex, longest sequences first. """
+    singles = []
+    branches = []
+    for char, child in sorted(node.items()):
+        if char == "":
+            continue
+        if list(child) == [""]:
+            singles.append(re.escape(char))
+        else:
+            branches.append(re.escape(char) + _trie_pattern(child))
+
+    if len(singles) == 1:
+        branches.append(singles[0])
+    elif singles:
+        branches.append("[" + "".join(singles) + "]")
+
+    pattern = branches[0] if len(branches) == 1 else "(?:" + "|".join(branches) + ")"
+    if "" in node:
+        # The sequence may also end here; the optional group stays greedy
+        pattern = "(?:" + pattern + ")?"
+    return pattern
+
+
+def _char_class(chars):
+    """ Render characters as a regex class, merging consecutive code points into ranges. """
+    codepoints = sorted(ord(char) for char in chars)
+    ranges = []
+    for codepoint in codepoints:
+        if ranges and codepoint == ranges[-1][1] + 1:
+            ranges[-1][1] = codepoint
+        else:
+            ranges.append([codepoint, codepoint])
+    return "[" + "".join(
+        re.escape(chr(low)) if low == high else re.escape(chr(low)) + "-" + re.escape(chr(high))
+        for low, high in ranges
+    ) + "]"
+
+
+def build_emoji_pattern(sequences=None):
+    """
+    Compile one regex matching every emoji sequence.
+
+    Sequences are merged into a trie so ZWJ sequences, skin tone modifiers and
+    flags match as a whole instead of one code point at a time. Two guards keep
+    the scan cheap on plain text: a lookahead rejects positions that cannot
+    start an emoji, and top-level branches are grouped by 256-code-point block
+    so only one block's alternatives are tried.
+    """
+    trie = {}
+    for sequence in (sequences if sequences is not None else emoji.EMOJI_DATA):
+        node = trie
+        for char in sequence:
+            node = node.setdefault(char, {})
+        node[""] = {}
+
+    blocks = {}
+    for char, child in trie.items():
+        blocks.setdefault(ord(char) >> 8, {})[char] = child
+
+    # Astral-plane starters collapse into a single range; the trie below is exact
+    first_chars = [char for char in trie if ord(char) < 0x10000]
+    astral = sorted(char for char in trie if ord(char) >= 0x10000)
+    guard = _char_class(first_chars)[:-1]
+    if astral:
+        guard += re.escape(astral[0]) + "-" + re.escape(astral[-1])
+    guard += "]"
+
+    branches = [
+        "(?=[" + re.escape(chr(block << 8)) + "-" + re.escape(chr((block << 8) + 255)) + "])" + _trie_pattern(subtrie)
+        for block, subtrie in sorted(blocks.items())
+    ]
+    return re.compile("(?=" + guard + ")(?:" + "|".join(branches) + ")")
+
+
+EMOJI_PATTERN = build_emoji_pattern()
+
+# Capturing variant: splitting on it alternates text and emoji segments
+EMOJI_SPLIT_PATTERN = re.compile("(" + EMOJI_PATTERN.pattern + ")")
+
+
+class TextNormalizer:
+    """ Single-pass message normalization: whitespace cleanup and emoji extraction. """
+
+    NEWLINES = re.compile(r"\n+")
+
+    def __init__(self, missing_text="No Message", missing_emoji="No emoji"):
+        self.missing_text = missing_text
+        self.missing_emoji = missing_emoji
+        self.emoji_pattern = EMOJI_PATTERN
+
+    def normalize(self, messages):
+        """
+        Normalize a Series of messages with vectorized string operations.
+
+        Returns a (message, emoji_used) pair of Series aligned with the input.
+        """
+        messages = (
+            messages.fillna(self.missing_text)
+            .astype(str)
+            .str.replace(self.NEWLINES, " ", regex=True)
+            .str.strip()
+        )
+        # One regex scan per message: even segments are text, odd ones emojis
+        segments = messages.str.split(EMOJI_SPLIT_PATTERN, regex=True)
+        cleaned = segments.str[::2].str.join("")
+        emojis = segments.str[1::2].str.join("")
+        emojis = emojis.where(emojis != "", self.missing_emoji)
+        return cleaned, emojis
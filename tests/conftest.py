@@ -0,0 +1,50 @@
+import os
+import sys
+import tempfile
+import uuid
+
+import pytest
+from sqlalchemy import create_engine, text
+from sqlalchemy.engine import make_url
+
+# The API modules read DATABASE_URL when first imported; a throwaway SQLite file stands in for
+# PostgreSQL (tests needing PostgreSQL itself build their own engines from TEST_DATABASE_URL)
+os.environ["DATABASE_URL"] = f"sqlite:///{os.path.join(tempfile.mkdtemp(prefix='api_test_'), 'api.sqlite')}"
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), "..", "my_project")))
+
+from scripts.database_setup import DatabaseManager
+
+
+@pytest.fixture
+def postgres_url():
+    """
+    URL of a throwaway, empty PostgreSQL database.
+
+    The database is created on the server of TEST_DATABASE_URL and dropped
+    afterwards; tests using it are skipped when the variable is not set.
+    """
+    server_url = os.getenv("TEST_DATABASE_URL")
+    if not server_url:
+        pytest.skip("TEST_DATABASE_URL is not set")
+    name = f"test_{uuid.uuid4().hex[:12]}"
+    server = create_engine(server_url, isolation_level="AUTOCOMMIT")
+    with server.connect() as connection:
+        connection.execute(text(f'CREATE DATABASE "{name}"'))
+    try:
+        yield make_url(server_url).set(database=name)
+    finally:
+        with server.connect() as connection:
+            connection.execute(text(f'DROP DATABASE IF EXISTS "{name}" WITH (FORCE)'))
+        server.dispose()
+
+
+@pytest.fixture
+def database(tmp_path, postgres_url):
+    """A DatabaseManager on a throwaway, migrated PostgreSQL database."""
+    manager = DatabaseManager(log_dir=str(tmp_path / "logs"), env_file=str(tmp_path / ".env"))
+    manager.engine = create_engine(postgres_url)
+    manager.migrate()
+    try:
+        yield manager
+    finally:
+        manager.engine.dispose()
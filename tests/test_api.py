@@ -0,0 +1,134 @@
+import asyncio
+import os
+from datetime import datetime, timedelta
+
+import pytest
+from fastapi.testclient import TestClient
+from sqlalchemy import create_engine
+
+import crud
+from database import session_scope
+from main import app
+from models import TelegramMessage
+
+ROWS = 200000
+CHANNELS = ["@CheMed123", "@lobelia4cosmetics", "@tikvahpharma", "@DoctorsET", "@EAHCI"]
+START_DATE = datetime(2023, 1, 1)
+
+
+@pytest.fixture(scope="module")
+def client():
+    with TestClient(app) as client:
+        # Seeded with a sync engine: one executemany per batch instead of API round trips
+        engine = create_engine(os.environ["DATABASE_URL"])
+        with engine.begin() as connection:
+            for start in range(0, ROWS, 50000):
+                connection.execute(TelegramMessage.__table__.insert(), [
+                    {
+                        "channel_title": "channel",
+                        "channel_username": CHANNELS[i % len(CHANNELS)],
+                        "message_id": i,
+                        "message": f"Message {i}",
+                        "message_date": START_DATE + timedelta(minutes=i),
+                    }
+                    for i in range(start, min(start + 50000, ROWS))
+                ])
+        engine.dispose()
+        yield client
+
+
+def page_cost(cursor, channel_username=None, limit=100):
+    """Rows of a keyset page and the SQLite VM instructions (in hundreds) it took."""
+    async def run():
+        async with session_scope() as db:
+            connection = (await (await db.connection()).get_raw_connection()).driver_connection
+            steps = []
+            await connection.set_progress_handler(lambda: steps.append(1), 100)
+            try:
+                rows = await crud.get_telegram_messages(
+                    db, limit=limit, cursor=cursor, channel_username=channel_username
+                )
+            finally:
+                await connection.set_progress_handler(None, 0)
+            return len(rows), len(steps)
+
+    return asyncio.run(run())
+
+
+@pytest.mark.parametrize("channel_username", [None, "@tikvahpharma"])
+def test_keyset_page_cost_does_not_grow_with_depth(client, channel_username):
+    rows, shallow = page_cost(None, channel_username)
+    assert rows == 100
+    for depth in (10000, 100000, ROWS - 1000):
+        rows, deep = page_cost(depth, channel_username)
+        assert rows == 100
+        # An OFFSET page takes about 20x the first page's instructions at depth 10000, 400x at the end
+        assert deep <= 2 * shallow, f"page at depth {depth} took {deep}00 instructions, the first one {shallow}00"
+
+
+def test_cursor_pages_cover_a_channel_once(client):
+    ids, params = [], {"limit": 1000, "channel_username": "@DoctorsET", "date_to": "2023-01-30"}
+    while True:
+        response = client.get("/telegram_messages", params=params)
+        assert response.status_code == 200
+        ids.extend(message["message_id"] for message in response.json())
+        if "X-Next-Cursor" not in response.headers:
+            break
+        params["cursor"] = response.headers["X-Next-Cursor"]
+
+    expected = [i for i in range(ROWS) if i % 5 == 3 and START_DATE + timedelta(minutes=i) < datetime(2023, 1, 30)]
+    assert ids == expected
+
+
+def test_search_fallback_ranks_filters_and_sees_new_messages(client):
+    messages = [
+        {"channel_title": "pharma", "channel_username": "@tikvahpharma", "message_id": ROWS + 1,
+         "message": "Paracetamol 500mg tablets in stock", "message_date": "2024-02-01T10:00:00"},
+        {"channel_title": "pharma", "channel_username": "@CheMed123", "message_id": ROWS + 2,
+         "message": "paracetamol, PARACETAMOL syrup", "message_date": "2024-02-02T10:00:00"},
+        {"channel_title": "pharma", "channel_username": "@CheMed123", "message_id": ROWS + 3,
+         "message": "Vitamin C tablets", "message_date": "2024-02-03T10:00:00"},
+    ]
+    for message in messages:
+        message.update(media_path=None, emoji_used=None, youtube_links=None)
+    response = client.post("/telegram_messages/batch", json=messages[:2])
+    assert response.json()["inserted"] == 2
+
+    hits = client.get("/search", params={"q": "paracetamol"}).json()
+    assert [hit["message_id"] for hit in hits] == [ROWS + 2, ROWS + 1]
+    assert hits[0]["rank"] > hits[1]["rank"]
+    # Every term must match; filters apply to the ranked hits
+    assert [hit["message_id"] for hit in client.get("/search", params={"q": "paracetamol tablets"}).json()] == [ROWS + 1]
+    assert client.get("/search", params={"q": "paracetamol", "channel_username": "@tikvahpharma"}).json()[0]["message_id"] == ROWS + 1
+    assert client.get("/search", params={"q": "ibuprofen"}).json() == []
+
+    # Rows stored after the index was built are added on the next search
+    client.post("/telegram_messages", json=messages[2])
+    hits = client.get("/search", params={"q": "tablets"}).json()
+    assert sorted(hit["message_id"] for hit in hits) == [ROWS + 1, ROWS + 3]
+    # The seeded rows were indexed too
+    assert [hit["message_id"] for hit in client.get("/search", params={"q": "message 12345"}).json()] == [12345]
+
+
+def test_response_cache_is_off_unless_redis_is_configured(monkeypatch):
+    from cache import LRUBackend, cache_from_env
+
+    monkeypatch.delenv("REDIS_URL", raising=False)
+    monkeypatch.delenv("CACHE_BACKEND", raising=False)
+    assert cache_from_env().backend is None
+    # A per-process cache only when asked for explicitly
+    monkeypatch.setenv("CACHE_BACKEND", "lru")
+    assert isinstance(cache_from_env().backend, LRUBackend)
+
+
+def test_search_fallback_serves_concurrent_requests_on_several_event_loops(client):
+    async def search(q):
+        async with session_scope() as db:
+            return [message.message_id for message, _ in await crud.search_telegram_messages(db, q)]
+
+    async def run():
+        return await asyncio.gather(search("message 12345"), search("message 54321"))
+
+    # Each asyncio.run is a new event loop; the API's own loop runs in the test client's thread
+    for _ in range(2):
+        assert asyncio.run(run()) == [[12345], [54321]]
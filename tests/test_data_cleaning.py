@@ -0,0 +1,79 @@
+import numpy as np
+import pandas as pd
+import pytest
+
+from scripts.data_cleaning import DataCleaner
+
+WORDS = ["paracetamol", "tablets", "vitamin", "syrup", "delivery", "addis", "ababa", "original", "imported",
+         "discount", "pharmacy", "stock", "call", "today", "free", "pack", "bottle", "order", "new", "price"]
+
+
+def raw_rows(count, seed=3):
+    """
+    Scraped rows: adverts and reposts of them with a changed price, a dropped
+    word or an added one, some messages empty, some IDs scraped again or missing.
+    """
+    rng = np.random.default_rng(seed)
+    messages, rows = [], []
+    for i in range(count):
+        if messages and rng.random() < 0.6:
+            text = messages[rng.integers(len(messages))].split()
+            edit = rng.integers(3)
+            if edit == 0:
+                text[-1] = str(rng.integers(10, 999))
+            elif edit == 1 and len(text) > 4:
+                del text[rng.integers(len(text))]
+            else:
+                text.insert(rng.integers(len(text)), str(rng.choice(WORDS)))
+        else:
+            text = list(rng.choice(WORDS, 10)) + [str(rng.integers(10, 999))]
+        messages.append(" ".join(text))
+        rows.append({
+            "Channel Title": " Shop ", "Channel Username": "@shop",
+            "ID": None if i in (5, 123) else (i - 6 if i % 9 == 8 else i + 1),
+            "Message": messages[-1] + (" 😀" if i % 7 == 0 else "") if i % 10 != 3 else None,
+            "Date": f"2024-03-{1 + i // 20:02d} {i % 20:02d}:00:00+00:00",
+            "Media Path": f"data/raw/photos/shop_{i}.jpg" if i % 4 == 0 else None,
+        })
+    return pd.DataFrame(rows)
+
+
+def clean(tmp_path, name, raw, **run):
+    raw.to_csv(tmp_path / f"{name}.csv", index=False)
+    cleaner = DataCleaner(str(tmp_path / f"{name}.csv"), str(tmp_path / name / "cleaned_data.csv"))
+    cleaner.run(**run)
+    return cleaner
+
+
+def cleaned(cleaner):
+    return pd.read_csv(cleaner.output_path)
+
+
+@pytest.fixture(autouse=True)
+def in_tmp_path(tmp_path, monkeypatch):
+    # DataCleaner writes its log under ./logs
+    monkeypatch.chdir(tmp_path)
+
+
+def test_streaming_matches_whole_file_cleaning(tmp_path):
+    raw = raw_rows(300)
+    whole = cleaned(clean(tmp_path, "whole", raw))
+    # Chunks of 7 rows put most repeated IDs and the two missing ones in different chunks
+    streamed = cleaned(clean(tmp_path, "streamed", raw, chunksize=7))
+    assert whole["message_id"].duplicated().sum() == 0 and whole["message_id"].isna().sum() == 1
+    assert len(whole) < len(raw)
+    pd.testing.assert_frame_equal(streamed, whole)
+
+
+def test_incremental_runs_match_one_full_run(tmp_path):
+    raw = raw_rows(300)
+    whole = cleaned(clean(tmp_path, "whole", raw))
+    assert whole["cluster_id"].nunique() < whole["cluster_id"].count()
+
+    cleaner = clean(tmp_path, "incremental", raw.iloc[:140], incremental=True, chunksize=50)
+    raw.iloc[140:].to_csv(cleaner.input_path, mode="a", header=False, index=False)
+    cleaner = DataCleaner(cleaner.input_path, cleaner.output_path)
+    cleaner.run(incremental=True, chunksize=50)
+    incremental = cleaned(cleaner)
+    pd.testing.assert_frame_equal(incremental, whole)
+    assert incremental["cluster_id"].equals(incremental["canonical_message_id"])
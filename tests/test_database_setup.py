@@ -0,0 +1,26 @@
+import pandas as pd
+from sqlalchemy import text
+
+
+def messages(rows):
+    return pd.DataFrame([
+        {
+            "channel_title": "Shop", "channel_username": "@shop", "message_id": message_id,
+            "message": "hello", "message_date": date, "media_path": None,
+            "emoji_used": "No emoji", "youtube_links": "No YouTube link",
+        }
+        for message_id, date in rows
+    ])
+
+
+def test_bulk_load_keeps_rows_without_message_id(database):
+    counts = database.bulk_insert_data(messages([
+        (1, "2024-03-01 09:00"),
+        (None, "2024-03-01 10:00"),
+        (1, "2024-03-01 11:00"),
+        (None, "2024-03-01 12:00"),
+    ]))
+    assert counts == {"inserted": 3, "skipped": 1}
+    with database.engine.connect() as connection:
+        rows = connection.execute(text("SELECT message_id, message_date::TEXT FROM telegram_messages ORDER BY id")).fetchall()
+    assert rows == [(1, "2024-03-01 09:00:00"), (None, "2024-03-01 10:00:00"), (None, "2024-03-01 12:00:00")]
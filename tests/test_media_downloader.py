@@ -0,0 +1,46 @@
+import asyncio
+import json
+import os
+from types import SimpleNamespace
+
+import pytest
+
+from scripts.fake_telegram_client import FakeTelegramClient
+from scripts.media_downloader import MediaDownloader
+
+
+def photo(message_id, size=1000):
+    return SimpleNamespace(photo=SimpleNamespace(id=message_id), size=size)
+
+
+def test_downloader_built_outside_the_event_loop(tmp_path):
+    # Built before asyncio.run, as TelegramScraper does: on Python 3.9 a queue
+    # created here would belong to another loop than the workers
+    downloader = MediaDownloader(FakeTelegramClient({}, latency=0), str(tmp_path), workers=2, queue_size=1)
+    paths = [str(tmp_path / f"channel_{i}.jpg") for i in range(5)]
+
+    async def run():
+        await downloader.start()
+        for i, path in enumerate(paths):
+            await downloader.submit(photo(i), path)
+        await downloader.close()
+
+    asyncio.run(run())
+    # A second run gets a fresh queue in its own loop
+    asyncio.run(run())
+
+    assert all(os.path.getsize(path) == 1000 for path in paths)
+    assert downloader.completed == set(paths)
+    with open(tmp_path / "manifest.jsonl") as f:
+        entries = [json.loads(line) for line in f]
+    assert sorted(entry["path"] for entry in entries) == sorted(paths)
+
+
+def test_submit_requires_start(tmp_path):
+    downloader = MediaDownloader(FakeTelegramClient({}, latency=0), str(tmp_path))
+
+    async def submit():
+        await downloader.submit(photo(1), str(tmp_path / "channel_1.jpg"))
+
+    with pytest.raises(RuntimeError, match=r"start\(\)"):
+        asyncio.run(submit())
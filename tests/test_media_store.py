@@ -0,0 +1,109 @@
+import os
+import subprocess
+import sys
+
+import numpy as np
+import pandas as pd
+import pytest
+from PIL import Image
+
+from scripts.columnar import NO_MEDIA
+from scripts.detection_cache import DetectionCache
+from scripts.media_store import EXIF_ORIENTATION, MediaStore, referenced_media_paths
+
+ROOT = os.path.abspath(os.path.join(os.path.dirname(__file__), ".."))
+
+
+def image(path, color):
+    Image.new("RGB", (64, 48), color).save(path, "JPEG")
+    return str(path)
+
+
+def sideways_photo(path):
+    """A 64x48 JPEG whose EXIF says to turn it a quarter clockwise: upright it is 48x64, red on top."""
+    photo = Image.new("RGB", (64, 48), "blue")
+    photo.paste("red", (0, 0, 32, 48))
+    exif = Image.Exif()
+    exif[EXIF_ORIENTATION] = 6
+    photo.save(path, "JPEG", exif=exif)
+    return str(path)
+
+
+def assert_upright(pixels):
+    height, width, _ = pixels.shape
+    assert height > width
+    assert pixels[height // 4, width // 2, 0] > 200 and pixels[3 * height // 4, width // 2, 2] > 200
+
+
+def test_gc_keeps_media_of_rows_not_cleaned_yet(tmp_path):
+    photos = tmp_path / "photos"
+    photos.mkdir()
+    cleaned_row = image(photos / "shop_1.jpg", "red")
+    new_row = image(photos / "shop_2.jpg", "blue")
+    dropped_row = image(photos / "shop_3.jpg", "green")
+    store = MediaStore(str(tmp_path / "store"))
+    for path in (cleaned_row, new_row, dropped_row):
+        store.ingest(path)
+
+    # The scraper has written shop_2 since the last cleaning run; shop_3 was pruned from the raw data
+    raw = tmp_path / "scraped_data.csv"
+    pd.DataFrame({"ID": [1, 2, 4], "Media Path": [cleaned_row, new_row, None]}).to_csv(raw, index=False)
+    cleaned = tmp_path / "cleaned_data.csv"
+    pd.DataFrame({"message_id": [1, 4], "media_path": [cleaned_row, NO_MEDIA]}).to_csv(cleaned, index=False)
+
+    assert referenced_media_paths(str(raw), raw=True) == {cleaned_row, new_row}
+    assert referenced_media_paths(str(cleaned)) == {cleaned_row}
+
+    referenced = referenced_media_paths(str(raw), raw=True) | referenced_media_paths(str(cleaned))
+    assert store.release_unreferenced(referenced) == 1
+    assert store.gc()[0] == 1
+    assert os.path.exists(cleaned_row) and os.path.exists(new_row) and not os.path.exists(dropped_row)
+    assert set(store.lookup([cleaned_row, new_row, dropped_row])) == {cleaned_row, new_row}
+    store.close()
+
+
+def test_gc_refuses_cleaned_data_alone(tmp_path):
+    cleaned = tmp_path / "cleaned_data.csv"
+    pd.DataFrame({"media_path": [NO_MEDIA]}).to_csv(cleaned, index=False)
+    result = subprocess.run(
+        [sys.executable, os.path.join(ROOT, "scripts", "media_store.py"), "gc",
+         "--store", str(tmp_path / "store"), "--cleaned", str(cleaned)],
+        cwd=tmp_path, capture_output=True, text=True,
+    )
+    assert result.returncode == 2
+    assert "--cleaned requires --raw" in result.stderr
+
+
+def test_thumbnail_detections_have_their_own_cache_key(tmp_path):
+    store = MediaStore(str(tmp_path / "store"), thumb_size=320, thumb_quality=80)
+    original = DetectionCache.model_key("yolov5s", 0.25, 0.45, 640)
+    thumbnail = DetectionCache.model_key("yolov5s", 0.25, 0.45, 640, source=store.thumb_key)
+    assert original != thumbnail
+    assert thumbnail.endswith("|source=thumb320q80")
+
+    cache = DetectionCache(str(tmp_path / "cache.sqlite"))
+    cache.put_many([("abc", [[0, 0, 10, 10, 0.9, 0]])], thumbnail)
+    assert cache.get_many(["abc"], original) == {}
+    assert list(cache.get_many(["abc"], thumbnail)) == ["abc"]
+    cache.close()
+    store.close()
+
+
+def test_thumbnails_of_sideways_photos_are_upright(tmp_path):
+    store = MediaStore(str(tmp_path / "store"))
+    path = sideways_photo(tmp_path / "shop_1.jpg")
+    store.ingest(path)
+    _, thumb, width = store.lookup([path])[path]
+    assert width == 48
+    with Image.open(thumb) as image:
+        assert_upright(np.asarray(image))
+    store.close()
+
+
+def test_detector_input_of_sideways_photos_is_upright(tmp_path):
+    pytest.importorskip("yolov5")
+    from scripts.object_detection import YOLOObjectDetection
+
+    pixels, scale = YOLOObjectDetection.load_image(sideways_photo(tmp_path / "shop_1.jpg"), 32)
+    assert pixels.shape == (32, 24, 3) and scale == 0.5
+    assert_upright(pixels)
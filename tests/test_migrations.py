@@ -0,0 +1,19 @@
+from sqlalchemy import text
+
+from database import Base
+import models  # noqa: F401 (registers the tables on Base.metadata)
+
+
+def test_migrations_create_the_indexes_declared_on_the_models(database):
+    # The models' indexes are only created by create_all on SQLite; PostgreSQL gets them from the migrations
+    declared = {
+        index.name
+        for table in Base.metadata.tables.values()
+        for index in table.indexes
+        if [column.name for column in index.columns] != ["id"]
+    }
+    assert {"ix_telegram_messages_message_date_id", "ix_detected_objects_class_id_id"} <= declared
+
+    with database.engine.connect() as connection:
+        existing = set(connection.execute(text("SELECT indexname FROM pg_indexes WHERE schemaname = 'public'")).scalars())
+    assert declared <= existing
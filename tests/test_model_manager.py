@@ -0,0 +1,20 @@
+import os
+import subprocess
+import sys
+
+import pytest
+
+ROOT = os.path.abspath(os.path.join(os.path.dirname(__file__), ".."))
+
+
+@pytest.mark.parametrize("cache", ["missing", "empty"])
+def test_list_uses_the_default_cache_dir(tmp_path, cache):
+    pytest.importorskip("yolov5")
+    if cache == "empty":
+        (tmp_path / "models").mkdir()
+    result = subprocess.run(
+        [sys.executable, os.path.join(ROOT, "scripts", "model_manager.py"), "list"],
+        cwd=tmp_path, capture_output=True, text=True, env={**os.environ, "MODEL_CACHE": str(tmp_path / "models")},
+    )
+    assert result.returncode == 0, result.stderr
+    assert result.stdout == ""
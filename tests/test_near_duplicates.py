@@ -0,0 +1,67 @@
+import numpy as np
+import pandas as pd
+
+from scripts.near_duplicates import NearDuplicateIndex
+
+MESSAGES = pd.DataFrame({
+    "message_id": [101, 102, 103, 104, 105, 106],
+    "message": [
+        "Paracetamol 500mg tablets available today call 0911 for delivery in Addis",
+        "Vitamin C 1000mg imported original pack discount at our pharmacy",
+        "Paracetamol 500mg tablets available today call 0911 for delivery in Addis Ababa",
+        "No Message",
+        "Vitamin C 1000mg imported original pack discount at our pharmacy!",
+        "Omeprazole capsules new stock free delivery order now",
+    ],
+})
+
+
+def test_cluster_ids_are_canonical_message_ids_and_survive_rebuilds(tmp_path):
+    tagged = NearDuplicateIndex().tag(MESSAGES)
+    assert tagged["cluster_id"].tolist() == [101, 102, 101, 104, 102, 106]
+    assert tagged["cluster_id"].tolist() == tagged["canonical_message_id"].tolist()
+
+    # A rebuilt index fed the rows in other batches, reloaded in between, tags them the same
+    index = NearDuplicateIndex()
+    index.tag(MESSAGES.iloc[:2], "message_id", "message")
+    index.save(str(tmp_path / "index.npz"))
+    index = NearDuplicateIndex.load(str(tmp_path / "index.npz"))
+    cluster_ids, _ = index.assign(MESSAGES["message_id"], MESSAGES["message"], batch_size=1)
+    assert cluster_ids.tolist() == tagged["cluster_id"].tolist()
+
+
+def test_unrelated_clusters_of_separate_indexes_do_not_collide():
+    # Each run of a fresh index used to number its clusters from 0
+    first, _ = NearDuplicateIndex().assign(MESSAGES["message_id"][:2], MESSAGES["message"][:2])
+    second, _ = NearDuplicateIndex().assign(MESSAGES["message_id"][5:], MESSAGES["message"][5:])
+    assert set(first).isdisjoint(second)
+
+
+def reposts(rows=600, seed=7):
+    """Adverts and reposts of them with a changed price, a dropped word or an added one."""
+    rng = np.random.default_rng(seed)
+    words = ["paracetamol", "tablets", "vitamin", "syrup", "delivery", "addis", "ababa", "original", "imported",
+             "discount", "pharmacy", "stock", "call", "today", "free", "pack", "bottle", "order", "new", "price"]
+    messages = []
+    for _ in range(rows):
+        if messages and rng.random() < 0.6:
+            text = messages[rng.integers(len(messages))].split()
+            edit = rng.integers(3)
+            if edit == 0:
+                text[-1] = str(rng.integers(10, 999))
+            elif edit == 1 and len(text) > 4:
+                del text[rng.integers(len(text))]
+            else:
+                text.insert(rng.integers(len(text)), str(rng.choice(words)))
+        else:
+            text = list(rng.choice(words, 10)) + [str(rng.integers(10, 999))]
+        messages.append(" ".join(text))
+    return pd.Series(range(1, rows + 1)), pd.Series(messages)
+
+
+def test_clusters_do_not_depend_on_batch_size():
+    message_ids, messages = reposts()
+    expected, _ = NearDuplicateIndex().assign(message_ids, messages)
+    assert expected.nunique() < len(messages) * 0.8
+    for batch_size in (97, 10, 1):
+        assert NearDuplicateIndex().assign(message_ids, messages, batch_size=batch_size)[0].tolist() == expected.tolist()
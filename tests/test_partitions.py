@@ -0,0 +1,76 @@
+import asyncio
+from datetime import date, datetime
+
+import pandas as pd
+from sqlalchemy import create_engine, text
+from sqlalchemy.ext.asyncio import AsyncSession, create_async_engine
+
+import crud
+from database import async_url, known_partition_months, prepare_schema
+from schemas import TelegramMessageCreate
+from scripts import migrations
+
+
+def message(message_id, message_date):
+    return TelegramMessageCreate(
+        channel_title="Shop", channel_username="@shop", message_id=message_id, message="hello",
+        message_date=message_date, media_path=None, emoji_used=None, youtube_links=None,
+    )
+
+
+def partition_rows(url):
+    """{partition name: rows} of telegram_messages."""
+    engine = create_engine(url)
+    with engine.connect() as connection:
+        rows = connection.execute(text(
+            "SELECT tableoid::regclass::TEXT, COUNT(*) FROM telegram_messages GROUP BY 1"
+        )).fetchall()
+    engine.dispose()
+    return dict(rows)
+
+
+def test_api_startup_migrates_and_writes_create_their_partitions(postgres_url):
+    known_partition_months.clear()
+
+    async def run():
+        engine = create_async_engine(async_url(postgres_url))
+        try:
+            await prepare_schema(engine)
+            async with engine.connect() as connection:
+                assert await connection.run_sync(migrations.is_partitioned)
+                partitions = await connection.run_sync(migrations.list_month_partitions)
+            assert set(migrations.upcoming_months()) <= set(partitions)
+
+            # A second worker starting up finds nothing to do
+            await prepare_schema(engine)
+
+            # The analytics rollups exist before any loader has run
+            async with AsyncSession(engine) as db:
+                assert await crud.get_channel_summary(db) == []
+                assert await crud.get_top_classes(db) == []
+
+            async with AsyncSession(engine) as db:
+                await crud.create_telegram_message(db, message(1, datetime(2031, 5, 3, 12)))
+                inserted = await crud.insert_telegram_messages(
+                    db, [message(2, datetime(2031, 6, 1)), message(3, None), message(1, datetime(2031, 5, 4))]
+                )
+                await db.commit()
+            assert inserted == 2
+        finally:
+            await engine.dispose()
+
+    asyncio.run(run())
+    assert partition_rows(postgres_url) == {
+        migrations.partition_name(date(2031, 5, 1)): 1,
+        migrations.partition_name(date(2031, 6, 1)): 1,
+        migrations.DEFAULT_PARTITION: 1,
+    }
+
+
+def test_row_by_row_insert_creates_partitions(database):
+    df = pd.DataFrame([{
+        "channel_title": "Shop", "channel_username": "@shop", "message_id": 1, "message": "hello",
+        "message_date": "2032-02-10 08:00:00", "media_path": None, "emoji_used": None, "youtube_links": None,
+    }])
+    database.insert_data(df)
+    assert partition_rows(database.engine.url) == {migrations.partition_name(date(2032, 2, 1)): 1}
@@ -0,0 +1,101 @@
+import asyncio
+from datetime import datetime
+
+import pandas as pd
+from sqlalchemy import text
+from sqlalchemy.ext.asyncio import AsyncSession, create_async_engine
+
+import crud
+from database import async_url, prepare_schema
+from schemas import DetectedObjectCreate, TelegramMessageCreate
+from scripts.columnar import NO_MEDIA
+
+
+def messages(rows):
+    return pd.DataFrame([
+        {
+            "channel_title": "Shop", "channel_username": "@shop", "message_id": message_id,
+            "message": "hello", "message_date": date, "media_path": media_path,
+            "emoji_used": "No emoji", "youtube_links": "No YouTube link",
+        }
+        for message_id, date, media_path in rows
+    ])
+
+
+def rollup(database, table, columns):
+    with database.engine.connect() as connection:
+        return connection.execute(text(f"SELECT {columns} FROM {table} ORDER BY 1, 2")).fetchall()
+
+
+def test_rollup_counts_only_real_media(database):
+    database.bulk_insert_data(messages([
+        (1, "2024-03-01 09:00", "data/raw/photos/shop_1.jpg"),
+        (2, "2024-03-01 10:00", NO_MEDIA),
+        (3, "2024-03-01 11:00", None),
+        (4, "2024-03-01 12:00", "data/raw/photos/shop_4.jpg"),
+        (5, "2024-03-02 09:00", NO_MEDIA),
+    ]))
+
+    assert rollup(database, "channel_daily_rollup", "message_day::TEXT, total_messages, total_media") == [
+        ("2024-03-01", 4, 2),
+        ("2024-03-02", 1, 0),
+    ]
+
+    # A detection whose image name matches the placeholder's key is not joined to media-less rows
+    database.bulk_insert_detection_results(pd.DataFrame([
+        {"image_name": "shop_1.jpg", "class_id": 0, "x_center": 0.5, "y_center": 0.5,
+         "width": 0.1, "height": 0.1, "confidence": 0.9},
+        {"image_name": NO_MEDIA, "class_id": 1, "x_center": 0.5, "y_center": 0.5,
+         "width": 0.1, "height": 0.1, "confidence": 0.8},
+    ]))
+
+    assert rollup(database, "channel_daily_class_rollup", "message_day::TEXT, class_id, detections, images") == [
+        ("2024-03-01", 0, 1, 1),
+    ]
+    # A rebuild gives the same counts as the incremental refreshes
+    database.refresh_rollups()
+    assert rollup(database, "channel_daily_rollup", "message_day::TEXT, total_messages, total_media") == [
+        ("2024-03-01", 4, 2),
+        ("2024-03-02", 1, 0),
+    ]
+
+
+def test_api_writes_refresh_the_rollups(postgres_url):
+    def message(message_id, day, media_path):
+        return TelegramMessageCreate(
+            channel_title="Shop", channel_username="@shop", message_id=message_id, message="hello",
+            message_date=datetime(2024, 3, day, 9), media_path=media_path, emoji_used=None, youtube_links=None,
+        )
+
+    def detection(image_name, class_id):
+        return DetectedObjectCreate(
+            image_name=image_name, class_id=class_id, x_center=0.5, y_center=0.5,
+            width=0.1, height=0.1, confidence=0.9, detection_timestamp=None,
+        )
+
+    async def run():
+        engine = create_async_engine(async_url(postgres_url))
+        try:
+            await prepare_schema(engine)
+            async with AsyncSession(engine) as db:
+                # The single-row writes are on a day of their own, refreshed by nothing else
+                await crud.create_telegram_message(db, message(1, 2, "data/raw/photos/shop_1.jpg"))
+                batch = [message(2, 1, NO_MEDIA), message(3, 1, "data/raw/photos/shop_3.jpg")]
+                await crud.insert_telegram_messages(db, batch)
+                await crud.refresh_message_rollups(db, {crud.message_rollup_key(m) for m in batch})
+                await db.commit()
+
+                await crud.create_detected_object(db, detection("shop_1.jpg", 0))
+                await crud.insert_detected_objects(db, [detection("shop_3.jpg", 0), detection("shop_3.jpg", 2)])
+                await crud.refresh_detection_rollups(db, {"shop_3.jpg"})
+                await db.commit()
+
+                summary = await crud.get_channel_summary(db)
+                classes = await crud.get_top_classes(db)
+            return summary, classes
+        finally:
+            await engine.dispose()
+
+    summary, classes = asyncio.run(run())
+    assert [(row["days"], row["total_messages"], row["total_media"]) for row in summary] == [(2, 3, 2)]
+    assert [(row["class_id"], row["detections"]) for row in classes] == [(0, 2), (2, 1)]
@@ -0,0 +1,114 @@
+import asyncio
+import csv
+import json
+import os
+import time
+from collections import Counter
+
+import pytest
+
+from scripts.fake_telegram_client import FakeTelegramClient
+from scripts.telegram_scraper import FloodWaitPolicy, TelegramScraper
+
+CHANNELS = {"@alpha": 120, "@beta": 80, "@gamma": 50}
+
+
+class RecordingClient(FakeTelegramClient):
+    """ Records when each message is handed to the scraper. """
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.fetched = []
+
+    async def iter_messages(self, entity, *args, **kwargs):
+        async for message in super().iter_messages(entity, *args, **kwargs):
+            self.fetched.append((time.monotonic(), entity.username, message.id))
+            yield message
+
+
+def make_scraper(tmp_path, client, **options):
+    channels_file = tmp_path / "channels.json"
+    channels_file.write_text(json.dumps({"channels": list(client.channels)}))
+    return TelegramScraper(
+        raw_data_dir=str(tmp_path / "raw"), log_dir=str(tmp_path / "logs"), channels_file=str(channels_file),
+        client=client, flood_policy=FloodWaitPolicy(base_delay=0.01), **options
+    )
+
+
+def scraped_rows(tmp_path):
+    with open(tmp_path / "raw" / "scraped_data.csv", newline="", encoding="utf-8") as f:
+        return list(csv.DictReader(f))
+
+
+def checkpoint(tmp_path, channel_username):
+    with open(tmp_path / "raw" / f"{channel_username}_last_id.json") as f:
+        return json.load(f)
+
+
+def test_scheduler_scrapes_every_channel_once_through_a_flood_wait(tmp_path):
+    client = FakeTelegramClient(dict(CHANNELS), latency=0, page_size=20, media_size=100, flood_waits={"@beta": 0})
+    scraper = make_scraper(tmp_path, client, concurrency=2, messages_per_run=200, checkpoint_every=25)
+    asyncio.run(scraper.run())
+    assert client.flood_waits == {}
+
+    rows = scraped_rows(tmp_path)
+    counts = Counter((row["Channel Username"], int(row["ID"])) for row in rows)
+    assert set(counts.values()) == {1}
+    for channel_username, messages in CHANNELS.items():
+        assert {i for channel, i in counts if channel == channel_username} == set(range(1, messages + 1))
+        assert checkpoint(tmp_path, channel_username) == {"last_id": messages, "first_id": 1}
+
+    # Photos are downloaded (every third message; every sixth is a video and skipped)
+    media = {row["Media Path"] for row in rows if row["Media Path"]}
+    assert len(media) == sum(len(range(3, n + 1, 6)) for n in CHANNELS.values())
+    assert all(os.path.getsize(path) == 100 for path in media)
+
+
+def test_forward_run_fetches_only_new_messages(tmp_path):
+    client = FakeTelegramClient(dict(CHANNELS), latency=0, media_every=0)
+    scraper = make_scraper(tmp_path, client, concurrency=3, messages_per_run=200)
+    asyncio.run(scraper.run())
+
+    client.channels["@alpha"] += 7
+    asyncio.run(make_scraper(tmp_path, client, concurrency=3, messages_per_run=200).run())
+
+    rows = scraped_rows(tmp_path)
+    assert len(rows) == sum(CHANNELS.values()) + 7
+    assert [int(row["ID"]) for row in rows[-7:]] == list(range(121, 128))
+    assert checkpoint(tmp_path, "@alpha")["last_id"] == 127
+
+
+def test_backfill_of_a_new_channel_pages_down_from_the_newest_message(tmp_path):
+    client = FakeTelegramClient({"@alpha": 50}, latency=0, media_every=0)
+    for scraped_ids, first_id in ((range(21, 51), 21), (range(1, 51), 1), (range(1, 51), 1)):
+        asyncio.run(make_scraper(tmp_path, client, mode="backfill", messages_per_run=30).run())
+        assert sorted(int(row["ID"]) for row in scraped_rows(tmp_path)) == list(scraped_ids)
+        assert checkpoint(tmp_path, "@alpha") == {"last_id": 50, "first_id": first_id}
+
+
+@pytest.mark.parametrize("mode", ["forward", "backfill"])
+def test_flood_wait_mid_channel_pauses_every_channel_and_resumes_without_duplicates(tmp_path, mode):
+    # @alpha hits a 1s flood wait on its third page, after 40 messages and a checkpoint at 25
+    size = 120 if mode == "forward" else 240
+    client = RecordingClient(
+        {"@alpha": size, "@beta": size, "@gamma": size}, latency=0.005, page_size=20, media_every=0,
+        flood_waits={"@alpha": 1}, flood_after=40,
+    )
+    scraper = make_scraper(tmp_path, client, concurrency=3, mode=mode, messages_per_run=120, checkpoint_every=25)
+    if mode == "backfill":
+        # Messages 121-240 were scraped before; backfill fetches 120 down to 1
+        for channel_username in client.channels:
+            scraper.save_checkpoint(channel_username, {"last_id": 240, "first_id": 121})
+    asyncio.run(scraper.run())
+    assert client.flood_waits == {}
+
+    counts = Counter((row["Channel Username"], int(row["ID"])) for row in scraped_rows(tmp_path))
+    assert set(counts.values()) == {1}
+    for channel_username in client.channels:
+        assert {i for channel, i in counts if channel == channel_username} == set(range(1, 121))
+        assert checkpoint(tmp_path, channel_username) == {"last_id": size, "first_id": 1}
+
+    # The other channels stopped fetching for the flood wait too, mid-channel
+    for channel_username in ("@beta", "@gamma"):
+        times = [t for t, channel, _ in client.fetched if channel == channel_username]
+        assert max(later - earlier for earlier, later in zip(times, times[1:])) >= 0.9